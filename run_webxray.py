@@ -45,6 +45,16 @@ browser_type = 'chrome'
 #	when using chrome a wait time below 30 seconds often results in lost cookies and is NOT RECCOMENDED!
 browser_wait = 30
 
+# PERFORMANCE: ENDING THE WAIT EARLY
+#	many pages stop making requests long before browser_wait is up, if 
+#	 'network_idle_seconds' is set chrome stops waiting once no requests have
+#	 been in flight for that many seconds, browser_wait is then the longest 
+#	 we will wait on a page
+#
+#	the time actually waited is stored in 'page.browser_wait_used', the default
+#	 of None always waits the full browser_wait
+network_idle_seconds = None
+
 # PERFORMANCE: RUNNING PARALLEL BROWSING ENGINES
 #	'pool_size' sets how many browser processes get run in parallel, 
 #	by default it is set to 1 so no parallel processes are run
@@ -55,6 +65,107 @@ browser_wait = 30
 #		of available cores, but proceed with caution
 pool_size = 4
 
+# PERFORMANCE: MANY PAGES PER PROCESS
+#	most of the time a browser process spends on a page is waiting out browser_wait,
+#	 setting 'pages_per_worker' above 1 has each of the 'pool_size' processes load
+#	 that many pages at once (each with its own chrome) so the waits overlap
+#
+#	'max_concurrent_pages' caps the pages loading at once across all processes,
+#	 None allows pool_size*pages_per_worker
+#
+#	'worker_memory_limit_mb' holds back new pages while a process (and, if the
+#	 psutil package is installed, its browsers) uses more memory than this, None
+#	 means no limit
+pages_per_worker		= 1
+max_concurrent_pages	= None
+worker_memory_limit_mb	= None
+
+# POLITENESS
+#	page lists with many pages on one site could otherwise have every browser
+#	 loading from it at once, which may get us rate limited and the pages fail
+#
+#	'max_pages_per_domain' is the most pages on one registrable domain (eg 
+#	 'example.com' covers 'www.example.com' and 'news.example.com') which are
+#	 loaded at once, pages from different sites are interleaved, None means no limit
+#	 and is the default, 2 is a reasonable limit for lists with many pages per site
+max_pages_per_domain	= None
+
+# IP ADDRESS RESOLUTION
+#	by default the ip address of every domain is looked up as pages are stored,
+#	 on large collections where you don't need 'domain.ip_addr' this network
+#	 latency can be removed from collection by changing the policy
+#
+#	ip_resolution can be:
+#		'resolve':	look up ip addresses during collection (default)
+#		'skip': 	never look up ip addresses
+#		'defer':	leave ip addresses empty during collection and look them all up
+#					in bulk once the collection is done, you may also run this later
+#					with 'run_webxray.py -r [DB_NAME]'
+ip_resolution = 'resolve'
+
+# PERFORMANCE: REUSING BROWSERS
+#	starting up chrome takes a few seconds, so rather than start a new browser
+#	 for every page each of the 'pool_size' processes keeps one open and wipes
+#	 its cookies, cache, and storage between pages
+#
+#	'browser_max_pages' is how many pages a browser loads before it is replaced
+#	 with a fresh one, setting it to 1 starts a brand new browser for every page
+#	 which guarantees a clean profile at the cost of speed and is the default,
+#	 something like 50 is much faster on large lists
+browser_max_pages = 1
+
+# PERFORMANCE: STREAMING NETWORK EVENTS
+#	by default chrome keeps a log of every network event while the page loads
+#	 which webxray reads through once browser_wait is over, on heavy pages this
+#	 log is large and may be cut short
+#
+#	setting 'stream_network_events' to True reads the events from chrome's
+#	 DevTools websocket as they happen instead, this requires the websocket-client
+#	 package ('pip3 install websocket-client'), without it the log is used
+stream_network_events = False
+
+# PERFORMANCE: SINGLE DATABASE WRITER
+#	by default each browser process writes its own results to the database,
+#	 with a large pool_size this can lead to processes waiting on each other
+#	 (especially with sqlite, which only allows one writer at a time)
+#
+#	setting 'ingest_writer' to True has the browser processes pass their results
+#	 to a single process which writes them to the database in batches
+#
+#	'ingest_queue_depth' is how many pages may be waiting to be written before
+#	 the browser processes pause, 'ingest_batch_size' is how many pages are
+#	 written per transaction
+ingest_writer		= False
+ingest_queue_depth	= 100
+ingest_batch_size	= 50
+
+# RESUMING AND RETRYING
+#	every collection keeps a journal of which pages are in flight, done, or failed
+#	 in './webxray/resources/journal', so if a collection is stopped running it
+#	 again on the same database and page list picks up where it left off, the
+#	 journal goes with the database so a new database of the same name starts over
+#
+#	a page which fails is tried again up to 'max_attempts' times in total, first 
+#	 after 'retry_backoff_seconds' and then waiting twice as long each time
+max_attempts			= 3
+retry_backoff_seconds	= 60
+
+# PERFORMANCE: COLLECTING ON MANY NODES
+#	a big collection may be split over any number of machines sharing one mysql
+#	 or postgres database (or processes sharing one sqlite file), first put the
+#	 page list on the work queue in the db with
+#
+#		'run_webxray.py -e [DB_NAME] [PAGE_FILE_NAME]'
+#
+#	 then start 'run_webxray.py -w [DB_NAME]' on each node, the nodes lease pages
+#	 as their browsers free up and stop once every page is done, a page which
+#	 fails goes back on the queue for any node until it has had 'max_attempts'
+#
+#	'lease_seconds' is how long a node may go without being heard from before
+#	 the pages it was working on are given to other nodes, mysql must be 8.0.1 or
+#	 above for this
+lease_seconds = 300
+
 # DATABASE ENGINE SELECTION
 # 	db_engine can be 'mysql', 'postgres', or 'sqlite'
 #	sqlite requires no configuation, but mysql and postgres
@@ -280,17 +391,85 @@ def interaction(dnt):
         interaction(dnt)
 # interaction
 
-def collect(db_name, pages_file_name, dnt):
+def get_collector(db_name, pages_file_name, dnt, use_work_queue=False):
+    """
+    sets up a Collector with the settings above
+    """
+    from webxray.Collector import Collector
+    return Collector(
+        db_engine, db_name, pages_file_name, [browser_type], browser_wait, 
+        dnt=dnt, 
+        ip_resolution=ip_resolution,
+        ingest_writer=ingest_writer,
+        ingest_queue_depth=ingest_queue_depth,
+        ingest_batch_size=ingest_batch_size,
+        browser_max_pages=browser_max_pages,
+        stream_network_events=stream_network_events,
+        network_idle_seconds=network_idle_seconds,
+        pages_per_worker=pages_per_worker,
+        max_concurrent_pages=max_concurrent_pages,
+        worker_memory_limit_mb=worker_memory_limit_mb,
+        max_attempts=max_attempts,
+        retry_backoff_seconds=retry_backoff_seconds,
+        max_pages_per_domain=max_pages_per_domain,
+        use_work_queue=use_work_queue,
+        lease_seconds=lease_seconds
+    )
+# get_collector
+
+def collect(db_name, pages_file_name, dnt, use_work_queue=False):
     """
     manage the loading of pages, extracting relevant data, and storing to db
     may also be called in stand-alone with 'run_webxray.py -c [DB_NAME] [PAGE_FILE_NAME]'
+        or to work through the shared work queue with 'run_webxray.py -w [DB_NAME]'
     """
-
-    from webxray.Collector import Collector
-    collector = Collector(db_engine, db_name, pages_file_name, [browser_type], browser_wait, dnt=dnt)
+    collector = get_collector(db_name, pages_file_name, dnt, use_work_queue)
     collector.run(pool_size)
+
+    # fill in the ip addresses we skipped over during collection
+    if ip_resolution == 'defer':
+        resolve_ip_addrs(db_name)
 # collect
 
+def enqueue(db_name, pages_file_name):
+    """
+    put a page list on the shared work queue for 'run_webxray.py -w', see 'lease_seconds' above
+    may also be called in stand-alone with 'run_webxray.py -e [DB_NAME] [PAGE_FILE_NAME]'
+    """
+    # only reads the page list and the db, so no browser is started and chrome
+    #   isn't needed on the machine doing this
+    from webxray.Collector import Collector
+    collector = Collector(db_engine, db_name, pages_file_name, [browser_type], browser_wait, max_attempts=max_attempts)
+    collector.enqueue_urls()
+# enqueue
+
+def resolve_ip_addrs(db_name):
+    """
+    look up ip addresses for domains stored without them, see 'ip_resolution' above
+    may also be called in stand-alone with 'run_webxray.py -r [DB_NAME]'
+    """
+    from webxray.OutputStore import OutputStore
+    output_store = OutputStore(db_engine, db_name)
+    output_store.resolve_deferred_ip_addrs()
+# resolve_ip_addrs
+
+def migrate(db_name):
+    """
+    add the current indexes, etc. to a database created with an older version of webxray
+    may also be called in stand-alone with 'run_webxray.py -m [DB_NAME]'
+    """
+    sql_driver.db_switch(db_name)
+    print('\tMigrating %s, this may take a while on large databases...' % db_name)
+    if sql_driver.migrate_db():
+        print('\tDone!')
+    else:
+        print('\tAlready up to date.')
+
+    # only new sqlite dbs are created in WAL mode, older ones are switched here
+    if db_engine == 'sqlite' and sql_driver.set_wal_mode():
+        print('\tSwitched %s to WAL mode.' % db_name)
+# migrate
+
 def analyze(db_name):
     """
     perform analysis, generate reports and store them in ./reports
@@ -309,6 +488,10 @@ def analyze(db_name):
     analyzer = Analyzer(db_engine, db_name, num_tlds, num_results)
 
     # this is the full suite of reports, comment out those you don't need
+    #
+    # the first three are worked out from per-page summaries kept in the db, so 
+    #   re-running them as the db grows only costs as much as the new pages,
+    #   the rest go through every element
     analyzer.generate_db_summary_report()
     analyzer.generate_stats_report()
     analyzer.generate_aggregated_tracking_attribution_report()
@@ -353,6 +536,10 @@ if __name__ == '__main__':
     parser.add_option('-a', action='store_true', dest='analyze', help='Analyze Unattended: Best for Large Datasets - Args: [db_name]')
     parser.add_option('-c', action='store_true', dest='collect', help='Collect Unattended: Best for Large Datasets - Args: [db_name] [page_file_name]')
     parser.add_option('-s', action='store_true', dest='single', help='Single Site: for One-Off Tests - Args [url to analyze]')
+    parser.add_option('-e', action='store_true', dest='enqueue', help='Enqueue Page List for Collectors on Many Nodes - Args: [db_name] [page_file_name]')
+    parser.add_option('-w', action='store_true', dest='work', help='Collect from Work Queue Unattended: Run on Each Node - Args: [db_name]')
+    parser.add_option('-r', action='store_true', dest='resolve', help='Resolve Deferred IP Addresses Unattended - Args: [db_name]')
+    parser.add_option('-m', action='store_true', dest='migrate', help='Migrate Database to Current Schema Unattended - Args: [db_name]')
     parser.add_option('-d', action='store_true', dest='donottrack', help='Do Not Track flag')
     (options, args) = parser.parse_args()
 
@@ -376,6 +563,22 @@ if __name__ == '__main__':
         mode = 'single'
         mode_count += 1
 
+    if options.enqueue:
+        mode = 'enqueue'
+        mode_count += 1
+
+    if options.work:
+        mode = 'work'
+        mode_count += 1
+
+    if options.resolve:
+        mode = 'resolve'
+        mode_count += 1
+
+    if options.migrate:
+        mode = 'migrate'
+        mode_count += 1
+
     if options.donottrack:
         dnt = True
         
@@ -404,7 +607,22 @@ if __name__ == '__main__':
         except:
             print('Need a db name and pages file name!')
             quit()
-        collect(db_name, page_file)
+        collect(db_name, page_file, dnt)
+    elif mode == 'enqueue':
+        try:
+            db_name = args[0]
+            page_file = args[1]
+        except:
+            print('Need a db name and pages file name!')
+            quit()
+        enqueue(db_name, page_file)
+    elif mode == 'work':
+        try:
+            db_name = args[0]
+        except:
+            print('Need a db name!')
+            quit()
+        collect(db_name, None, dnt, use_work_queue=True)
     elif mode == 'single':
         try:
             url = args[0]
@@ -412,5 +630,19 @@ if __name__ == '__main__':
             print('URL needs to be supplied as an argument!')
             quit()
         single(url, dnt=dnt)
+    elif mode == 'resolve':
+        try:
+            db_name = args[0]
+        except:
+            print('Need a db name!')
+            quit()
+        resolve_ip_addrs(db_name)
+    elif mode == 'migrate':
+        try:
+            db_name = args[0]
+        except:
+            print('Need a db name!')
+            quit()
+        migrate(db_name)
     quit()
 # main
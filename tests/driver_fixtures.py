@@ -0,0 +1,163 @@
+"""
+	helpers shared by the driver tests, pages are stored through the driver
+		the same way OutputStore does so the data is valid on every engine
+"""
+
+from webxray.OutputStore import OutputStore
+
+def add_test_page(sql_driver, page_num, num_3p=2, num_3p_cookies=1):
+	"""
+	stores a page on bench{page_num}.example.com with one first-party element,
+		num_3p scripts from cdn.tracker{n}.net and num_3p_cookies 
+		third-party cookies, returns the page id
+	"""
+	sql_driver.start_transaction()
+	page_domain_id = sql_driver.add_domain(None, 'bench%s.example.com' % page_num, 'example.com', 'com', 'com')
+	page_id = sql_driver.add_page(
+		'chrome', 'test', 0, 0,
+		'title', 'meta_desc',
+		'https://bench%s.example.com/' % page_num, 'https://bench%s.example.com/' % page_num,
+		None, None,
+		True, None,
+		0, page_domain_id
+	)
+
+	elements = [(
+		page_id,
+		'https://bench%s.example.com/logo.png' % page_num, 'https://bench%s.example.com/logo.png' % page_num,
+		False, True,
+		True,
+		None, None,
+		None, None,
+		200, 'OK',
+		'image/png', 500,
+		None, None,
+		None, 'png',
+		'image', None,
+		page_domain_id
+	)]
+	for element_num in range(num_3p):
+		element_domain_id = sql_driver.add_domain(None, 'cdn.tracker%s.net' % element_num, 'tracker%s.net' % element_num, 'net', 'net')
+		elements.append((
+			page_id,
+			'https://cdn.tracker%s.net/%s.js' % (element_num, page_num), 'https://cdn.tracker%s.net/%s.js' % (element_num, page_num),
+			True, True,
+			True,
+			None, None,
+			None, None,
+			200, 'OK',
+			'application/javascript', 1000,
+			None, None,
+			None, 'js',
+			'javascript', None,
+			element_domain_id
+		))
+	sql_driver.add_elements(elements)
+
+	cookies = []
+	for cookie_num in range(num_3p_cookies):
+		cookie_domain_id = sql_driver.add_domain(None, 'cdn.tracker%s.net' % cookie_num, 'tracker%s.net' % cookie_num, 'net', 'net')
+		cookies.append((
+			page_id,
+			'uid%s' % cookie_num, True, '/',
+			'.tracker%s.net' % cookie_num, False,
+			None, 'value', True,
+			cookie_domain_id
+		))
+	sql_driver.add_cookies(cookies)
+	sql_driver.commit()
+	return page_id
+# add_test_page
+
+def get_temp_sqlite_driver(tmp_dir, db_name='unittest', profile=None):
+	"""
+	returns an SQLiteDriver connected to a new empty db in tmp_dir, the schema
+		files are read from db_root_path so they are copied over as well
+	"""
+	# imported here so the other drivers' tests don't need the sqlite one
+	import shutil
+	from webxray.SQLiteDriver import SQLiteDriver
+
+	sql_driver = SQLiteDriver(profile=profile)
+	for schema_file_name in ['sqlite_db_init.schema', 'sqlite_db_migrate.schema']:
+		shutil.copy(sql_driver.db_root_path+schema_file_name, tmp_dir+'/'+schema_file_name)
+	sql_driver.db_root_path = tmp_dir+'/'
+	sql_driver.create_wbxr_db(db_name)
+	return sql_driver
+# get_temp_sqlite_driver
+
+def get_browser_output(final_url, requests, cookies=()):
+	"""
+	the least browser output OutputStore.build_page_record will take, requests
+		is a dict of request url -> request details
+	"""
+	return {
+		'browser_type'		: 'chrome',
+		'browser_version'	: 'test',
+		'browser_wait'		: 0,
+		'browser_wait_used'	: 0,
+		'title'				: 'title',
+		'meta_desc'			: 'meta_desc',
+		'final_url'			: final_url,
+		'load_time'			: 0,
+		'all_links'			: [],
+		'cookies'			: list(cookies),
+		'processed_requests': requests
+	}
+# get_browser_output
+
+class TempOutputStore(OutputStore):
+	"""
+	stores to an sqlite db made by get_temp_sqlite_driver rather than one in 
+		the resources directory
+	"""
+	def __init__(self, tmp_dir, db_name='unittest'):
+		super().__init__('sqlite', db_name, ip_resolution='skip')
+		self.tmp_dir = tmp_dir
+	# __init__
+
+	def get_sql_driver(self):
+		from webxray.SQLiteDriver import SQLiteDriver
+		sql_driver = SQLiteDriver()
+		sql_driver.db_root_path = self.tmp_dir+'/'
+		sql_driver.db_switch(self.db_name)
+		return sql_driver
+	# get_sql_driver
+# TempOutputStore
+
+class StreamQueryTests:
+	"""
+	stream_query for each driver, mixed in with a TestCase which sets up 
+		self.sql_driver on an empty db and sets self.param to the driver's
+		query parameter
+	"""
+	def add_pages(self):
+		return [add_test_page(self.sql_driver, page_num) for page_num in range(5)]
+	# add_pages
+
+	def test_stream(self):
+		page_ids = self.add_pages()
+		query = 'SELECT id, start_url FROM page ORDER BY id'
+		self.assertEqual(list(self.sql_driver.stream_query(query, chunk_size=2)), self.sql_driver.fetch_query(query))
+		self.assertEqual([row[0] for row in self.sql_driver.stream_query(query, chunk_size=2)], page_ids)
+		self.assertEqual(list(self.sql_driver.stream_query('SELECT id FROM page WHERE id < 0')), [])
+	# test_stream
+
+	def test_params(self):
+		page_ids = self.add_pages()
+		query = 'SELECT id FROM page WHERE id > %s ORDER BY id' % self.param
+		self.assertEqual([row[0] for row in self.sql_driver.stream_query(query, (page_ids[2],), chunk_size=1)], page_ids[3:])
+	# test_params
+
+	def test_stop_early(self):
+		# the rest of the rows are dropped and the connection carries on as normal
+		page_ids = self.add_pages()
+		rows = self.sql_driver.stream_query('SELECT id FROM page ORDER BY id', chunk_size=2)
+		self.assertEqual(next(rows)[0], page_ids[0])
+		rows.close()
+
+		self.assertEqual(self.sql_driver.fetch_query('SELECT COUNT(*) FROM page')[0][0], 5)
+		add_test_page(self.sql_driver, 5)
+		self.assertEqual(self.sql_driver.fetch_query('SELECT COUNT(*) FROM page')[0][0], 6)
+	# test_stop_early
+# StreamQueryTests
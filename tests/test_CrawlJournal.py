@@ -0,0 +1,169 @@
+# standard python libs
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from driver_fixtures import get_temp_sqlite_driver
+from webxray.CrawlJournal import CrawlJournal
+
+class StubClock:
+	"""
+	stands in for time.time so journal lines get the times we want
+	"""
+	def __init__(self):
+		self.now = 1000.0
+	# __init__
+
+	def time(self):
+		return self.now
+	# time
+# StubClock
+
+class CrawlJournalTestCase(unittest.TestCase):
+	def setUp(self):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.clock = StubClock()
+		patch = mock.patch('webxray.CrawlJournal.time', self.clock)
+		patch.start()
+		self.addCleanup(patch.stop)
+		self.crawl_journal = self.get_crawl_journal()
+	# setUp
+
+	def tearDown(self):
+		shutil.rmtree(self.tmp_dir, ignore_errors=True)
+	# tearDown
+
+	def get_crawl_journal(self):
+		crawl_journal = CrawlJournal('sqlite', 'unittest', 'test', max_attempts=3, retry_backoff_seconds=60)
+		crawl_journal.journal_path = self.tmp_dir+'/unittest.journal'
+		return crawl_journal
+	# get_crawl_journal
+
+	def get_entry(self, entries, url):
+		return entries[self.crawl_journal.get_url_digest(url)]
+	# get_entry
+
+	def get_line_count(self):
+		with open(self.crawl_journal.journal_path, 'r', encoding='utf-8') as journal_file:
+			return len(journal_file.readlines())
+	# get_line_count
+# CrawlJournalTestCase
+
+class TestLoad(CrawlJournalTestCase):
+	def test_states(self):
+		self.assertEqual(self.crawl_journal.load(), {})
+
+		self.crawl_journal.record('https://done.com/', 'in_flight')
+		self.crawl_journal.record('https://done.com/', 'done')
+		self.crawl_journal.record('https://failed.com/', 'in_flight')
+		self.crawl_journal.record('https://failed.com/', 'failed', 'Unable to load page')
+		self.crawl_journal.record('https://crashed.com/', 'in_flight')
+
+		entries = self.get_crawl_journal().load()
+		self.assertEqual(len(entries), 3)
+
+		# only failed pages keep their url
+		self.assertEqual(self.get_entry(entries, 'https://done.com/'), ('done', 1, 1000.0, None, None))
+		self.assertEqual(self.get_entry(entries, 'https://failed.com/'), ('failed', 1, 1000.0, 'https://failed.com/', 'Unable to load page'))
+		self.assertEqual(self.get_entry(entries, 'https://crashed.com/'), ('failed', 1, 1000.0, 'https://crashed.com/', 'Interrupted'))
+	# test_states
+
+	def test_compact(self):
+		for attempt in range(3):
+			self.crawl_journal.record('https://failed.com/', 'in_flight')
+			self.crawl_journal.record('https://failed.com/', 'failed', 'Unable to load page')
+		self.crawl_journal.record('https://done.com/', 'in_flight')
+		self.crawl_journal.record('https://done.com/', 'done')
+		self.assertEqual(self.get_line_count(), 8)
+
+		entries = self.crawl_journal.load()
+		self.assertEqual(self.get_line_count(), 2)
+		self.assertEqual(self.get_entry(entries, 'https://failed.com/')[:2], ('failed', 3))
+
+		# the compacted journal loads the same, and we can carry on writing to it
+		self.assertEqual(self.get_crawl_journal().load(), entries)
+		self.crawl_journal.record('https://new.com/', 'in_flight')
+		self.assertEqual(len(self.get_crawl_journal().load()), 3)
+	# test_compact
+
+	def test_update(self):
+		self.crawl_journal.record('https://failed.com/', 'in_flight')
+		self.crawl_journal.record('https://failed.com/', 'failed')
+		entries = self.crawl_journal.load()
+
+		# only new lines are read, a line cut short is left until it is finished
+		self.crawl_journal.record('https://failed.com/', 'in_flight')
+		line = json.dumps([1000.0, 'done', self.crawl_journal.get_url_digest('https://failed.com/'), 0, None, None])+'\n'
+		with open(self.crawl_journal.journal_path, 'a', encoding='utf-8') as journal_file:
+			journal_file.write(line[:-5])
+		self.crawl_journal.update(entries)
+		self.assertEqual(self.get_entry(entries, 'https://failed.com/'), ('in_flight', 2, 1000.0, 'https://failed.com/', None))
+
+		with open(self.crawl_journal.journal_path, 'a', encoding='utf-8') as journal_file:
+			journal_file.write(line[-5:])
+		self.crawl_journal.update(entries)
+		self.assertEqual(self.get_entry(entries, 'https://failed.com/'), ('done', 2, 1000.0, None, None))
+	# test_update
+
+	def test_bad_lines(self):
+		with open(self.crawl_journal.journal_path, 'w', encoding='utf-8') as journal_file:
+			journal_file.write('[1000.0, "queued", "https://old-format.com/", null]\n')
+			journal_file.write('not json\n')
+		self.crawl_journal.record('https://done.com/', 'done')
+		self.assertEqual(list(self.crawl_journal.load().values()), [('done', 0, 1000.0, None, None)])
+	# test_bad_lines
+# TestLoad
+
+class TestRetry(CrawlJournalTestCase):
+	def fail(self, url):
+		self.crawl_journal.record(url, 'in_flight')
+		self.crawl_journal.record(url, 'failed', 'Unable to load page')
+		return self.get_entry(self.get_crawl_journal().load(), url)
+	# fail
+
+	def test_backoff(self):
+		# the wait doubles from the last failure
+		self.assertEqual(self.crawl_journal.get_retry_time(self.fail('https://failed.com/')), 1060.0)
+		self.clock.now = 2000.0
+		self.assertEqual(self.crawl_journal.get_retry_time(self.fail('https://failed.com/')), 2120.0)
+
+		# then it is out of attempts
+		self.clock.now = 3000.0
+		self.assertIsNone(self.crawl_journal.get_retry_time(self.fail('https://failed.com/')))
+	# test_backoff
+# TestRetry
+
+class TestDbId(unittest.TestCase):
+	"""
+	a db made again with the same name gets a new id, and so a new journal
+	"""
+	def setUp(self):
+		self.tmp_dir = tempfile.mkdtemp()
+	# setUp
+
+	def tearDown(self):
+		shutil.rmtree(self.tmp_dir, ignore_errors=True)
+	# tearDown
+
+	def get_journal_path(self):
+		sql_driver = get_temp_sqlite_driver(self.tmp_dir)
+		db_id = sql_driver.get_db_id()
+		self.assertEqual(sql_driver.get_db_id(), db_id)
+		sql_driver.close()
+		os.remove(self.tmp_dir+'/wbxr_unittest.db')
+		return CrawlJournal('sqlite', 'unittest', db_id).journal_path
+	# get_journal_path
+
+	def test_db_id(self):
+		self.assertNotEqual(self.get_journal_path(), self.get_journal_path())
+	# test_db_id
+# TestDbId
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,163 @@
+# standard python libs
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webxray.DNSResolver import DNSResolver
+from webxray.OutputStore import OutputStore
+
+class StubLookup:
+	"""
+	stands in for socket.gethostbyname, counts calls per fqdn and
+		sleeps on any fqdn in slow_fqdns
+	"""
+	def __init__(self, slow_fqdns=(), delay=0):
+		self.slow_fqdns	= set(slow_fqdns)
+		self.delay		= delay
+		self.calls		= {}
+		self.lock		= threading.Lock()
+	# __init__
+
+	def __call__(self, fqdn):
+		with self.lock:
+			self.calls[fqdn] = self.calls.get(fqdn, 0) + 1
+		if fqdn in self.slow_fqdns: time.sleep(self.delay)
+		if fqdn.endswith('.invalid'): raise OSError('no such host')
+		return '10.0.0.%s' % len(fqdn)
+	# __call__
+# StubLookup
+
+class TestDNSResolver(unittest.TestCase):
+	def setUp(self):
+		self.tmp_dir	= tempfile.mkdtemp()
+		self.cache_path	= os.path.join(self.tmp_dir, 'dns_cache.db')
+	# setUp
+
+	def tearDown(self):
+		shutil.rmtree(self.tmp_dir, ignore_errors=True)
+	# tearDown
+
+	def test_cache_hit(self):
+		stub = StubLookup()
+		resolver = DNSResolver(cache_path=self.cache_path, lookup_function=stub)
+
+		self.assertEqual(resolver.get_ip_addr('a.example.com'), '10.0.0.13')
+		self.assertEqual(resolver.get_ip_addr('a.example.com'), '10.0.0.13')
+		self.assertIsNone(resolver.get_ip_addr('b.invalid'))
+		self.assertIsNone(resolver.get_ip_addr('b.invalid'))
+		self.assertEqual(stub.calls, {'a.example.com': 1, 'b.invalid': 1})
+
+		stats = resolver.get_stats()
+		self.assertEqual(stats['misses'], 2)
+		self.assertEqual(stats['memory_hits'], 2)
+		self.assertEqual(stats['negative_hits'], 1)
+
+		# a second resolver finds it in the shared cache
+		other_resolver = DNSResolver(cache_path=self.cache_path, lookup_function=stub)
+		self.assertEqual(other_resolver.get_ip_addr('a.example.com'), '10.0.0.13')
+		self.assertEqual(stub.calls['a.example.com'], 1)
+		self.assertEqual(other_resolver.get_stats()['shared_hits'], 1)
+	# test_cache_hit
+
+	def test_ttl_expiry(self):
+		stub = StubLookup()
+		resolver = DNSResolver(positive_ttl=0.2, negative_ttl=0.2, cache_path=self.cache_path, lookup_function=stub)
+
+		resolver.get_ip_addr('a.example.com')
+		resolver.get_ip_addr('b.invalid')
+		time.sleep(0.3)
+		resolver.get_ip_addr('a.example.com')
+		resolver.get_ip_addr('b.invalid')
+		self.assertEqual(stub.calls, {'a.example.com': 2, 'b.invalid': 2})
+	# test_ttl_expiry
+
+	def test_memory_cache_size(self):
+		stub = StubLookup()
+		resolver = DNSResolver(cache_path=self.cache_path, lookup_function=stub, memory_cache_size=2)
+
+		resolver.get_ip_addr('a.example.com')
+		resolver.get_ip_addr('b.example.com')
+		resolver.get_ip_addr('a.example.com')
+		resolver.get_ip_addr('c.example.com')
+
+		# b was the least recently used so it goes
+		self.assertEqual(list(resolver.memory_cache), ['a.example.com', 'c.example.com'])
+	# test_memory_cache_size
+
+	def test_resolve_many_deadline(self):
+		stub = StubLookup(slow_fqdns=['slow.example.com'], delay=0.5)
+		resolver = DNSResolver(cache_path=self.cache_path, lookup_function=stub)
+
+		start = time.time()
+		results = resolver.resolve_many(['a.example.com', 'b.invalid', 'slow.example.com'], max_workers=4, deadline=0.1)
+		self.assertLess(time.time() - start, 0.4)
+		self.assertEqual(results, {
+			'a.example.com'		: '10.0.0.13',
+			'b.invalid'			: None,
+			'slow.example.com'	: None
+		})
+
+		# the deadline miss isn't cached as a failure...
+		found, ip_addr = resolver.get_cached('slow.example.com')
+		self.assertFalse(found)
+
+		# ...but the lookup finishes in the background and is cached then
+		time.sleep(0.6)
+		found, ip_addr = resolver.get_cached('slow.example.com')
+		self.assertTrue(found)
+		self.assertEqual(ip_addr, '10.0.0.16')
+		self.assertEqual(resolver.resolve_many(['slow.example.com'])['slow.example.com'], '10.0.0.16')
+		self.assertEqual(stub.calls['slow.example.com'], 1)
+
+		# the lookup threads are daemons so they don't hold up exiting
+		self.assertTrue(all(lookup_thread.daemon for lookup_thread in resolver.lookup_threads))
+	# test_resolve_many_deadline
+
+	def test_page_deadline(self):
+		stub = StubLookup(slow_fqdns=['slow.example.net'], delay=0.5)
+		output_store = OutputStore('sqlite', 'unused', dns_workers=4, dns_deadline=0.1)
+		output_store.url_parser.dns_resolver = DNSResolver(cache_path=self.cache_path, lookup_function=stub)
+
+		browser_output = {
+			'browser_type'		: 'chrome',
+			'browser_version'	: 'test',
+			'browser_wait'		: 0,
+			'browser_wait_used'	: 0,
+			'title'				: 'title',
+			'meta_desc'			: 'meta_desc',
+			'final_url'			: 'https://www.example.com/',
+			'load_time'			: 0,
+			'all_links'			: [],
+			'cookies'			: [{'name': 'uid', 'domain': 'slow.example.net'}],
+			'processed_requests': {
+				'https://slow.example.net/a.js'	: {'referer': 'https://www.example.com/'},
+				'https://slow.example.net/b.js'	: {'referer': 'https://slow.example.net/a.js'},
+				'https://fast.example.org/c.js'	: {'referer': 'https://slow.example.net/b.js'}
+			}
+		}
+
+		# the slow host is looked up once for the whole page and we only wait 
+		#	on it until the deadline
+		start = time.time()
+		page_record = output_store.build_page_record('https://www.example.com/', browser_output)
+		self.assertLess(time.time() - start, 0.4)
+		self.assertEqual(stub.calls['slow.example.net'], 1)
+
+		element_ip_addrs = dict((element[0], element[-1][0]) for element in page_record['elements'])
+		self.assertEqual(element_ip_addrs, {
+			'https://slow.example.net/a.js'	: None,
+			'https://slow.example.net/b.js'	: None,
+			'https://fast.example.org/c.js'	: '10.0.0.16'
+		})
+		self.assertIsNone(page_record['cookies'][0][-1][0])
+	# test_page_deadline
+# TestDNSResolver
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,121 @@
+# standard python libs
+import os
+import sys
+import queue
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from driver_fixtures import get_temp_sqlite_driver, get_browser_output, TempOutputStore
+from webxray.IngestWriter import IngestWriter, FLUSH
+from webxray.SQLiteDriver import SQLiteDriver
+
+class StubJournal:
+	"""
+	keeps what the writer records rather than writing a file
+	"""
+	def __init__(self):
+		self.records = []
+	# __init__
+
+	def record(self, url, state, msg=None):
+		self.records.append((url, state))
+	# record
+# StubJournal
+
+class TestIngestWriter(unittest.TestCase):
+	"""
+	the writer runs in a thread here rather than a process so we can count 
+		its commits, it still gets the records off a queue the same way
+	"""
+	def setUp(self):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.sql_driver = get_temp_sqlite_driver(self.tmp_dir)
+		self.output_store = TempOutputStore(self.tmp_dir)
+		self.journal = StubJournal()
+
+		self.commits = []
+		sqlite_commit = SQLiteDriver.commit
+		def commit(sql_driver):
+			self.commits.append(sql_driver.in_transaction)
+			sqlite_commit(sql_driver)
+		patches = [
+			mock.patch('webxray.IngestWriter.OutputStore', lambda *args, **kwargs: TempOutputStore(self.tmp_dir)),
+			mock.patch.object(SQLiteDriver, 'commit', commit)
+		]
+		for patch in patches:
+			patch.start()
+			self.addCleanup(patch.stop)
+
+		# a long batch_seconds so batches only end when full or flushed
+		self.page_record_queue	= queue.Queue()
+		self.ack_queue			= queue.Queue()
+		ingest_writer = IngestWriter('sqlite', 'unittest', batch_size=3, batch_seconds=60, crawl_journal=self.journal)
+		self.writer_thread = threading.Thread(target=ingest_writer.run, args=(self.page_record_queue, self.ack_queue))
+		self.writer_thread.start()
+	# setUp
+
+	def tearDown(self):
+		self.page_record_queue.put(None)
+		self.writer_thread.join(10)
+		self.sql_driver.close()
+		shutil.rmtree(self.tmp_dir, ignore_errors=True)
+	# tearDown
+
+	def put_page(self, page_num, body_size=100):
+		url = 'https://page%s.example.com/' % page_num
+		browser_output = get_browser_output(url, {
+			url+'logo.png'					: {'body_size': 100},
+			'https://cdn.tracker.net/t.js'	: {'body_size': body_size}
+		})
+		self.page_record_queue.put(self.output_store.build_page_record(url, browser_output))
+		return url
+	# put_page
+
+	def flush(self):
+		self.page_record_queue.put(FLUSH)
+		self.assertTrue(self.ack_queue.get(timeout=10))
+	# flush
+
+	def get_stored_urls(self):
+		return sorted(url for url, in self.sql_driver.fetch_query('SELECT start_url FROM page'))
+	# get_stored_urls
+
+	def test_batch(self):
+		urls = [self.put_page(page_num) for page_num in range(5)]
+		self.flush()
+
+		# a full batch of three, then the rest when flushed
+		self.assertEqual(self.commits, [True, True])
+		self.assertEqual(self.get_stored_urls(), urls)
+		self.assertEqual(self.journal.records, [(url, 'done') for url in urls])
+	# test_batch
+
+	def test_flush_empty(self):
+		self.flush()
+		self.assertEqual(self.commits, [])
+	# test_flush_empty
+
+	def test_fallback(self):
+		# sqlite can't bind a dict, so the batch fails and each page is retried alone
+		good_url	= self.put_page(0)
+		bad_url		= self.put_page(1, body_size={'not': 'a size'})
+		other_url	= self.put_page(2)
+		self.flush()
+
+		self.assertEqual(self.commits, [True, True])
+		self.assertEqual(self.get_stored_urls(), [good_url, other_url])
+		self.assertEqual(self.journal.records, [(good_url, 'done'), (bad_url, 'failed'), (other_url, 'done')])
+
+		error_url, error_msg = self.sql_driver.fetch_query('SELECT url, msg FROM error')[0]
+		self.assertEqual(error_url, bad_url)
+		self.assertTrue(error_msg.startswith('Error storing page'))
+	# test_fallback
+# TestIngestWriter
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,62 @@
+# standard python libs
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from driver_fixtures import StreamQueryTests
+from test_WorkQueue import WorkQueueDriverTests
+
+# the driver exits if the connector is missing, and these need a running server 
+#	set up as in MySQLDriver, otherwise they are skipped
+try:
+	import mysql.connector
+	from webxray.MySQLDriver import MySQLDriver
+except ImportError:
+	mysql = None
+
+TEST_DB_NAME = 'unittest_driver'
+
+class MySQLTestCase(unittest.TestCase):
+	"""
+	each test gets a freshly created wbxr_unittest_driver db
+	"""
+	def setUp(self):
+		if mysql is None: self.skipTest('mysql-connector is not installed')
+
+		# the driver exits rather than raising when it can't connect, so 
+		#	we see if there is a server first
+		try:
+			mysql.connector.connect(user='root', password='', host='127.0.0.1', connection_timeout=2).close()
+		except mysql.connector.Error as e:
+			self.skipTest('no mysql server: %s' % e)
+
+		self.sql_driver = MySQLDriver()
+		self.drop_test_db(self.sql_driver)
+		self.sql_driver.create_wbxr_db(TEST_DB_NAME)
+	# setUp
+
+	def tearDown(self):
+		self.sql_driver.close()
+		sql_driver = MySQLDriver()
+		self.drop_test_db(sql_driver)
+		sql_driver.close()
+	# tearDown
+
+	def drop_test_db(self, sql_driver):
+		if sql_driver.check_db_exist(TEST_DB_NAME):
+			sql_driver.db.execute('DROP DATABASE %s%s' % (sql_driver.db_prefix, TEST_DB_NAME))
+	# drop_test_db
+# MySQLTestCase
+
+class TestStreamQuery(StreamQueryTests, MySQLTestCase):
+	param = '%s'
+# TestStreamQuery
+
+class TestWorkQueue(WorkQueueDriverTests, MySQLTestCase):
+	pass
+# TestWorkQueue
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,145 @@
+# standard python libs
+import os
+import sys
+import time
+import unittest
+import importlib.util
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webxray.NetworkEventLog import NetworkEventLog
+
+class StubClock:
+	"""
+	stands in for time.time so we don't have to sleep through the quiet period
+	"""
+	def __init__(self):
+		self.now = 1000.0
+	# __init__
+
+	def time(self):
+		return self.now
+	# time
+# StubClock
+
+def request_event(request_id, url, redirect_url=None):
+	params = {
+		'requestId'	: request_id,
+		'timestamp'	: 1.0,
+		'request'	: {'url': url, 'headers': {}}
+	}
+	if redirect_url:
+		params['redirectResponse'] = {'url': redirect_url, 'status': 302, 'statusText': 'Found', 'headers': {}}
+	return ('Network.requestWillBeSent', params)
+# request_event
+
+def finished_event(request_id):
+	return ('Network.loadingFinished', {'requestId': request_id, 'timestamp': 2.0, 'encodedDataLength': 100})
+# finished_event
+
+class TestNetworkIdle(unittest.TestCase):
+	"""
+	the network is idle once nothing is in flight and there have been no
+		events for quiet_seconds
+	"""
+	def setUp(self):
+		self.clock = StubClock()
+		patch = mock.patch('webxray.NetworkEventLog.time', self.clock)
+		patch.start()
+		self.addCleanup(patch.stop)
+		self.event_log = NetworkEventLog()
+	# setUp
+
+	def add_event(self, event, seconds_later=0):
+		self.clock.now += seconds_later
+		self.event_log.add_event(*event)
+	# add_event
+
+	def test_in_flight(self):
+		self.add_event(request_event('1', 'https://example.com/'))
+		self.add_event(request_event('2', 'https://cdn.example.com/a.js'))
+
+		# waiting doesn't help while requests are open
+		self.clock.now += 60
+		self.assertFalse(self.event_log.is_network_idle(2))
+
+		self.add_event(finished_event('1'))
+		self.assertFalse(self.event_log.is_network_idle(2))
+
+		# failed requests count as done
+		self.add_event(('Network.loadingFailed', {'requestId': '2'}), 1)
+		self.assertFalse(self.event_log.is_network_idle(2))
+
+		# then the quiet period runs from the last event
+		self.clock.now += 1.5
+		self.assertFalse(self.event_log.is_network_idle(2))
+		self.clock.now += 0.5
+		self.assertTrue(self.event_log.is_network_idle(2))
+
+		# and starts over on the next request
+		self.add_event(request_event('3', 'https://example.com/late.js'))
+		self.assertFalse(self.event_log.is_network_idle(2))
+	# test_in_flight
+
+	def test_redirect(self):
+		# the redirect keeps its requestId, so finishing once is enough
+		self.add_event(request_event('1', 'http://example.com/'))
+		self.add_event(request_event('1', 'https://example.com/', redirect_url='http://example.com/'))
+		self.add_event(finished_event('1'), 1)
+		self.clock.now += 2
+		self.assertTrue(self.event_log.is_network_idle(2))
+	# test_redirect
+
+	def test_ignored_requests(self):
+		# data urls and websockets never finish, so they aren't in flight
+		self.add_event(request_event('1', 'data:image/png;base64,AAAA'))
+		self.add_event(('Network.webSocketCreated', {'requestId': '2', 'url': 'wss://example.com/socket'}))
+		self.clock.now += 2
+		self.assertTrue(self.event_log.is_network_idle(2))
+
+		# events from other domains don't reset the quiet period
+		self.add_event(('Page.frameNavigated', {}))
+		self.assertTrue(self.event_log.is_network_idle(2))
+	# test_ignored_requests
+# TestNetworkIdle
+
+@unittest.skipIf(importlib.util.find_spec('seleniumwire') is None, 'needs selenium-wire for ChromeDriver')
+class TestWaitForNetwork(unittest.TestCase):
+	"""
+	ChromeDriver stops waiting once the network is idle, with browser_wait 
+		as the upper limit, the event stream is stubbed so no browser is needed
+	"""
+	def get_chrome_driver(self, network_idle_seconds):
+		from webxray.ChromeDriver import ChromeDriver
+		chrome_driver = ChromeDriver(network_idle_seconds=network_idle_seconds)
+		chrome_driver.network_idle_poll_seconds = 0.05
+		return chrome_driver
+	# get_chrome_driver
+
+	def test_idle(self):
+		chrome_driver = self.get_chrome_driver(0.1)
+		event_log = NetworkEventLog()
+		event_log.add_event(*finished_event('1'))
+		waited = chrome_driver.wait_for_network(None, event_log, event_stream=object(), browser_wait=5)
+		self.assertLess(waited, 1)
+	# test_idle
+
+	def test_busy(self):
+		chrome_driver = self.get_chrome_driver(0.1)
+		event_log = NetworkEventLog()
+		event_log.add_event(*request_event('1', 'https://example.com/'))
+		waited = chrome_driver.wait_for_network(None, event_log, event_stream=object(), browser_wait=0.5)
+		self.assertGreaterEqual(waited, 0.5)
+	# test_busy
+
+	def test_disabled(self):
+		chrome_driver = self.get_chrome_driver(None)
+		wait_start = time.time()
+		self.assertEqual(chrome_driver.wait_for_network(None, NetworkEventLog(), None, browser_wait=0.2), 0.2)
+		self.assertGreaterEqual(time.time()-wait_start, 0.2)
+	# test_disabled
+# TestWaitForNetwork
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,60 @@
+# standard python libs
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from driver_fixtures import get_temp_sqlite_driver, get_browser_output, TempOutputStore
+
+class TestStorePage(unittest.TestCase):
+	"""
+	each page is written in one transaction, so a page which fails part way
+		leaves nothing behind but the logged error
+	"""
+	def setUp(self):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.sql_driver = get_temp_sqlite_driver(self.tmp_dir)
+		self.output_store = TempOutputStore(self.tmp_dir)
+	# setUp
+
+	def tearDown(self):
+		self.sql_driver.close()
+		shutil.rmtree(self.tmp_dir, ignore_errors=True)
+	# tearDown
+
+	def get_counts(self):
+		return dict(
+			(table, self.sql_driver.fetch_query('SELECT COUNT(*) FROM %s' % table)[0][0]) 
+			for table in ['page', 'domain', 'element', 'cookie', 'error']
+		)
+	# get_counts
+
+	def test_store(self):
+		browser_output = get_browser_output('https://www.example.com/', {
+			'https://www.example.com/logo.png'	: {'body_size': 100},
+			'https://cdn.tracker.net/t.js'		: {'body_size': 200}
+		}, [{'name': 'uid', 'domain': '.tracker.net'}])
+		self.assertTrue(self.output_store.store('https://www.example.com/', browser_output))
+		self.assertEqual(self.get_counts(), {'page': 1, 'domain': 3, 'element': 2, 'cookie': 1, 'error': 0})
+	# test_store
+
+	def test_rollback(self):
+		# the page, domains, and cookie are written before the elements, and
+		#	sqlite can't bind a dict so the elements fail
+		browser_output = get_browser_output('https://www.example.com/', {
+			'https://www.example.com/logo.png'	: {'body_size': 100},
+			'https://cdn.tracker.net/t.js'		: {'body_size': {'not': 'a size'}}
+		}, [{'name': 'uid', 'domain': '.tracker.net'}])
+		self.assertFalse(self.output_store.store('https://www.example.com/', browser_output))
+		self.assertEqual(self.get_counts(), {'page': 0, 'domain': 0, 'element': 0, 'cookie': 0, 'error': 1})
+
+		error_msg = self.sql_driver.fetch_query('SELECT msg FROM error')[0][0]
+		self.assertTrue(error_msg.startswith('Error storing page'))
+	# test_rollback
+# TestStorePage
+
+if __name__ == '__main__':
+	unittest.main()
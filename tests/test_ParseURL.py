@@ -0,0 +1,90 @@
+# standard python libs
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import webxray.ParseURL
+from webxray.ParseURL import ParseURL
+
+class TestPubsuffixTrie(unittest.TestCase):
+	"""
+	the matching rules from publicsuffix.org, first on a small hand-built trie
+		and then on the bundled list
+	"""
+	def setUp(self):
+		self.url_parser = ParseURL(ip_resolution='skip')
+	# setUp
+
+	def get_test_trie(self):
+		pubsuffix_trie = {}
+		for rule in ['com', 'uk', 'ac.uk', '*.ck', '!www.ck', 'jp', '*.kawasaki.jp', '!city.kawasaki.jp']:
+			if rule[0] == '!':
+				self.url_parser.add_pubsuffix_rule(pubsuffix_trie, rule[1:].split('.'), is_exception=True)
+			else:
+				self.url_parser.add_pubsuffix_rule(pubsuffix_trie, rule.split('.'))
+		return pubsuffix_trie
+	# get_test_trie
+
+	def test_pubsuffix_length(self):
+		self.url_parser.pubsuffix_trie = self.get_test_trie()
+		get_pubsuffix_length = lambda fqdn: self.url_parser.get_pubsuffix_length(tuple(fqdn.split('.')))
+
+		# plain rules, the longest match wins
+		self.assertEqual(get_pubsuffix_length('www.example.com'), 1)
+		self.assertEqual(get_pubsuffix_length('example.ac.uk'), 2)
+		self.assertEqual(get_pubsuffix_length('example.co.uk'), 1)
+
+		# wildcards match any one label
+		self.assertEqual(get_pubsuffix_length('a.foo.ck'), 2)
+		self.assertEqual(get_pubsuffix_length('a.b.foo.ck'), 2)
+		self.assertEqual(get_pubsuffix_length('x.ab.kawasaki.jp'), 3)
+
+		# exceptions make the pubsuffix one label shorter than the rule
+		self.assertEqual(get_pubsuffix_length('www.ck'), 1)
+		self.assertEqual(get_pubsuffix_length('a.www.ck'), 1)
+		self.assertEqual(get_pubsuffix_length('a.city.kawasaki.jp'), 2)
+
+		# no rule at all
+		self.assertEqual(get_pubsuffix_length('example.invalid'), 0)
+	# test_pubsuffix_length
+
+	def test_bundled_list(self):
+		get_fqdn_domain_pubsuffix_tld = self.url_parser.get_fqdn_domain_pubsuffix_tld
+		self.assertEqual(get_fqdn_domain_pubsuffix_tld('http://sub.domain.example.ac.uk/'), ('sub.domain.example.ac.uk', 'example.ac.uk', 'ac.uk', 'uk'))
+		self.assertEqual(get_fqdn_domain_pubsuffix_tld('http://x.foo.ck/'), ('x.foo.ck', 'x.foo.ck', 'foo.ck', 'ck'))
+		self.assertEqual(get_fqdn_domain_pubsuffix_tld('http://a.www.ck/'), ('a.www.ck', 'www.ck', 'ck', 'ck'))
+		self.assertEqual(get_fqdn_domain_pubsuffix_tld('http://x.ab.kawasaki.jp/'), ('x.ab.kawasaki.jp', 'x.ab.kawasaki.jp', 'ab.kawasaki.jp', 'jp'))
+		self.assertEqual(get_fqdn_domain_pubsuffix_tld('http://a.city.kawasaki.jp/'), ('a.city.kawasaki.jp', 'city.kawasaki.jp', 'kawasaki.jp', 'jp'))
+		self.assertEqual(get_fqdn_domain_pubsuffix_tld('http://abc.onion/'), ('abc.onion', 'abc.onion', 'onion', 'onion'))
+		self.assertIsNone(get_fqdn_domain_pubsuffix_tld('http://example.invalidtld/'))
+	# test_bundled_list
+# TestPubsuffixTrie
+
+class TestNetlocCache(unittest.TestCase):
+	def setUp(self):
+		self.cache_size = webxray.ParseURL.shared_netloc_cache_size
+		webxray.ParseURL.shared_netloc_cache.clear()
+	# setUp
+
+	def tearDown(self):
+		webxray.ParseURL.shared_netloc_cache_size = self.cache_size
+		webxray.ParseURL.shared_netloc_cache.clear()
+	# tearDown
+
+	def test_shared_size(self):
+		webxray.ParseURL.shared_netloc_cache_size = 2
+		url_parsers = [ParseURL(ip_resolution='skip'), ParseURL(ip_resolution='skip')]
+
+		for url_num in range(4):
+			url_parsers[url_num % 2].get_ip_fqdn_domain_pubsuffix_tld('http://www%s.example.com/' % url_num)
+
+		# every instance shares the one cache and the one limit
+		self.assertEqual(list(webxray.ParseURL.shared_netloc_cache), ['www2.example.com', 'www3.example.com'])
+		self.assertEqual(url_parsers[0].get_ip_fqdn_domain_pubsuffix_tld('http://www3.example.com/'), (None, 'www3.example.com', 'example.com', 'com', 'com'))
+	# test_shared_size
+# TestNetlocCache
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,116 @@
+# standard python libs
+import os
+import sys
+import queue
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webxray.PoliteScheduler import PoliteScheduler
+
+class TestPoliteScheduler(unittest.TestCase):
+	"""
+	urls are taken off of schedule() here on the test thread while nothing
+		would block, and on another thread once we want to see it wait
+	"""
+	def take(self, schedule, count):
+		return [next(schedule) for url_num in range(count)]
+	# take
+
+	def start_taking(self, schedule):
+		"""
+		reads the rest of the schedule on another thread, returns a queue of 
+			the urls as they come out with None at the end
+		"""
+		url_queue = queue.Queue()
+		def take_all():
+			for url in schedule: url_queue.put(url)
+			url_queue.put(None)
+		threading.Thread(target=take_all, daemon=True).start()
+		return url_queue
+	# start_taking
+
+	def assertWaiting(self, url_queue):
+		self.assertRaises(queue.Empty, url_queue.get, timeout=0.2)
+	# assertWaiting
+
+	def test_no_limit(self):
+		# the list order is kept and nothing is read ahead
+		urls = ['https://a.com/%s' % page_num for page_num in range(3)]+['https://b.com/']
+		read_urls = []
+		def read(urls):
+			for url in urls:
+				read_urls.append(url)
+				yield url
+
+		scheduler = PoliteScheduler(10)
+		schedule = scheduler.schedule(read(urls))
+		self.assertEqual(next(schedule), urls[0])
+		self.assertEqual(read_urls, urls[:1])
+		self.assertEqual(list(schedule), urls[1:])
+	# test_no_limit
+
+	def test_per_domain(self):
+		urls = ['https://www.a.com/%s' % page_num for page_num in range(4)]+['https://news.a.com/', 'https://b.com/1', 'https://b.com/2']
+		scheduler = PoliteScheduler(10, max_pages_per_domain=2)
+		schedule = scheduler.schedule(urls)
+
+		# domains take turns, subdomains count against their registrable domain
+		self.assertEqual(self.take(schedule, 4), ['https://www.a.com/0', 'https://b.com/1', 'https://www.a.com/1', 'https://b.com/2'])
+
+		# a.com is full, so we wait until one of its pages is done
+		url_queue = self.start_taking(schedule)
+		self.assertWaiting(url_queue)
+		scheduler.finished('https://b.com/1')
+		self.assertWaiting(url_queue)
+		scheduler.finished('https://www.a.com/0')
+		self.assertEqual(url_queue.get(timeout=5), 'https://www.a.com/2')
+		self.assertWaiting(url_queue)
+
+		scheduler.finished('https://www.a.com/1')
+		scheduler.finished('https://www.a.com/2')
+		self.assertEqual([url_queue.get(timeout=5), url_queue.get(timeout=5)], ['https://www.a.com/3', 'https://news.a.com/'])
+		self.assertEqual(url_queue.get(timeout=5), None)
+	# test_per_domain
+
+	def test_max_in_flight(self):
+		urls = ['https://site%s.com/' % site_num for site_num in range(4)]
+		scheduler = PoliteScheduler(2, max_pages_per_domain=1)
+		schedule = scheduler.schedule(urls)
+		self.assertEqual(self.take(schedule, 2), urls[:2])
+
+		url_queue = self.start_taking(schedule)
+		self.assertWaiting(url_queue)
+		scheduler.finished(urls[1])
+		self.assertEqual(url_queue.get(timeout=5), urls[2])
+		self.assertWaiting(url_queue)
+		scheduler.finished(urls[0])
+		self.assertEqual(url_queue.get(timeout=5), urls[3])
+		self.assertEqual(url_queue.get(timeout=5), None)
+	# test_max_in_flight
+
+	def test_lookahead(self):
+		# every url is on one busy domain, so we read no further than lookahead
+		read_urls = []
+		def read():
+			for page_num in range(100):
+				url = 'https://a.com/%s' % page_num
+				read_urls.append(url)
+				yield url
+
+		scheduler = PoliteScheduler(10, max_pages_per_domain=1, lookahead=5)
+		url_queue = self.start_taking(scheduler.schedule(read()))
+		self.assertEqual(url_queue.get(timeout=5), 'https://a.com/0')
+		self.assertWaiting(url_queue)
+		self.assertEqual(len(read_urls), 6)
+
+		scheduler.finished('https://a.com/0')
+		self.assertEqual(url_queue.get(timeout=5), 'https://a.com/1')
+		self.assertWaiting(url_queue)
+		self.assertEqual(len(read_urls), 7)
+	# test_lookahead
+# TestPoliteScheduler
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,113 @@
+# standard python libs
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from driver_fixtures import add_test_page, StreamQueryTests
+from test_WorkQueue import WorkQueueDriverTests
+
+# the driver exits if psycopg2 is missing, and these need a running server 
+#	set up as in PostgreSQLDriver, otherwise they are skipped
+try:
+	import psycopg2
+	from webxray.PostgreSQLDriver import PostgreSQLDriver
+except ImportError:
+	psycopg2 = None
+
+TEST_DB_NAME = 'unittest_driver'
+
+class PostgreSQLTestCase(unittest.TestCase):
+	"""
+	each test gets a freshly created wbxr_unittest_driver db
+	"""
+	def setUp(self):
+		if psycopg2 is None: self.skipTest('psycopg2 is not installed')
+		try:
+			self.sql_driver = PostgreSQLDriver()
+		except psycopg2.Error as e:
+			self.skipTest('no postgres server: %s' % e)
+		self.drop_test_db(self.sql_driver)
+		self.sql_driver.create_wbxr_db(TEST_DB_NAME)
+	# setUp
+
+	def tearDown(self):
+		self.sql_driver.close()
+		sql_driver = PostgreSQLDriver()
+		self.drop_test_db(sql_driver)
+		sql_driver.close()
+	# tearDown
+
+	def drop_test_db(self, sql_driver):
+		if sql_driver.check_db_exist(TEST_DB_NAME):
+			sql_driver.db.execute('DROP DATABASE %s%s' % (sql_driver.db_prefix, TEST_DB_NAME))
+	# drop_test_db
+# PostgreSQLTestCase
+
+class TestPageSummaries(PostgreSQLTestCase):
+	def test_update_page_summaries(self):
+		for page_num in range(3):
+			add_test_page(self.sql_driver, page_num, num_3p=page_num+1)
+		max_page_id = self.sql_driver.get_max_page_id()
+
+		self.sql_driver.start_transaction()
+		self.assertEqual(self.sql_driver.update_page_summaries(max_page_id), 3)
+		self.sql_driver.commit()
+
+		summaries = sorted(self.sql_driver.get_page_summaries())
+		self.assertEqual([summary[1:] for summary in summaries], [(1, 1, 1), (2, 2, 1), (3, 3, 1)])
+		owner_summaries = list(self.sql_driver.get_page_owner_summaries())
+		self.assertEqual(owner_summaries, [])
+
+		# a page without a summary is picked up whatever its id, and is left
+		#	out of the reports until it is
+		first_page_id = summaries[0][0]
+		self.sql_driver.commit_query('DELETE FROM page_summary WHERE page_id = %s' % first_page_id)
+		self.sql_driver.commit_query('DELETE FROM page_element_summary WHERE page_id = %s' % first_page_id)
+		self.assertEqual(len(list(self.sql_driver.get_report_pages(max_page_id))), 2)
+
+		self.assertEqual(self.sql_driver.update_page_summaries(max_page_id), 1)
+		self.assertEqual(sorted(self.sql_driver.get_page_summaries()), summaries)
+		self.assertEqual(len(list(self.sql_driver.get_report_pages(max_page_id))), 3)
+		self.assertEqual(self.sql_driver.update_page_summaries(max_page_id), 0)
+	# test_update_page_summaries
+# TestPageSummaries
+
+class TestWorkQueue(WorkQueueDriverTests, PostgreSQLTestCase):
+	pass
+# TestWorkQueue
+
+class TestStreamQuery(StreamQueryTests, PostgreSQLTestCase):
+	param = '%s'
+
+	def test_interleaved(self):
+		# a named cursor lives on the server so the driver's may be used as we read
+		page_ids = self.add_pages()
+		streamed_ids = []
+		for page_id, in self.sql_driver.stream_query('SELECT id FROM page ORDER BY id', chunk_size=2):
+			streamed_ids.append(page_id)
+			self.assertEqual(self.sql_driver.fetch_query('SELECT COUNT(*) FROM page')[0][0], 5)
+		self.assertEqual(streamed_ids, page_ids)
+	# test_interleaved
+
+	def test_autocommit(self):
+		# the transaction the stream opened is closed once we stop reading
+		self.add_pages()
+		self.assertTrue(self.sql_driver.db_conn.autocommit)
+		rows = self.sql_driver.stream_query('SELECT id FROM page', chunk_size=2)
+		next(rows)
+		self.assertFalse(self.sql_driver.db_conn.autocommit)
+		rows.close()
+		self.assertTrue(self.sql_driver.db_conn.autocommit)
+
+		# but one of ours is left alone
+		self.sql_driver.start_transaction()
+		self.assertEqual(len(list(self.sql_driver.stream_query('SELECT id FROM page'))), 5)
+		self.assertTrue(self.sql_driver.in_transaction)
+		self.sql_driver.commit()
+	# test_autocommit
+# TestStreamQuery
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,154 @@
+# standard python libs
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from driver_fixtures import get_temp_sqlite_driver, StreamQueryTests
+from webxray.SQLiteDriver import SQLiteDriver
+
+class TestPageSummaries(unittest.TestCase):
+	"""
+	pages are summarized by whether they have a summary yet, not by id, so a 
+		page stored after a page with a higher id is still picked up
+	"""
+	def setUp(self):
+		self.tmp_dir = tempfile.mkdtemp()
+		sqlite_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))+'/webxray/resources/db/sqlite/'
+		shutil.copy(sqlite_path+'wbxr_test1.db', self.tmp_dir+'/wbxr_test1.db')
+		shutil.copy(sqlite_path+'sqlite_db_migrate.schema', self.tmp_dir+'/sqlite_db_migrate.schema')
+
+		self.sql_driver = SQLiteDriver(profile=None)
+		self.sql_driver.db_root_path = self.tmp_dir+'/'
+		self.sql_driver.db_switch('test1')
+		self.sql_driver.migrate_db()
+	# setUp
+
+	def tearDown(self):
+		self.sql_driver.close()
+		shutil.rmtree(self.tmp_dir, ignore_errors=True)
+	# tearDown
+
+	def test_set_wal_mode(self):
+		self.assertEqual(self.sql_driver.fetch_query('PRAGMA journal_mode'), [('delete',)])
+		self.assertTrue(self.sql_driver.set_wal_mode())
+		self.assertEqual(self.sql_driver.fetch_query('PRAGMA journal_mode'), [('wal',)])
+		self.assertFalse(self.sql_driver.set_wal_mode())
+	# test_set_wal_mode
+
+	def get_summarized_page_ids(self):
+		return sorted(page_id for page_id, domain_3p_count, javascript_3p_count, cookie_3p_count in self.sql_driver.get_page_summaries())
+	# get_summarized_page_ids
+
+	def test_out_of_order_page(self):
+		# page 2 isn't visible yet when page 3 is summarized
+		self.sql_driver.commit_query('CREATE TABLE late_page AS SELECT * FROM page WHERE id = 2')
+		self.sql_driver.commit_query('DELETE FROM page WHERE id = 2')
+
+		max_page_id = self.sql_driver.get_max_page_id()
+		self.assertEqual(max_page_id, 3)
+		self.assertEqual(self.sql_driver.update_page_summaries(max_page_id), 2)
+		self.assertEqual(self.get_summarized_page_ids(), [1, 3])
+
+		# then it is stored, until it is summarized it is left out of the reports
+		self.sql_driver.commit_query('INSERT INTO page SELECT * FROM late_page')
+		self.assertEqual([page[0] for page in self.sql_driver.get_report_pages(max_page_id)], [1, 3])
+
+		self.assertEqual(self.sql_driver.get_max_page_id(), 3)
+		self.assertEqual(self.sql_driver.update_page_summaries(max_page_id), 1)
+		self.assertEqual(self.get_summarized_page_ids(), [1, 2, 3])
+		self.assertEqual([page[0] for page in self.sql_driver.get_report_pages(max_page_id)], [1, 2, 3])
+
+		# and it matches what we get by summarizing everything in one go
+		summaries = sorted(self.sql_driver.get_page_summaries())
+		element_summaries = sorted(self.sql_driver.get_page_element_summaries(), key=str)
+		owner_summaries = sorted(self.sql_driver.get_page_owner_summaries())
+		self.assertIn(2, [page_id for page_id, is_3p, received, is_ssl, element_count, body_size in element_summaries])
+
+		self.sql_driver.reset_page_summaries()
+		self.assertEqual(self.sql_driver.update_page_summaries(max_page_id), 3)
+		self.assertEqual(sorted(self.sql_driver.get_page_summaries()), summaries)
+		self.assertEqual(sorted(self.sql_driver.get_page_element_summaries(), key=str), element_summaries)
+		self.assertEqual(sorted(self.sql_driver.get_page_owner_summaries()), owner_summaries)
+
+		# nothing left to do
+		self.assertEqual(self.sql_driver.update_page_summaries(max_page_id), 0)
+	# test_out_of_order_page
+# TestPageSummaries
+
+class TestDomainIdCache(unittest.TestCase):
+	"""
+	domain ids added in a transaction are only cached once it commits, sqlite
+		hands out the same id again after a rollback so a cached one would
+		point at whichever domain gets it next
+	"""
+	def setUp(self):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.sql_driver = get_temp_sqlite_driver(self.tmp_dir)
+	# setUp
+
+	def tearDown(self):
+		self.sql_driver.close()
+		shutil.rmtree(self.tmp_dir, ignore_errors=True)
+	# tearDown
+
+	def add_domain(self, fqdn):
+		return self.sql_driver.add_domain(None, fqdn, fqdn, 'com', 'com')
+	# add_domain
+
+	def get_fqdn(self, domain_id):
+		return self.sql_driver.fetch_query('SELECT fqdn FROM domain WHERE id = %s' % domain_id)[0][0]
+	# get_fqdn
+
+	def test_rollback(self):
+		self.sql_driver.start_transaction()
+		rolled_back_id = self.add_domain('rolledback.com')
+		self.assertEqual(self.add_domain('rolledback.com'), rolled_back_id)
+		self.assertIsNone(self.sql_driver.get_cached_domain_id('rolledback.com'))
+		self.sql_driver.rollback()
+		self.assertIsNone(self.sql_driver.get_cached_domain_id('rolledback.com'))
+
+		# the id is reused by the next domain
+		self.sql_driver.start_transaction()
+		committed_id = self.add_domain('committed.com')
+		self.sql_driver.commit()
+		self.assertEqual(committed_id, rolled_back_id)
+		self.assertEqual(self.sql_driver.get_cached_domain_id('committed.com'), committed_id)
+
+		# so the rolled back domain has to get a new one
+		domain_id = self.add_domain('rolledback.com')
+		self.assertNotEqual(domain_id, committed_id)
+		self.assertEqual(self.get_fqdn(domain_id), 'rolledback.com')
+		self.assertEqual(self.get_fqdn(committed_id), 'committed.com')
+	# test_rollback
+# TestDomainIdCache
+
+class TestStreamQuery(StreamQueryTests, unittest.TestCase):
+	param = '?'
+
+	def setUp(self):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.sql_driver = get_temp_sqlite_driver(self.tmp_dir)
+	# setUp
+
+	def tearDown(self):
+		self.sql_driver.close()
+		shutil.rmtree(self.tmp_dir, ignore_errors=True)
+	# tearDown
+
+	def test_interleaved(self):
+		# the stream has its own cursor so the driver's may be used as we read
+		page_ids = self.add_pages()
+		streamed_ids = []
+		for page_id, in self.sql_driver.stream_query('SELECT id FROM page ORDER BY id', chunk_size=2):
+			streamed_ids.append(page_id)
+			self.assertEqual(self.sql_driver.fetch_query('SELECT COUNT(*) FROM page')[0][0], 5)
+		self.assertEqual(streamed_ids, page_ids)
+	# test_interleaved
+# TestStreamQuery
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,152 @@
+# standard python libs
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from driver_fixtures import get_temp_sqlite_driver
+from webxray.SQLiteDriver import SQLiteDriver
+from webxray.WorkQueue import WorkQueue
+
+URLS = ['https://site%s.com/' % site_num for site_num in range(3)]
+
+class WorkQueueDriverTests:
+	"""
+	the lease queries for each driver, mixed in with a TestCase which sets up 
+		self.sql_driver on an empty db
+
+	a negative lease_seconds gives a lease which has already run out, the same
+		as a node which went away
+	"""
+	def get_states(self):
+		return dict(self.sql_driver.fetch_query('SELECT url, state FROM work_queue'))
+	# get_states
+
+	def test_lease(self):
+		self.sql_driver.add_work_queue_urls(URLS)
+		self.sql_driver.add_work_queue_urls(URLS[:1])
+		self.assertEqual(self.sql_driver.lease_work_queue_urls('a', 2, 300, 3), URLS[:2])
+		self.assertEqual(self.sql_driver.lease_work_queue_urls('b', 2, 300, 3), URLS[2:])
+		self.assertEqual(self.sql_driver.lease_work_queue_urls('b', 2, 300, 3), [])
+		self.assertEqual(self.sql_driver.get_work_queue_counts(3), {'queued': 0, 'leased': 3, 'done': 0, 'failed': 0})
+
+		self.sql_driver.finish_work_queue_url('a', URLS[0], True, 3)
+		self.assertEqual(self.sql_driver.get_work_queue_counts(3), {'queued': 0, 'leased': 2, 'done': 1, 'failed': 0})
+	# test_lease
+
+	def test_expiry(self):
+		self.sql_driver.add_work_queue_urls(URLS[:2])
+		self.assertEqual(self.sql_driver.lease_work_queue_urls('a', 2, -1, 3), URLS[:2])
+		self.assertEqual(self.sql_driver.get_work_queue_counts(3), {'queued': 2, 'leased': 0, 'done': 0, 'failed': 0})
+
+		# a renewed lease is kept, the other goes to the next node
+		self.sql_driver.renew_work_queue_leases('a', URLS[:1], 300)
+		self.assertEqual(self.sql_driver.lease_work_queue_urls('b', 2, 300, 3), URLS[1:2])
+
+		# so a finish from a node which lost the lease is ignored
+		self.sql_driver.finish_work_queue_url('a', URLS[1], True, 3)
+		self.assertEqual(self.get_states()[URLS[1]], 'leased')
+		self.sql_driver.finish_work_queue_url('b', URLS[1], True, 3)
+		self.assertEqual(self.get_states()[URLS[1]], 'done')
+	# test_expiry
+
+	def test_max_attempts_expired(self):
+		self.sql_driver.add_work_queue_urls(URLS[:1])
+		for attempt in range(2):
+			self.assertEqual(self.sql_driver.lease_work_queue_urls('a', 1, -1, 2), URLS[:1])
+
+		# out of attempts
+		self.assertEqual(self.sql_driver.get_work_queue_counts(2), {'queued': 0, 'leased': 0, 'done': 0, 'failed': 1})
+		self.assertEqual(self.sql_driver.lease_work_queue_urls('b', 1, 300, 2), [])
+		self.assertEqual(self.get_states(), {URLS[0]: 'failed'})
+	# test_max_attempts_expired
+
+	def test_max_attempts_not_stored(self):
+		self.sql_driver.add_work_queue_urls(URLS[:1])
+		self.assertEqual(self.sql_driver.lease_work_queue_urls('a', 1, 300, 2), URLS[:1])
+		self.sql_driver.finish_work_queue_url('a', URLS[0], False, 2)
+		self.assertEqual(self.get_states(), {URLS[0]: 'queued'})
+
+		self.assertEqual(self.sql_driver.lease_work_queue_urls('b', 1, 300, 2), URLS[:1])
+		self.sql_driver.finish_work_queue_url('b', URLS[0], False, 2)
+		self.assertEqual(self.get_states(), {URLS[0]: 'failed'})
+		self.assertEqual(self.sql_driver.lease_work_queue_urls('b', 1, 300, 2), [])
+	# test_max_attempts_not_stored
+# WorkQueueDriverTests
+
+class TestSQLiteWorkQueue(WorkQueueDriverTests, unittest.TestCase):
+	def setUp(self):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.sql_driver = get_temp_sqlite_driver(self.tmp_dir)
+	# setUp
+
+	def tearDown(self):
+		self.sql_driver.close()
+		shutil.rmtree(self.tmp_dir, ignore_errors=True)
+	# tearDown
+# TestSQLiteWorkQueue
+
+class TempWorkQueue(WorkQueue):
+	"""
+	uses the db made by get_temp_sqlite_driver
+	"""
+	def __init__(self, tmp_dir, **kwargs):
+		super().__init__('sqlite', 'unittest', **kwargs)
+		self.tmp_dir = tmp_dir
+	# __init__
+
+	def get_sql_driver(self):
+		sql_driver = SQLiteDriver()
+		sql_driver.db_root_path = self.tmp_dir+'/'
+		sql_driver.db_switch('unittest')
+		return sql_driver
+	# get_sql_driver
+# TempWorkQueue
+
+class TestWorkQueue(unittest.TestCase):
+	"""
+	two collectors sharing one queue, the second picks up what the first 
+		leaves behind
+	"""
+	def setUp(self):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.sql_driver = get_temp_sqlite_driver(self.tmp_dir)
+	# setUp
+
+	def tearDown(self):
+		self.sql_driver.close()
+		shutil.rmtree(self.tmp_dir, ignore_errors=True)
+	# tearDown
+
+	def get_work_queue(self, lease_seconds=300):
+		work_queue = TempWorkQueue(self.tmp_dir, lease_seconds=lease_seconds, lease_batch_size=2, max_attempts=2)
+		self.addCleanup(work_queue.stop)
+		return work_queue
+	# get_work_queue
+
+	def test_re_lease(self):
+		self.assertEqual(self.get_work_queue().enqueue(URLS), 3)
+
+		# this one goes away without finishing anything
+		gone_queue = self.get_work_queue(lease_seconds=-1)
+		gone_urls = gone_queue.get_leased_urls()
+		self.assertEqual([next(gone_urls), next(gone_urls)], URLS[:2])
+
+		# the other takes over those pages, the last isn't stored and comes back
+		work_queue = self.get_work_queue()
+		leased_urls = []
+		for url in work_queue.get_leased_urls():
+			leased_urls.append(url)
+			work_queue.finish(url, page_stored=(url != URLS[2]))
+		self.assertEqual(leased_urls, URLS+URLS[2:])
+
+		# it was out of attempts the second time
+		self.assertEqual(work_queue.get_counts(), {'queued': 0, 'leased': 0, 'done': 2, 'failed': 1})
+	# test_re_lease
+# TestWorkQueue
+
+if __name__ == '__main__':
+	unittest.main()
@@ -3,12 +3,16 @@ import os
 import re
 import csv
 import json
+import hashlib
 import operator
 import statistics
 import collections
 from datetime import datetime
 from operator import itemgetter
 
+# custom webxray classes
+from webxray.ReportModel import ReportModel
+
 class Analyzer:
 	"""
 	webXray stores data in a relational db, but that isn't human-readable
@@ -50,7 +54,7 @@ class Analyzer:
 			self.sql_driver = MySQLDriver(self.db_name)
 		elif self.db_engine == 'sqlite':
 			from webxray.SQLiteDriver import SQLiteDriver
-			self.sql_driver = SQLiteDriver(self.db_name)
+			self.sql_driver = SQLiteDriver(self.db_name, profile='analysis')
 		elif db_engine == 'postgres':
 			from webxray.PostgreSQLDriver import PostgreSQLDriver
 			self.sql_driver = PostgreSQLDriver(self.db_name)
@@ -58,9 +62,6 @@ class Analyzer:
 			print('INVALID DB ENGINE FOR %s, QUITTING!' % db_engine)
 			exit()
 		
-		# this is reused often, do it once to save time
-		self.get_pages_ok_count		= self.sql_driver.get_pages_ok_count()
-
 		print('\t=============================')
 		print('\t Checking Output Directories ')
 		print('\t=============================')				
@@ -71,16 +72,60 @@ class Analyzer:
 		print('\t Patching Domain Owner Data ')
 		print('\t============================')
 
+		# the domain_owner_closure table is part of the current schema
+		if self.sql_driver.migrate_db():
+			print('\t\tMigrated %s to the current schema' % self.db_name)
+
+		domain_owners_patched = False
 		if flush_owner_db:
 			# update the domains to their owners in the db, can be overridden
 			#	by changing flush_owner_db to false
-			self.patch_domain_owners()
+			domain_owners_patched = self.patch_domain_owners()
 		else:
 			print('\t\t\tSkipping')
 
 		# this is used in various places to get owner information
 		self.domain_owners = self.get_domain_owner_dict()
 
+		# the reports look up the lineage of owners over and over, so we
+		#	work them out once here
+		self.load_domain_owner_lineages()
+
+		# the closure table follows the domain_owner table, so it is rebuilt
+		#	whenever we patch, or filled in if the db was made before it existed
+		if domain_owners_patched or self.sql_driver.get_domain_owner_closure_count() == 0:
+			self.sql_driver.set_domain_owner_closure(self.get_domain_owner_closure_rows())
+
+		# totals for each page are kept in the db, so on a db we have analyzed
+		#	before only the pages added since need to be gone through, if the
+		#	owners have changed they are all redone
+		print('\t=========================')
+		print('\t Updating Page Summaries ')
+		print('\t=========================')
+		self.max_page_id = self.update_page_summaries(reset = domain_owners_patched)
+
+		# the reports are worked out from the tables held in memory rather than
+		#	running their own queries, the elements are only read in once a 
+		#	report needs them, see load_report_elements
+		print('\t=====================')
+		print('\t Loading Report Data ')
+		print('\t=====================')
+		print('\t\tProcessing...', end='', flush=True)
+		self.report_model = ReportModel(self.sql_driver, self.max_page_id)
+		print('done!')
+
+		# these are reused often, do them once to save time
+		self.get_pages_ok_count	= self.report_model.get_page_count()
+		self.page_tlds			= self.report_model.get_page_tlds()
+		self.element_counts		= collections.Counter()
+		for is_3p, received, is_ssl, element_count in zip(
+			self.report_model.element_summary_is_3p, 
+			self.report_model.element_summary_received, 
+			self.report_model.element_summary_is_ssl,
+			self.report_model.element_summary_count
+		):
+			self.element_counts[(is_3p, received, is_ssl)] += element_count
+
 		# if we want to get sub-reports for the most frequent tlds we find
 		#	them here
 		if self.num_tlds:
@@ -97,6 +142,13 @@ class Analyzer:
 			# othewise we push in a single empty entry
 			self.top_tlds.append((None,self.get_pages_ok_count))
 
+		# the per-tld reports are worked out for every tld in a single pass, so
+		#	for each page we note which tld groups it counts towards
+		self.page_tld_groups	= self.get_page_tld_groups()
+		self.tld_page_counts	= collections.Counter()
+		for tld_groups in self.page_tld_groups:
+			self.tld_page_counts.update(tld_groups)
+
 		# SPECIAL FEATURE FOR EXPERTS: tracker domain filter
 		#
 		# you can set a threshold of the number of sites a given 3p domain 
@@ -127,6 +179,14 @@ class Analyzer:
 		else:
 			# set to None so various downstream operations get skipped
 			self.tracker_domains = None
+
+		# the string ids of the tracker domains for checking against the report model,
+		#	None if we aren't filtering, which is also the case when the threshold
+		#	left us with no tracker domains
+		if self.tracker_domains:
+			self.tracker_domain_ids = set([self.report_model.get_string_id(domain) for domain in self.tracker_domains])
+		else:
+			self.tracker_domain_ids = None
 	# __init__
 
 	#################
@@ -192,23 +252,38 @@ class Analyzer:
 		"""
 		in order to analyze what entities receive user data, we need to update
 		  the database with domain ownership records we have stored previously
+
+		the md5 of the json file we patched with is kept in the meta table, if the
+			file hasn't changed there is no need to flush, we only link up
+			domains which have been added since
+
+		returns True if the owners were flushed and patched
 		"""
 
-		# we first clear out what is the db in case the new data has changed, 
-		# 	on big dbs takes a while
-		print('\t\tFlushing extant domain owner data...', end='', flush=True)
-		self.sql_driver.reset_domain_owners()
-		print('done!')
+		# pull the owner/domain pairings from the json file in the resources dir
+		domain_owner_file_path = os.path.dirname(os.path.abspath(__file__))+'/resources/domain_owners/domain_owners.json'
+		with open(domain_owner_file_path, 'rb') as domain_owner_file:
+			domain_owner_json = domain_owner_file.read()
+		domain_owner_md5	= hashlib.md5(domain_owner_json).hexdigest()
+		domain_owner_data	= json.loads(domain_owner_json.decode('utf-8'))
+
+		owner_domains = []
+		for item in domain_owner_data:
+			for domain in item['domains']:
+				owner_domains.append((item['id'], domain))
 
-		# next we pull the owner/domain pairings from the json file in 
-		# 	the resources dir and add to the db
-		print('\t\tPatching with new domain owner data...', end='', flush=True)
-		domain_owner_data = json.load(open(os.path.dirname(os.path.abspath(__file__))+'/resources/domain_owners/domain_owners.json', 'r', encoding='utf-8'))
+		if self.sql_driver.get_meta('domain_owners_md5') == domain_owner_md5:
+			print('\t\tDomain owner data unchanged, patching new domains...', end='', flush=True)
+			self.sql_driver.update_domain_owners(owner_domains, unowned_only=True)
+			print('done!')
+			return False
+
+		domain_owners = []
 		for item in domain_owner_data:
 			aliases = ''
 			for alias in item['aliases']:
 				aliases += '<<' + alias + '>>'
-			self.sql_driver.add_domain_owner(
+			domain_owners.append((
 				item['id'], 
 				item['parent_id'],
 				item['owner_name'], 
@@ -217,12 +292,58 @@ class Analyzer:
 				item['privacy_policy_url'],
 				item['notes'], 
 				item['country']
-			)
-			for domain in item['domains']:
-				self.sql_driver.update_domain_owner(item['id'], domain)
+			))
+
+		# we clear out what is in the db in case the new data has changed and 
+		#	add the new data in a single transaction, so if something goes wrong 
+		#	the old data is still there
+		print('\t\tFlushing and patching domain owner data...', end='', flush=True)
+		self.sql_driver.start_transaction()
+		try:
+			self.sql_driver.reset_domain_owners()
+			self.sql_driver.add_domain_owners(domain_owners)
+			self.sql_driver.update_domain_owners(owner_domains)
+			self.sql_driver.set_meta('domain_owners_md5', domain_owner_md5)
+			self.sql_driver.commit()
+		except:
+			self.sql_driver.rollback()
+			raise
 		print('done!')
+		return True
 	# patch_domain_owners
 
+	def update_page_summaries(self, reset = False):
+		"""
+		adds the pages which have not been summarized yet to the page summary 
+			tables, with reset the summaries are thrown out and every page is 
+			done again
+
+		the per-page reports are worked out from these rather than the elements,
+			so re-running the analysis on a growing db only costs as much as
+			the pages added since
+
+		we don't keep track of the last page id done as with several collectors
+			writing at once a page with a lower id may be stored after a higher 
+			one, any page without a summary is picked up on the next run
+
+		returns the highest page id when we started, pages added while we are 
+			running are left for next time
+		"""
+		max_page_id = self.sql_driver.get_max_page_id()
+
+		print('\t\tSummarizing new pages...', end='', flush=True)
+		self.sql_driver.start_transaction()
+		try:
+			if reset: self.sql_driver.reset_page_summaries()
+			page_count = self.sql_driver.update_page_summaries(max_page_id)
+			self.sql_driver.commit()
+		except:
+			self.sql_driver.rollback()
+			raise
+		print('done, %s pages summarized' % page_count)
+		return max_page_id
+	# update_page_summaries
+
 	def get_domain_owner_dict(self):
 		"""
 		read out everything in the domain_owner table into a dictionary
@@ -256,14 +377,58 @@ class Analyzer:
 		return domain_owners
 	# get_domain_owner_dict
 
+	def load_domain_owner_lineages(self):
+		"""
+		for every owner in self.domain_owners works out:
+			- its lineage, a tuple of its id followed by those of its parents
+			- the lineage as a single string, eg 'DoubleClick > Google > Alphabet '
+			- the set of ids of all its children/subsidiaries
+
+		these never change during a run so the helpers below just look them up
+		"""
+		self.domain_owner_lineage_ids			= {}
+		self.domain_owner_lineage_combined_strings	= {}
+		self.domain_owner_child_ids					= {}
+
+		for owner_id in self.domain_owners:
+			# a parent we don't have, or one already in the lineage, ends it
+			lineage_ids = [owner_id]
+			parent_id = self.domain_owners[owner_id]['parent_id']
+			while parent_id in self.domain_owners and parent_id not in lineage_ids:
+				lineage_ids.append(parent_id)
+				parent_id = self.domain_owners[parent_id]['parent_id']
+			self.domain_owner_lineage_ids[owner_id] = tuple(lineage_ids)
+
+			lineage_string = ''
+			for lineage_id in lineage_ids:
+				lineage_string += self.domain_owners[lineage_id]['owner_name'] + ' > '
+			self.domain_owner_lineage_combined_strings[owner_id] = lineage_string[:-2]
+
+			self.domain_owner_child_ids[owner_id] = set()
+
+		# each owner is a child of everything above it in its lineage
+		for owner_id, lineage_ids in self.domain_owner_lineage_ids.items():
+			for parent_id in lineage_ids[1:]:
+				self.domain_owner_child_ids[parent_id].add(owner_id)
+	# load_domain_owner_lineages
+
+	def get_domain_owner_closure_rows(self):
+		"""
+		returns (ancestor_id, descendant_id, depth) for every owner and each
+			owner in its lineage, this is what goes in the domain_owner_closure table
+		"""
+		closure_rows = []
+		for owner_id, lineage_ids in self.domain_owner_lineage_ids.items():
+			for depth, ancestor_id in enumerate(lineage_ids):
+				closure_rows.append((ancestor_id, owner_id, depth))
+		return closure_rows
+	# get_domain_owner_closure_rows
+
 	def get_domain_owner_lineage_ids(self, id):
 		"""
-		for a given domain owner id, return the list which corresponds to its ownership lineage
+		for a given domain owner id, return the tuple which corresponds to its ownership lineage
 		"""
-		if self.domain_owners[id]['parent_id'] == None:
-			return [id]
-		else:
-			return [id] + self.get_domain_owner_lineage_ids(self.domain_owners[id]['parent_id'])
+		return self.domain_owner_lineage_ids[id]
 	# get_domain_owner_lineage_ids
 
 	def get_domain_owner_lineage_strings(self,owner_id,get_aliases=False):
@@ -287,49 +452,29 @@ class Analyzer:
 		given an owner_id this function returns a single string
 			which is the full lineage of ownership
 		"""
-		lineage_string = ''
-		for item in self.get_domain_owner_lineage_strings(owner_id):
-			lineage_string += item[1] + ' > '
-		return lineage_string[:-2]
+		return self.domain_owner_lineage_combined_strings[owner_id]
 	# get_domain_owner_lineage_combined_string
 
 	def get_domain_owner_child_ids(self,id):
 		"""
-		for a given owner id, get all of its children/subsidiaries
+		for a given owner id, get the set of all of its children/subsidiaries
 		"""
-		
-		# first get all the children ids if they exist
-		child_ids = []
-		for item in self.domain_owners:
-			if self.domain_owners[item]['parent_id'] == id:
-				child_ids.append(item)
-
-		# if we have children, call recursively
-		if len(child_ids) > 0:
-			for child_id in child_ids:
-				child_ids.extend(self.get_domain_owner_child_ids(child_id))
-
-		# return an empty list if no children
-		return child_ids
+		return self.domain_owner_child_ids[id]
 	# get_domain_owner_child_ids
 
 	def get_top_tlds(self, limit):
 		"""
 		finds the most common tlds from all the pages
-		type is default to tld, but pubsuffix also works
 
 		returns list of tlds
 		"""
 
-		tlds = []
-
-		for row in self.sql_driver.get_all_tlds():
-			tlds.append(row[0])
+		tld_counts = collections.Counter(self.page_tlds)
 
-		top_tlds = collections.Counter(tlds).most_common()
-	
 		# cut the list to the limit
-		top_tlds = top_tlds[0:limit]
+		top_tlds = []
+		for tld_id, pages in tld_counts.most_common()[0:limit]:
+			top_tlds.append((self.report_model.get_string(tld_id), pages))
 
 		# push in entry for all tlds
 		top_tlds.insert(0, (None,self.get_pages_ok_count))
@@ -346,9 +491,23 @@ class Analyzer:
 		
 		returns a list of domains which link at least the threshold number of sites
 		"""
+		self.load_report_elements()
+		report_model = self.report_model
+
+		# all the distinct pairs of page domain and element domain, pages 
+		#	with no elements are paired with None
+		page_domain_element_domains = set()
+		pages_with_elements = bytearray(self.get_pages_ok_count)
+		for page, element_domain in zip(report_model.element_page, report_model.element_domain):
+			page_domain_element_domains.add((report_model.domain_domain[report_model.page_domain[page]], report_model.domain_domain[element_domain]))
+			pages_with_elements[page] = 1
+		for page, has_elements in enumerate(pages_with_elements):
+			if not has_elements:
+				page_domain_element_domains.add((report_model.domain_domain[report_model.page_domain[page]], -1))
+
 		all_domains = []
-		for page_domain_element_domain in self.sql_driver.get_page_domain_element_domain_pairs():
-			all_domains.append(page_domain_element_domain[1])
+		for page_domain, element_domain in page_domain_element_domains:
+			all_domains.append(report_model.get_string(element_domain))
 
 		# count up all the pairs, convert to items() so can process as tuples
 		domain_counts = collections.Counter(all_domains).items()
@@ -377,127 +536,163 @@ class Analyzer:
 	# 	REPORT HELPERS	#
 	#####################
 
-	def get_3p_domain_stats(self, num_pages, tld_filter = None):
+	def load_report_elements(self):
 		"""
-		determines basic stats for the number of 3p domains contacted per-page
-		
-		note this is distinct domain+pubsuffix, not fqdns (e.g. 'sub.example.com' 
-			and sub2.example.com' only count as 'example.com')
-
-		if tracker_domains have been set the stats will reflect only third-parties
-			which have crossed the threshold (see get_tracker_domains())
-		"""
-
-		# each page id corresponds to a list of domains belonging to page elements
-		page_id_to_domains_dict = {}
-
-		# run query to get all page id, page domain, and element domain entries
-		# there is no third-party filter so each page will have at least one entry for first-party domain
-		for row in self.sql_driver.get_page_id_3p_element_domain_pairs(tld_filter):
-			page_id 		= row[0]
-			element_domain 	= row[1]
-
-			# if the page id is not yet seen enter the current element as a fresh list
-			#	otherwise, we add to the existing list
-			# in both cases, if there is a tracker_domain list we only add
-			#	domains that are in the list
-			if page_id not in page_id_to_domains_dict:
-				if self.tracker_domains:
-					if element_domain in self.tracker_domains:
-						page_id_to_domains_dict[page_id] = [element_domain]
-				else:
-					page_id_to_domains_dict[page_id] = [element_domain]
-			else:
-				if self.tracker_domains:
-					if element_domain in self.tracker_domains:
-						page_id_to_domains_dict[page_id] = page_id_to_domains_dict[page_id] + [element_domain]
-				else:
-					page_id_to_domains_dict[page_id] = page_id_to_domains_dict[page_id] + [element_domain]
-
-		# now we determine the number of domains each page is connected to by looking at len of list of 3p domains
-		per_page_3p_element_counts = []
-		for page_id in page_id_to_domains_dict:
-			per_page_3p_element_counts.append(len(page_id_to_domains_dict[page_id]))
-
-		# pages that have no 3p elements are not yet in our counts
-		# 	so for all uncounted pages we add in zeros
-		uncounted_pages = num_pages - len(per_page_3p_element_counts)
-		while uncounted_pages > 0:
-			uncounted_pages -= 1
-			per_page_3p_element_counts.append(0)
-
-		# mean and median should always be ok
-		mean 	= statistics.mean(per_page_3p_element_counts)
-		median 	= statistics.median(per_page_3p_element_counts)
-
-		# but mode can throw an error, so catch here
-		try:
-			mode = statistics.mode(per_page_3p_element_counts)
-		except:
-			mode = None
-
-		return(mean, median, mode)
-	# get_3p_domain_stats
+		reads the elements and cookies into the report model if they aren't 
+			already, call before going through report_model.element_* or cookie_*
+		"""
+		if self.report_model.elements_loaded: return
+		print('\t\tLoading elements...', end='', flush=True)
+		self.report_model.load_elements(self.sql_driver)
+		print('done!')
+	# load_report_elements
 
-	def get_3p_cookie_stats(self, num_pages, tld_filter = None):
+	def get_tld_pages(self, tld_filter = None):
+		"""
+		returns a bytearray with a 1 for each page whose domain is in the tld,
+			or None if there is no filter, so loops over the report model can
+			skip pages outside the tld with 'tld_pages[page]'
 		"""
-		determines basic stats for the number of 3p cookies contacted per-page
-			note that a single 3p many set more than one cookie
+		if tld_filter is None: return None
+		tld_id = self.report_model.get_string_id(tld_filter)
+		return bytearray([page_tld == tld_id for page_tld in self.page_tlds])
+	# get_tld_pages
 
-		if tracker_domains have been set the stats will reflect only third-parties
-			which have crossed the threshold (see get_tracker_domains())
+	def get_tld_page_count(self, tld_filter = None):
+		"""
+		the number of pages in the tld, or all pages if there is no filter
 		"""
+		if tld_filter is None: return self.get_pages_ok_count
+		return sum(self.get_tld_pages(tld_filter))
+	# get_tld_page_count
 
-		# each page id corresponds to a list of cookie ids
-		page_id_to_cookie_id_dict = {}
+	def get_request_count(self, received = False, party = None, is_ssl = False):
+		"""
+		count of requests, can be filtered by party (first or third), if the
+			element was received, and if it was requested over ssl
+		"""
+		request_count = 0
+		for (element_is_3p, element_received, element_is_ssl), count in self.element_counts.items():
+			if received and element_received != 1: continue
+			if party == 'third' and element_is_3p != 1: continue
+			if party == 'first' and element_is_3p != 0: continue
+			if is_ssl and element_is_ssl != 1: continue
+			request_count += count
+		return request_count
+	# get_request_count
+
+	def get_page_tld_groups(self):
+		"""
+		returns a list with the tld groups each page counts towards in the per-tld
+			reports, all pages are in the None group and pages in one of the
+			top tlds are also in that tld's group, eg (None, 'com')
 
-		# run query to get all page id, 3p cookie id, 3p cookie domain entries
-		for row in self.sql_driver.get_page_id_3p_cookie_id_3p_cookie_domain(tld_filter):
-			page_id 		= row[0]
-			cookie_id		= row[1]
-			cookie_domain 	= row[2]
+		as there are only a few distinct tuples the pages share them
+		"""
+		report_tlds = set([tld for tld, pages in self.top_tlds if tld])
+		tld_groups	= {-1: (None,)}
+		for tld_id in set(self.page_tlds):
+			tld = self.report_model.get_string(tld_id)
+			if tld in report_tlds:
+				tld_groups[tld_id] = (None, tld)
+			else:
+				tld_groups[tld_id] = (None,)
+		return [tld_groups[tld_id] for tld_id in self.page_tlds]
+	# get_page_tld_groups
 
-			# if the page id is not yet seen enter the current cookie id as a fresh list
-			#	otherwise, we add to the existing list
-			# in both cases, if there is a tracker_domain list we do not count cookies
-			#	set by domains which are not trackers 
-			if page_id not in page_id_to_cookie_id_dict:
-				if self.tracker_domains:
-					if cookie_domain in self.tracker_domains:
-						page_id_to_cookie_id_dict[page_id] = [cookie_id]
-				else:
-					page_id_to_cookie_id_dict[page_id] = [cookie_id]
+	def get_page_3p_counts(self):
+		"""
+		returns:
+			- a dict of the number of distinct 3p domains on each page with third-party 
+				elements, note this is distinct domain+pubsuffix, not fqdns (e.g.
+				'sub.example.com' and sub2.example.com' only count as 'example.com')
+			- the set of pages with third-party javascript
+			- a dict of the number of 3p cookies on each page which has any, note
+				that a single 3p may set more than one cookie
+
+		these come from the page summaries, unless tracker_domains have been set,
+			in which case only third-parties which have crossed the threshold count
+			(see get_tracker_domains()) so we go through the elements
+		"""
+		report_model = self.report_model
+
+		page_3p_domain_counts	= {}
+		pages_with_3p_js		= set()
+		page_3p_cookie_counts	= {}
+
+		if self.tracker_domain_ids is None:
+			pages_with_3p_elements = set()
+			for page, is_3p, element_count in zip(report_model.element_summary_page, report_model.element_summary_is_3p, report_model.element_summary_count):
+				if is_3p == 1 and element_count > 0:
+					pages_with_3p_elements.add(page)
+
+			for page in range(self.get_pages_ok_count):
+				if page in pages_with_3p_elements:
+					page_3p_domain_counts[page] = report_model.page_3p_domain_count[page]
+				if report_model.page_3p_javascript_count[page] > 0:
+					pages_with_3p_js.add(page)
+				if report_model.page_3p_cookie_count[page] > 0:
+					page_3p_cookie_counts[page] = report_model.page_3p_cookie_count[page]
+
+			return (page_3p_domain_counts, pages_with_3p_js, page_3p_cookie_counts)
+
+		self.load_report_elements()
+		javascript_id = report_model.get_string_id('javascript')
+
+		# each page corresponds to the set of domains belonging to its 3p elements
+		page_to_domains_dict = {}
+		for page, domain, is_3p, element_type in zip(report_model.element_page, report_model.element_domain, report_model.element_is_3p, report_model.element_type):
+			if is_3p != 1: continue
+			element_domain = report_model.domain_domain[domain]
+			if element_domain not in self.tracker_domain_ids: continue
+
+			if page not in page_to_domains_dict:
+				page_to_domains_dict[page] = set()
+			page_to_domains_dict[page].add(element_domain)
+			if element_type == javascript_id:
+				pages_with_3p_js.add(page)
+
+		for page in page_to_domains_dict:
+			page_3p_domain_counts[page] = len(page_to_domains_dict[page])
+
+		for page, domain in zip(report_model.cookie_page, report_model.cookie_domain):
+			if report_model.domain_domain[domain] not in self.tracker_domain_ids: continue
+
+			if page not in page_3p_cookie_counts:
+				page_3p_cookie_counts[page] = 1
 			else:
-				if self.tracker_domains:
-					if cookie_domain in self.tracker_domains:
-						page_id_to_cookie_id_dict[page_id] = page_id_to_cookie_id_dict[page_id] + [cookie_id]
-				else:
-					page_id_to_cookie_id_dict[page_id] = page_id_to_cookie_id_dict[page_id] + [cookie_id]
+				page_3p_cookie_counts[page] += 1
 
-		# determine the number of 3p cookies each page has by looking at len of list of cookie ids
-		per_page_3p_cookie_counts = []
-		for page_id in page_id_to_cookie_id_dict:
-			per_page_3p_cookie_counts.append(len(page_id_to_cookie_id_dict[page_id]))
+		return (page_3p_domain_counts, pages_with_3p_js, page_3p_cookie_counts)
+	# get_page_3p_counts
+
+	def get_per_page_stats(self, per_page_counts, num_pages):
+		"""
+		given the counts for each page which has any, returns the mean, median, and
+			mode across num_pages pages, the pages which are not in the list count
+			as zero
+		"""
+		per_page_counts = list(per_page_counts)
 
-		# pages that have no 3p cookies are not yet in our counts
-		# so for all uncounted pages we add in zeros
-		uncounted_pages = num_pages - len(per_page_3p_cookie_counts)
+		# pages that have nothing are not yet in our counts
+		# 	so for all uncounted pages we add in zeros
+		uncounted_pages = num_pages - len(per_page_counts)
 		while uncounted_pages > 0:
 			uncounted_pages -= 1
-			per_page_3p_cookie_counts.append(0)
+			per_page_counts.append(0)
 
 		# mean and median should always be ok
-		mean 	= statistics.mean(per_page_3p_cookie_counts)
-		median 	= statistics.median(per_page_3p_cookie_counts)
+		mean 	= statistics.mean(per_page_counts)
+		median 	= statistics.median(per_page_counts)
 
 		# but mode can throw an error, so catch here
 		try:
-			mode = statistics.mode(per_page_3p_cookie_counts)
+			mode = statistics.mode(per_page_counts)
 		except:
 			mode = None
 
 		return(mean, median, mode)
-	# get_3p_cookie_stats
+	# get_per_page_stats
 
 	#####################
 	# REPORT GENERATORS #
@@ -513,7 +708,7 @@ class Analyzer:
 		
 		csv_rows = []
 
-		total_pages_ok = self.sql_driver.get_pages_ok_count()
+		total_pages_ok = self.get_pages_ok_count
 
 		print("\t\tTotal Pages OK:\t\t\t%s" % total_pages_ok)
 	
@@ -540,20 +735,20 @@ class Analyzer:
 	
 		print('\t\t---')
 	
-		total_3p_cookies = self.sql_driver.get_total_cookie_count(is_3p = True)
+		total_3p_cookies = sum(self.report_model.page_3p_cookie_count)
 		print("\t\tTotal 3P Cookies:\t\t%s" % total_3p_cookies)
 		csv_rows.append(('Total Cookies', total_3p_cookies))
 
 		print('\t\t---')
 	
 		# see if we have both 1p/3p requests, if so show stats for all
-		total_1p_elements = self.sql_driver.get_total_request_count(party='first')
+		total_1p_elements = self.get_request_count(party='first')
 		if total_1p_elements > 0:
-			total_elements = self.sql_driver.get_total_request_count()
+			total_elements = self.get_request_count()
 			print("\t\tTotal Elements Requested:\t%s" % total_elements)
 			csv_rows.append(('Total Elements Requested', total_elements))
 
-			total_elements_received = self.sql_driver.get_total_request_count(received = True)
+			total_elements_received = self.get_request_count(received = True)
 			print("\t\tTotal Elements Received:\t%s" % total_elements_received)
 			csv_rows.append(('Total Elements Received', total_elements_received))
 
@@ -564,13 +759,13 @@ class Analyzer:
 			print('\t\t---')
 
 		# only 3p request/receive info - we always do this
-		total_3p_elements = self.sql_driver.get_total_request_count(party='third')
+		total_3p_elements = self.get_request_count(party='third')
 		print("\t\t3P Elements Requested:\t\t%s" % total_3p_elements)
 		csv_rows.append(('3P Elements Requested', total_3p_elements))
 
 		# avoid divide-by-zero if no 3p elements
 		if total_3p_elements > 0:
-			total_3p_elements_received = self.sql_driver.get_total_request_count(received = True, party='third')
+			total_3p_elements_received = self.get_request_count(received = True, party='third')
 			print("\t\t3P Elements Received:\t\t%s" % total_3p_elements_received)
 			csv_rows.append(('3P Elements Received', total_3p_elements_received))
 
@@ -590,56 +785,74 @@ class Analyzer:
 		print('\t Processing High-Level Stats ')
 		print('\t=============================')
 
+		page_3p_domain_counts, pages_with_3p_js, page_3p_cookie_counts = self.get_page_3p_counts()
+
+		# now add each page to the counts for its tlds, the lists keep the order
+		#	we first saw the pages in so ties for the mode go the same way as
+		#	they would doing one tld at a time
+		tld_3p_domain_counts	= {tld: [] for tld, pages in self.top_tlds}
+		tld_3p_cookie_counts	= {tld: [] for tld, pages in self.top_tlds}
+		tld_pages_js			= collections.Counter()
+		for page in page_3p_domain_counts:
+			for tld in self.page_tld_groups[page]:
+				tld_3p_domain_counts[tld].append(page_3p_domain_counts[page])
+		for page in page_3p_cookie_counts:
+			for tld in self.page_tld_groups[page]:
+				tld_3p_cookie_counts[tld].append(page_3p_cookie_counts[page])
+		for page in pages_with_3p_js:
+			tld_pages_js.update(self.page_tld_groups[page])
+
+		# these are the same for every tld
+		total_pages_ssl = self.report_model.page_is_ssl.count(1)
+
+		# elements info
+		total_elements_received 		= self.get_request_count(received = True)
+		total_elements_received_ssl		= self.get_request_count(received = True, is_ssl = True)
+
+		total_elements_received_1p 		= self.get_request_count(received = True, party='first')
+		total_elements_received_1p_ssl	= self.get_request_count(received = True, party='first', is_ssl = True)
+
+		total_elements_received_3p 		= self.get_request_count(received = True, party='third')
+		total_elements_received_3p_ssl	= self.get_request_count(received = True, party='third', is_ssl = True)
+
+		# pages with no load time are left out
+		all_load_times = [load_time for load_time in self.report_model.page_load_time if load_time != -1]
+		all_load_times_sum = 0
+		for load_time in all_load_times:
+			all_load_times_sum += load_time
+
+		average_page_load_time =  all_load_times_sum/len(all_load_times)
+
+		if self.tracker_threshold:
+			filter_depth = self.tracker_threshold
+		else:
+			filter_depth = 'No Filter Used'
+
 		for tld in self.top_tlds:
 			csv_rows = []
 	
 			if tld[0]:
-				tld_filter = tld[0]
 				file_name = tld[0]+'-stats.csv'
 			else:
-				tld_filter = None
 				file_name = 'stats.csv'
 
 			# page info
-			total_pages 			= self.sql_driver.get_complex_page_count(tld_filter)
+			total_pages 			= self.tld_page_counts[tld[0]]
 			total_pages_percent 	= (total_pages/self.get_pages_ok_count)*100
-			total_pages_elements 	= self.sql_driver.get_complex_page_count(tld_filter, 'elements', self.tracker_domains)
+			total_pages_elements 	= len(tld_3p_domain_counts[tld[0]])
 			percent_with_elements 	= (total_pages_elements/total_pages)*100
-			total_pages_cookies 	= self.sql_driver.get_complex_page_count(tld_filter, 'cookies', self.tracker_domains)
+			total_pages_cookies 	= len(tld_3p_cookie_counts[tld[0]])
 			percent_with_cookies 	= (total_pages_cookies/total_pages)*100
-			total_pages_js 			= self.sql_driver.get_complex_page_count(tld_filter, 'javascript', self.tracker_domains)
+			total_pages_js 			= tld_pages_js[tld[0]]
 			percent_with_js 		= (total_pages_js/total_pages)*100
-			total_pages_ssl 		= self.sql_driver.get_pages_ok_count(is_ssl = True)
 			percent_pages_ssl		= (total_pages_ssl/total_pages)*100
 
-			# elements info
-			total_elements_received 		= self.sql_driver.get_total_request_count(received = True)
-			total_elements_received_ssl		= self.sql_driver.get_total_request_count(received = True, is_ssl = True)
-
-			total_elements_received_1p 		= self.sql_driver.get_total_request_count(received = True, party='first')
-			total_elements_received_1p_ssl	= self.sql_driver.get_total_request_count(received = True, party='first', is_ssl = True)
-
-			total_elements_received_3p 		= self.sql_driver.get_total_request_count(received = True, party='third')
-			total_elements_received_3p_ssl	= self.sql_driver.get_total_request_count(received = True, party='third', is_ssl = True)
-
-			all_load_times = self.sql_driver.get_pages_load_times()
-			all_load_times_sum = 0
-			for load_time in all_load_times:
-				all_load_times_sum += load_time
-
-			average_page_load_time =  all_load_times_sum/len(all_load_times)
-
-			if self.tracker_threshold:
-				filter_depth = self.tracker_threshold
-			else:
-				filter_depth = 'No Filter Used'
-
-			domain_stats	= self.get_3p_domain_stats(total_pages, tld_filter)
+			domain_stats	= self.get_per_page_stats(tld_3p_domain_counts[tld[0]], total_pages)
 			domain_mean 	= domain_stats[0]
 			domain_median	= domain_stats[1]
 			domain_mode		= domain_stats[2]
 
-			cookie_stats 	= self.get_3p_cookie_stats(total_pages, tld_filter)
+			cookie_stats 	= self.get_per_page_stats(tld_3p_cookie_counts[tld[0]], total_pages)
 			cookie_mean 	= cookie_stats[0]
 			cookie_median	= cookie_stats[1]
 			cookie_mode		= cookie_stats[2]
@@ -692,54 +905,48 @@ class Analyzer:
 		print('\t Processing Aggregated Tracking Report ')
 		print('\t======================================')
 
-		for tld in self.top_tlds:
-			csv_rows = []
-			csv_rows.append(('Percentage Pages Tracked','Owner','Owner Country','Owner Lineage'))
+		# each page is a key which corresponds to a set of 
+		#	ids for entities which own the 3p element domains,
+		#	domains where the owner is not known are skipped,
+		#	these come from the page summaries
+		page_to_element_owners = {}
 
-			# will need this value to determine percentages later on
-			total_pages = self.sql_driver.get_complex_page_count(tld_filter=tld[0])
-
-			# list will have entry for each hit on a given entity
-			all_owner_occurances = []
+		report_model = self.report_model
+		for page, element_owner_id in zip(report_model.owner_summary_page, report_model.owner_summary_domain_owner_id):
+			if page not in page_to_element_owners:
+				page_to_element_owners[page] = set()
+			page_to_element_owners[page].add(element_owner_id)
 
-			# each page id is a key which corresponds to a list of 
-			#	ids for entities which own the 3p element domains
-			page_to_element_owners = {}
+		# counts each hit on a given entity for each tld
+		tld_owner_occurances = {tld: collections.Counter() for tld, pages in self.top_tlds}
 
-			# this query may produce a large volume of results!
-			results = self.sql_driver.get_all_page_id_3p_domain_owner_ids(tld_filter=tld[0])
+		# now that we have ids for each page, we can look up the lineage
+		#	to create the aggregate measure of how often entities appear
+		for item in page_to_element_owners:
 
-			# for each result we either create a new list, or extend the existing one
-			#	with the ids of the owners of the 3p elements
-			for item in results:
-				page_id = item[0]
-				element_owner_id = item[1]
+			# this is a set so items which appear more than once only get counted once
+			# reset this for each page
+			page_domain_owners = set()
 
-				if page_id not in page_to_element_owners:
-					page_to_element_owners[page_id] = [element_owner_id]
-				else:
-					page_to_element_owners[page_id] = page_to_element_owners[page_id] + [element_owner_id]
+			# we are operating on a list of ids which correspond to the owners of domains which get the data
+			for page_3p_owner_id in page_to_element_owners[item]:
+				# for each domain owner we also count all of its parents by getting the lineage
+				for lineage_id in self.get_domain_owner_lineage_ids(page_3p_owner_id):
+					page_domain_owners.add((lineage_id, self.domain_owners[lineage_id]['owner_name']))
 
-			# now that we have ids for each page, we can look up the lineage
-			#	to create the aggregate measure of how often entities appear
-			for item in page_to_element_owners:
+			# we have finished processing for this page so we add the owner ids to the counts
+			for tld in self.page_tld_groups[item]:
+				tld_owner_occurances[tld].update(page_domain_owners)
 
-				# this is a set so items which appear more than once only get counted once
-				# reset this for each page
-				page_domain_owners = set()
-
-				# we are operating on a list of ids which correspond to the owners of domains which get the data
-				for page_3p_owner_id in page_to_element_owners[item]:
-					# for each domain owner we also count all of its parents by getting the lineage
-					for lineage_id in self.get_domain_owner_lineage_ids(page_3p_owner_id):
-						page_domain_owners.add((lineage_id, self.domain_owners[lineage_id]['owner_name']))
+		for tld in self.top_tlds:
+			csv_rows = []
+			csv_rows.append(('Percentage Pages Tracked','Owner','Owner Country','Owner Lineage'))
 
-				# we have finished processing for this page so we add the owner ids to the full list
-				for owner_id in page_domain_owners:
-					all_owner_occurances.append(owner_id)
+			# will need this value to determine percentages later on
+			total_pages = self.tld_page_counts[tld[0]]
 
 			# write out data to csv
-			for item in self.get_most_common_sorted(all_owner_occurances):
+			for item in self.get_most_common_sorted(tld_owner_occurances[tld[0]]):
 				# we want to specify the parent name for each item, or if there is no parent, identify as such
 				parent_id = self.domain_owners[item[0][0]]['parent_id']
 				if parent_id:
@@ -776,21 +983,27 @@ class Analyzer:
 
 		csv_rows = []
 
+		# each owner corresponds to a list of [encrypted requests, all requests]
 		domain_owners_ssl_use_dict = {}
 
-		for item in self.sql_driver.get_3p_element_domain_owner_id_ssl_use():
-			child_domain_owner_id = item[0]
-			is_ssl = item[1]
+		self.load_report_elements()
+
+		# we only look at received third-party requests to domains whose owner we have
+		report_model = self.report_model
+		for domain, is_3p, received, is_ssl in zip(report_model.element_domain, report_model.element_is_3p, report_model.element_received, report_model.element_is_ssl):
+			if is_3p != 1 or received != 1: continue
+			child_domain_owner_id = report_model.domain_owner_id[domain]
+			if child_domain_owner_id not in self.domain_owners: continue
 
 			for domain_owner_id in self.get_domain_owner_lineage_ids(child_domain_owner_id):
 				if domain_owner_id not in domain_owners_ssl_use_dict:
-					domain_owners_ssl_use_dict[domain_owner_id] = [is_ssl]
-				else:
-					domain_owners_ssl_use_dict[domain_owner_id] = domain_owners_ssl_use_dict[domain_owner_id] + [is_ssl]
+					domain_owners_ssl_use_dict[domain_owner_id] = [0,0]
+				domain_owners_ssl_use_dict[domain_owner_id][0] += is_ssl
+				domain_owners_ssl_use_dict[domain_owner_id][1] += 1
 
 		for domain_owner_id in domain_owners_ssl_use_dict:
 			csv_rows.append((
-				round(100*(sum(domain_owners_ssl_use_dict[domain_owner_id])/len(domain_owners_ssl_use_dict[domain_owner_id])),self.num_decimals),
+				round(100*(domain_owners_ssl_use_dict[domain_owner_id][0]/domain_owners_ssl_use_dict[domain_owner_id][1]),self.num_decimals),
 				self.domain_owners[domain_owner_id]['owner_name'], 
 				self.domain_owners[domain_owner_id]['country'],
 				self.get_domain_owner_lineage_combined_string(domain_owner_id)
@@ -849,25 +1062,34 @@ class Analyzer:
 		print('\t Processing 3P Domains Report ')
 		print('\t==============================')
 
+		self.load_report_elements()
+
+		# each domain and owner is only counted once per page
+		report_model	= self.report_model
+		page_3p_domains	= set()
+		for page, domain, is_3p in zip(report_model.element_page, report_model.element_domain, report_model.element_is_3p):
+			if is_3p != 1: continue
+			page_3p_domains.add((page, report_model.domain_domain[domain], report_model.get_domain_owner_id(domain)))
+
+		tld_3p_domains = {tld: collections.Counter() for tld, pages in self.top_tlds}
+		for page, element_domain, domain_owner_id in page_3p_domains:
+			domain_and_owner = (report_model.get_string(element_domain), domain_owner_id)
+			for tld in self.page_tld_groups[page]:
+				tld_3p_domains[tld][domain_and_owner] += 1
+
 		for tld in self.top_tlds:
 			csv_rows = []
 			csv_rows.append(('Percent Total','Domain','Owner','Owner Country', 'Owner Lineage'))
 
 			if tld[0]:
-				tld_filter = tld[0]
 				file_name = tld[0]+'-3p_domains.csv'
 			else:
-				tld_filter = None
 				file_name = '3p_domains.csv'
 
 			total_pages = tld[1]
 
-			all_3p_domains = []
-			for item in self.sql_driver.get_3p_domain_owners(tld_filter):
-				all_3p_domains.append((item[1],item[2]))
-
 			# if num_results is None we get everything, otherwise stops at limit
-			for item in self.get_most_common_sorted(all_3p_domains)[:self.num_results]:
+			for item in self.get_most_common_sorted(tld_3p_domains[tld[0]])[:self.num_results]:
 				# this condition has to specify != None, b/c otherwise it will skip values of 0
 				if item[0][1] != None:
 					owner_name = self.domain_owners[item[0][1]]['owner_name']
@@ -906,7 +1128,36 @@ class Analyzer:
 			print('\t==============================')
 			print('\t Processing 3P Element Report ')
 			print('\t==============================')
-		
+
+		self.load_report_elements()
+
+		# each element is only counted once per page, the owner id is 
+		#	None if the owner is not in the domain_owner table
+		report_model	= self.report_model
+		element_type_id	= report_model.get_string_id(element_type)
+		page_3p_elements = set()
+		for page, domain, is_3p, this_element_type, extension, element_url in zip(
+			report_model.element_page, report_model.element_domain, report_model.element_is_3p, 
+			report_model.element_type, report_model.element_extension, report_model.element_url
+		):
+			if is_3p != 1: continue
+			if element_type and this_element_type != element_type_id: continue
+			domain_owner_id = report_model.get_domain_owner_id(domain)
+			if domain_owner_id not in self.domain_owners: domain_owner_id = None
+			page_3p_elements.add((page, element_url, extension, this_element_type, report_model.domain_domain[domain], domain_owner_id))
+
+		tld_3p_elements = {tld: collections.Counter() for tld, pages in self.top_tlds}
+		for page, element_url, extension, this_element_type, element_domain, domain_owner_id in page_3p_elements:
+			element = (
+				report_model.get_string(element_url),
+				report_model.get_string(extension),
+				report_model.get_string(this_element_type),
+				report_model.get_string(element_domain),
+				domain_owner_id
+			)
+			for tld in self.page_tld_groups[page]:
+				tld_3p_elements[tld][element] += 1
+
 		for tld in self.top_tlds:
 			total_pages = tld[1]
 
@@ -914,27 +1165,18 @@ class Analyzer:
 			csv_rows.append(('Percent Total','Element','Extension','Type','Domain','Owner','Owner Country','Owner Lineage'))
 
 			if tld[0]:
-				tld_filter = tld[0]
 				if element_type:
 					file_name = tld[0]+'-3p_'+element_type+'.csv'
 				else:
 					file_name = tld[0]+'-3p_element.csv'
 			else:
-				tld_filter = None
 				if element_type:
 					file_name = '3p_'+element_type+'.csv'
 				else:
 					file_name = '3p_element.csv'
 
-			all_3p_elements = []
-			for item in self.sql_driver.get_3p_elements(tld_filter, element_type):
-				# we need to drop off the first element returned here
-				# perhaps tho it should happen insql?
-
-				all_3p_elements.append((item[1],item[2],item[3],item[4],item[5]))
-
 			# if num_results is None we get everything, otherwise stops at limit
-			for item in self.get_most_common_sorted(all_3p_elements)[:self.num_results]:
+			for item in self.get_most_common_sorted(tld_3p_elements[tld[0]])[:self.num_results]:
 				# this condition has to specify != None, b/c otherwise it will skip values of 0
 				if item[0][4] != None:
 					owner_name = self.domain_owners[item[0][4]]['owner_name']
@@ -966,103 +1208,103 @@ class Analyzer:
 		print('\t==================================')
 		print('\t Processing Data Transfer Reports ')
 		print('\t==================================')
-	
+
+		self.load_report_elements()
+		report_model = self.report_model
+
+		# initialize vars, each is kept per tld
+		first_party_data = collections.Counter()
+		third_party_data = collections.Counter()
+		total_data 		 = collections.Counter()
+		
+		# the totals come from the page summaries, -1 is where we don't 
+		#	have the size of any of the elements
+		for page, body_size, is_3p in zip(report_model.element_summary_page, report_model.element_summary_body_size, report_model.element_summary_is_3p):
+			if body_size == -1: continue
+
+			for tld in self.page_tld_groups[page]:
+				# this is the measure of all data downloaded
+				total_data[tld] += body_size
+
+				# measures for third and first party data
+				if is_3p == 1:
+					third_party_data[tld] += body_size
+				else:
+					first_party_data[tld] += body_size
+
+		# need Counter object, allows sorting later
+		domain_data	= {tld: collections.Counter() for tld, pages in self.top_tlds}
+		owner_data 	= {tld: collections.Counter() for tld, pages in self.top_tlds}
+		
+		# process each element we have the size of
+		for page, domain, element_size in zip(report_model.element_page, report_model.element_domain, report_model.element_body_size):
+			if element_size == -1: continue
+
+			element_domain	= report_model.get_string(report_model.domain_domain[domain])
+			domain_owner_id	= report_model.get_domain_owner_id(domain)
+
+			# only if we know the owner
+			if domain_owner_id:
+				lineage_ids = self.get_domain_owner_lineage_ids(domain_owner_id)
+			else:
+				lineage_ids = []
+
+			for tld in self.page_tld_groups[page]:
+				# data by domain and owner, new entries start at zero
+				domain_data[tld][element_domain] += element_size
+				for lineage_id in lineage_ids:
+					owner_data[tld][lineage_id] += element_size
 
 		for tld in self.top_tlds:
-			# set up filter and file names
+			# set up file names
 			if tld[0]:
-				tld_filter = tld[0]
 				summary_file_name 		= tld[0]+'-data_xfer_summary.csv'
 				domain_file_name		= tld[0]+'-data_xfer_by_domain.csv'
 				aggregated_file_name	= tld[0]+'-data_xfer_aggregated.csv'
 			else:
-				tld_filter = None
 				summary_file_name 		= 'data_xfer_summary.csv'
 				domain_file_name		= 'data_xfer_by_domain.csv'
 				aggregated_file_name	= 'data_xfer_aggregated.csv'
 
-			# get the data from db, tuple of (element_domain, size, is_3p (boolean), domain_owner_id)
-			element_sizes = self.sql_driver.get_element_sizes(tld_filter=tld_filter)
-
-			# initialize vars
-			first_party_data = 0
-			third_party_data = 0
-			total_data 		 = 0
-			
-			# need Counter object, allows sorting later
-			domain_data	= collections.Counter()
-			owner_data 	= collections.Counter()
-			
-			# process each row
-			for item in element_sizes:
-
-				element_domain	= item[0]
-				element_size 	= item[1]
-				element_is_3p 	= item[2]
-				domain_owner_id = item[3]
-
-				# this is the measure of all data downloaded
-				total_data += element_size
-
-				# measures for third and first party data
-				if element_is_3p:
-					third_party_data += element_size
-				else:
-					first_party_data += element_size
-
-				# data by domain, increment if already in there, otherwise new entry
-				if element_domain in domain_data:
-					domain_data[element_domain] += element_size
-				else:
-					domain_data[element_domain] = element_size
-
-				# only if we know the owner, increment
-				if domain_owner_id:
-					for lineage_id in self.get_domain_owner_lineage_ids(domain_owner_id):
-						if lineage_id in owner_data:
-							owner_data[lineage_id] += element_size
-						else:
-							owner_data[lineage_id] = element_size
-
 			# output data to csv
 			summary_data_csv = []
 			summary_data_csv.append(('Party','Percent Total','Data Transfered (bytes)'))
-			summary_data_csv.append(('All','100',total_data))
+			summary_data_csv.append(('All','100',total_data[tld[0]]))
 			summary_data_csv.append((
 				'First', 
-				round((first_party_data/total_data)*100, self.num_decimals),
-				first_party_data))
+				round((first_party_data[tld[0]]/total_data[tld[0]])*100, self.num_decimals),
+				first_party_data[tld[0]]))
 			summary_data_csv.append((
 				'Third', 
-				round((third_party_data/total_data)*100, self.num_decimals),
-				third_party_data))
+				round((third_party_data[tld[0]]/total_data[tld[0]])*100, self.num_decimals),
+				third_party_data[tld[0]]))
 
 			self.write_csv(summary_file_name, summary_data_csv)
 			
 			# sort and output ranked data
-			domain_data = domain_data.most_common()
-			domain_data.sort()
-			domain_data.sort(reverse=True, key=lambda item:item[1])
+			tld_domain_data = domain_data[tld[0]].most_common()
+			tld_domain_data.sort()
+			tld_domain_data.sort(reverse=True, key=lambda item:item[1])
 
 			# for csv data
 			domain_data_csv = []
 			domain_data_csv.append(('Percent Total','Domain','Data Transfered (bytes)'))
 
 			# if num_results is None we get everything, otherwise stops at limit
-			for item in domain_data[:self.num_results]:
+			for item in tld_domain_data[:self.num_results]:
 				domain_data_csv.append((
-					round((item[1]/total_data)*100,self.num_decimals),
+					round((item[1]/total_data[tld[0]])*100,self.num_decimals),
 					item[0],
 					item[1]))
 			self.write_csv(domain_file_name, domain_data_csv)
 
-			owner_data 	= self.get_most_common_sorted(owner_data)
+			tld_owner_data = self.get_most_common_sorted(owner_data[tld[0]])
 			owner_data_csv = []
 			owner_data_csv.append(('Percent Total','Owner','Owner Country','Owner Lineage','Data Transfered (bytes)'))
 			# get results for all known owners
-			for item in owner_data:
+			for item in tld_owner_data:
 				owner_data_csv.append((
-					round((item[1]/total_data)*100,self.num_decimals),
+					round((item[1]/total_data[tld[0]])*100,self.num_decimals),
 					self.domain_owners[item[0]]['owner_name'],
 					self.domain_owners[item[0]]['country'],
 					self.get_domain_owner_lineage_combined_string(item[0]),
@@ -1111,6 +1353,7 @@ class Analyzer:
 
 		# now that our domain to use mapping is done we have to 
 		#	process the actual data!
+		self.load_report_elements()
 
 		# for each page, create a list of the set of domains 
 		#	which set a cookie
@@ -1118,19 +1361,31 @@ class Analyzer:
 		# note that due to currently unresolved chrome issues we sometimes 
 		# 	can get cookies which don't have a corresponding 3p request
 		# 	this approach handles that gracefully
+		report_model	= self.report_model
+		tld_pages		= self.get_tld_pages(tld_filter)
+
 		page_cookie_domains = {}
-		for page_id, cookie_domain in self.sql_driver.get_page_id_3p_cookie_domain_pairs(tld_filter):
-			if page_id not in page_cookie_domains:
-				page_cookie_domains[page_id] = [cookie_domain]
-			else:
-				page_cookie_domains[page_id] = page_cookie_domains[page_id] + [cookie_domain]
+		for page, domain in zip(report_model.cookie_page, report_model.cookie_domain):
+			if tld_pages is not None and not tld_pages[page]: continue
+			if page not in page_cookie_domains:
+				page_cookie_domains[page] = set()
+			page_cookie_domains[page].add(report_model.get_string(report_model.domain_domain[domain]))
+
+		# each page and 3p element domain pairing only counts once
+		page_3p_element_domains = set()
+		for page, domain, is_3p in zip(report_model.element_page, report_model.element_domain, report_model.element_is_3p):
+			if is_3p != 1: continue
+			if tld_pages is not None and not tld_pages[page]: continue
+			page_3p_element_domains.add((page, report_model.domain_domain[domain]))
 
 		# next, for each page we want a list of uses for domains and if
 		#	that domain corresponds to a cookie being set
 		# NOTE: the same use may occur many times, this is desired
 		# 	as it gives us our counts later on
 		page_3p_uses = {}
-		for page_id, element_domain in self.sql_driver.get_page_id_3p_element_domain_pairs(tld_filter):
+		for page_id, element_domain_id in page_3p_element_domains:
+			element_domain = report_model.get_string(element_domain_id)
+
 			# if this 3p domain has a known use we add it to a list of uses keyed to page id
 			if element_domain in domain_to_use_map:
 				# check if the domain of this element has a cookie for this page
@@ -1178,7 +1433,7 @@ class Analyzer:
 		# the last step is to calculate the relevant percentages and averages
 
 		# used to get percentage by use
-		total_pages = self.sql_driver.get_complex_page_count(tld_filter)
+		total_pages = self.get_tld_page_count(tld_filter)
 
 		percentage_by_use 				= {}
 		average_use_occurance_per_page 	= {}
@@ -1259,11 +1514,24 @@ class Analyzer:
 		# header row for csv		
 		csv_rows.append(('Page Domain','3P Element Domain','3P Domain Owner','3P Domain Owner Country'))
 		
-		# sql_driver.get_network_ties returns a set of tuples in the format
+		self.load_report_elements()
+
+		# we get the distinct set of tuples in the format
 		#	(page domain, element domain, element domain owner id)
-		#	we just go through this data to produce the report
-		
-		for item in self.sql_driver.get_3p_network_ties():
+		#	sorted on page domain then element domain and go through 
+		#	this to produce the report
+		report_model = self.report_model
+		network_ties = set()
+		for page, domain, is_3p in zip(report_model.element_page, report_model.element_domain, report_model.element_is_3p):
+			if is_3p != 1: continue
+			network_ties.add((
+				report_model.get_string(report_model.domain_domain[report_model.page_domain[page]]),
+				report_model.get_string(report_model.domain_domain[domain]),
+				report_model.get_domain_owner_id(domain)
+			))
+		network_ties = sorted(network_ties, key=lambda item: (item[0] or '', item[1] or ''))
+
+		for item in network_ties:
 			# if a page has no elements, edge[1] will be 'None' so we skip it
 			#	an alternate approach would be to include as orphan nodes
 			if item[1]:
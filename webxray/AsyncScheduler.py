@@ -0,0 +1,130 @@
+# standard python libs
+import os
+import asyncio
+import concurrent.futures
+
+# optional, lets the memory ceiling include the browsers, see get_memory_mb
+try:
+	import psutil
+except:
+	psutil = None
+
+class AsyncScheduler:
+	"""
+		Runs many pages at once inside a single collector process.
+
+		Normally each pool process loads one page at a time and spends most of that
+			time asleep in browser_wait.  Instead each process runs an asyncio loop
+			with pages_per_worker slots, each slot has its own chrome so their wait
+			windows overlap.  Selenium is blocking so the page itself is loaded on a
+			thread for the slot, the loop hands out urls and holds back new pages
+			while the process is over memory_limit_mb.
+
+		Urls come in on url_queue and are put on done_queue once finished along with
+			whether the page was stored, a None on url_queue shuts down one slot.  Collector.run only puts a url on the
+			queue once fewer than max_concurrent_pages are in flight, which is the
+			limit across every process.
+	"""
+
+	def __init__(self, process_url, new_chrome_driver, pages_per_worker=4, memory_limit_mb=None, memory_poll_seconds=1):
+		self.process_url			= process_url
+		self.new_chrome_driver		= new_chrome_driver
+		self.pages_per_worker		= pages_per_worker
+		self.memory_limit_mb		= memory_limit_mb
+		self.memory_poll_seconds	= memory_poll_seconds
+
+		# pages being loaded in this process right now
+		self.active_pages = 0
+	# __init__
+
+	def run(self, url_queue, done_queue):
+		"""
+		entry point for each worker process
+		"""
+		if self.memory_limit_mb is not None and self.get_memory_mb() is None:
+			print('\tWARNING: unable to read memory use, worker_memory_limit_mb will be ignored')
+			self.memory_limit_mb = None
+
+		asyncio.run(self.schedule(url_queue, done_queue))
+	# run
+
+	async def schedule(self, url_queue, done_queue):
+		"""
+		runs all the slots until each has been told to stop
+		"""
+		loop = asyncio.get_running_loop()
+
+		# each slot only ever waits on one thing at a time so one thread per slot is enough
+		executor = concurrent.futures.ThreadPoolExecutor(self.pages_per_worker)
+		try:
+			await asyncio.gather(*[
+				self.run_slot(loop, executor, url_queue, done_queue) for slot in range(self.pages_per_worker)
+			])
+		finally:
+			executor.shutdown()
+	# schedule
+
+	async def run_slot(self, loop, executor, url_queue, done_queue):
+		"""
+		loads pages one after the other with the slot's own chrome
+		"""
+		chrome_driver = self.new_chrome_driver()
+		try:
+			while True:
+				url = await loop.run_in_executor(executor, url_queue.get)
+				if url is None: break
+
+				# nothing may await between the memory check and counting the page
+				#	as active or other slots would see a stale count
+				await self.wait_for_memory(loop, executor, chrome_driver)
+				self.active_pages += 1
+				page_stored = False
+				try:
+					page_stored = await loop.run_in_executor(executor, self.process_url, url, chrome_driver)
+				except Exception as e:
+					print('\t\t%-50s Worker error: %s' % (url[:50], e))
+				finally:
+					self.active_pages -= 1
+					await loop.run_in_executor(executor, done_queue.put, (url, page_stored))
+		finally:
+			await loop.run_in_executor(executor, chrome_driver.quit)
+	# run_slot
+
+	async def wait_for_memory(self, loop, executor, chrome_driver):
+		"""
+		if the process is over its ceiling we close this slot's browser and wait for
+			the other slots to finish pages until we are back under, if no pages are
+			running there is nothing to wait for so we go ahead regardless
+		"""
+		if self.memory_limit_mb is None: return
+		if self.get_memory_mb() < self.memory_limit_mb: return
+
+		await loop.run_in_executor(executor, chrome_driver.quit)
+		while self.active_pages > 0 and self.get_memory_mb() >= self.memory_limit_mb:
+			await asyncio.sleep(self.memory_poll_seconds)
+	# wait_for_memory
+
+	def get_memory_mb(self):
+		"""
+		resident memory of this process in MB, with psutil the browsers and other
+			processes we started are included, otherwise it is just python
+
+		returns None if we can't tell
+		"""
+		if psutil is not None:
+			this_process = psutil.Process()
+			memory_bytes = this_process.memory_info().rss
+			for child in this_process.children(recursive=True):
+				try:
+					memory_bytes += child.memory_info().rss
+				except psutil.Error:
+					pass
+			return memory_bytes/1048576
+
+		try:
+			with open('/proc/self/statm', 'r') as statm:
+				return int(statm.read().split()[1])*os.sysconf('SC_PAGE_SIZE')/1048576
+		except:
+			return None
+	# get_memory_mb
+# AsyncScheduler
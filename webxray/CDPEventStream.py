@@ -0,0 +1,127 @@
+# standard python packages
+import json
+import threading
+import urllib.request
+
+# websocket-client is optional, without it ChromeDriver reads the performance log instead
+try:
+    import websocket
+except:
+    websocket = None
+
+class CDPEventStream:
+    """
+    Subscribes to Chrome DevTools Protocol Network.* events over the DevTools websocket
+        of the tab chromedriver is driving and feeds them to a NetworkEventLog as they
+        arrive, this happens on a background thread so it keeps going while driver.get()
+        blocks and during browser_wait.
+
+    Compared to reading the performance log afterwards chromedriver doesn't have to
+        buffer every event of the page (which on heavy pages may get truncated) and
+        we build up the requests while the page is loading rather than all at once.
+
+    Requires the websocket-client package, check is_available() first.
+    """
+
+    def __init__(self, event_log, connect_timeout=10):
+        self.event_log          = event_log
+        self.connect_timeout    = connect_timeout
+        self.ws                 = None
+        self.thread             = None
+        self.stop_event         = threading.Event()
+    # __init__
+
+    @staticmethod
+    def is_available():
+        """
+        True if websocket-client is installed.
+        """
+        return websocket is not None
+    # is_available
+
+    def get_websocket_url(self, driver):
+        """
+        Finds the DevTools websocket url of the tab the driver is controlling by
+            asking chrome's debugger address for its list of targets.
+        """
+        debugger_address = driver.capabilities['goog:chromeOptions']['debuggerAddress']
+        with urllib.request.urlopen('http://%s/json/list' % debugger_address, timeout=self.connect_timeout) as response:
+            targets = json.loads(response.read().decode('utf-8'))
+
+        # chromedriver window handles are the target id with a prefix
+        target_id = driver.current_window_handle.replace('CDwindow-','')
+        for target in targets:
+            if target['id'] == target_id:
+                return target['webSocketDebuggerUrl']
+
+        # fall back to the first tab
+        for target in targets:
+            if target['type'] == 'page':
+                return target['webSocketDebuggerUrl']
+
+        raise Exception('No DevTools target found')
+    # get_websocket_url
+
+    def start(self, driver):
+        """
+        Connects and enables the Network domain, once this returns every
+            network event of the tab goes to the event log until stop() is called.
+        """
+        # recent versions of chrome turn away websockets which send an origin
+        self.ws = websocket.create_connection(
+            self.get_websocket_url(driver),
+            timeout=self.connect_timeout,
+            suppress_origin=True
+        )
+
+        # wait for chrome to confirm Network is enabled so we don't miss the
+        #   first request, anything which shows up before that is kept
+        self.ws.send(json.dumps({'id': 1, 'method': 'Network.enable', 'params': {}}))
+        while True:
+            message = json.loads(self.ws.recv())
+            if message.get('id') == 1: break
+            self.process_message(message)
+
+        # short timeout so the thread notices when we stop
+        self.ws.settimeout(0.5)
+        self.thread = threading.Thread(target=self.read_events, daemon=True)
+        self.thread.start()
+    # start
+
+    def read_events(self):
+        """
+        Background thread, reads events until stop() or chrome closes the socket.
+        """
+        while not self.stop_event.is_set():
+            try:
+                message = self.ws.recv()
+            except websocket.WebSocketTimeoutException:
+                continue
+            except:
+                break
+            self.process_message(json.loads(message))
+    # read_events
+
+    def process_message(self, message):
+        """
+        Passes Network events to the log, command results and other domains are ignored.
+        """
+        if message.get('method', '').startswith('Network.'):
+            self.event_log.add_event(message['method'], message['params'])
+    # process_message
+
+    def stop(self):
+        """
+        Stops reading and closes the socket, after this the event log is
+            safe to read from.
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.ws is not None:
+            try:
+                self.ws.close()
+            except:
+                pass
+    # stop
+# CDPEventStream
@@ -5,6 +5,7 @@ import json
 import time
 import random
 import sqlite3
+from urllib.parse import urlsplit
 
 # check if non-standard packages are installed
 try:
@@ -17,6 +18,8 @@ except:
     exit()
 
 from webxray.Utilities import Utilities
+from webxray.NetworkEventLog import NetworkEventLog
+from webxray.CDPEventStream import CDPEventStream
 
 class ChromeDriver:
     """
@@ -32,9 +35,21 @@ class ChromeDriver:
         In headless mode prior to 64.0.3254.0, the cookie database does not get created and no cookies are returned
     """
 
-    def __init__(self,ua=False, dnt=False):
+    def __init__(self,ua=False, dnt=False, max_pages_per_browser=1, stream_network_events=False, network_idle_seconds=None):
         """
         set various global options here
+
+        by default every page is loaded in a brand new browser, if max_pages_per_browser
+            is more than 1 the browser is kept open between pages and reset instead,
+            see get_driver
+
+        if stream_network_events is True network events are read from the DevTools
+            websocket while the page loads rather than from the performance log
+            afterwards, see CDPEventStream, this needs websocket-client
+
+        if network_idle_seconds is set we stop waiting on a page once the network 
+            has been quiet that long rather than always waiting browser_wait, 
+            see wait_for_network
         """
 
         self.dnt = dnt
@@ -63,6 +78,24 @@ class ChromeDriver:
         # useful for various tasks
         self.utilities = Utilities()
 
+        # the browser we keep open between pages, along with how many pages
+        #   it has loaded and which origins they touched so we can clear
+        #   their storage
+        self.max_pages_per_browser  = max_pages_per_browser
+        self.driver                 = None
+        self.driver_page_count      = 0
+        self.visited_origins        = set()
+
+        # no websocket-client means we stick with the performance log
+        if stream_network_events and not CDPEventStream.is_available():
+            print('\tWARNING: websocket-client is not installed, using the performance log for network events')
+        self.stream_network_events  = stream_network_events and CDPEventStream.is_available()
+
+        # how long the network must be quiet before we stop waiting, and how 
+        #   often we check
+        self.network_idle_seconds       = network_idle_seconds
+        self.network_idle_poll_seconds  = 0.5
+
         return None
     # init
 
@@ -98,18 +131,25 @@ class ChromeDriver:
         if self.ua: 
             chrome_options.add_argument('user-agent='+self.ua)
 
+        # when streaming network events we don't need chromedriver to
+        #   buffer them all in the performance log as well
+        if self.stream_network_events:
+            desired_capabilities = {}
+        else:
+            desired_capabilities = {'loggingPrefs': {'performance': 'ALL'}}
+
         # attempt to start driver, fail gracefull otherwise
         try:
             # if we have chromedriver path set it up
             if self.chromedriver_path:
                 driver = webdriver.Chrome(
                     self.chromedriver_path,
-                    desired_capabilities={'loggingPrefs': {'performance': 'ALL'}},
+                    desired_capabilities=desired_capabilities,
                     chrome_options=chrome_options
                 )
             else:
                 driver = webdriver.Chrome(
-                    desired_capabilities={'loggingPrefs': {'performance': 'ALL'}},
+                    desired_capabilities=desired_capabilities,
                     chrome_options=chrome_options,      
                 )
         except:
@@ -121,6 +161,124 @@ class ChromeDriver:
         return driver
     # init_headless_driver
 
+    def get_driver(self):
+        """
+        Returns a browser ready to load a new page.
+
+        Launching Chrome takes a few seconds so if max_pages_per_browser is
+            more than 1 we hold on to the browser and wipe what the last page
+            left behind instead.  The browser is replaced once it has loaded
+            max_pages_per_browser pages, if the reset fails, or if anything 
+            went wrong with the last page (see release_driver).
+        """
+        if self.max_pages_per_browser <= 1:
+            return self.create_chromedriver()
+
+        if self.driver is not None and self.driver_page_count >= self.max_pages_per_browser:
+            self.quit()
+
+        if self.driver is not None and not self.reset_driver():
+            self.quit()
+
+        if self.driver is None:
+            self.driver = self.create_chromedriver()
+            self.driver_page_count = 0
+
+        if self.driver is not None:
+            self.driver_page_count += 1
+
+        return self.driver
+    # get_driver
+
+    def reset_driver(self):
+        """
+        Gives the browser we are holding on to a clean slate: extra windows are
+            closed and cookies, cache, and storage for every origin the last page
+            touched are cleared.  Returns False if the browser did not cooperate,
+            in which case it should be replaced.
+        """
+        try:
+            # pages may open popups, keep only the first window
+            for window_handle in self.driver.window_handles[1:]:
+                self.driver.switch_to.window(window_handle)
+                self.driver.close()
+            self.driver.switch_to.window(self.driver.window_handles[0])
+            self.driver.get('about:blank')
+
+            self.driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+            self.driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+            for origin in self.visited_origins:
+                self.driver.execute_cdp_cmd('Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
+
+            # throw away anything left in the performance log
+            if not self.stream_network_events:
+                self.driver.get_log('performance')
+        except:
+            return False
+
+        # selenium-wire keeps its own record of requests, not all versions can clear it
+        try:
+            del self.driver.requests
+        except:
+            pass
+
+        self.visited_origins = set()
+        return True
+    # reset_driver
+
+    def release_driver(self, driver, failed=False):
+        """
+        Call when we are done with a page, a browser which is not being kept
+            between pages is shut down, otherwise we only shut it down if 
+            something went wrong as it may be in a bad state.
+        """
+        if driver is not self.driver:
+            driver.quit()
+        elif failed:
+            self.quit()
+    # release_driver
+
+    def quit(self):
+        """
+        Shuts down the browser we are holding on to, if any.
+        """
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except:
+                pass
+        self.driver = None
+        self.visited_origins = set()
+    # quit
+
+    def get_cookies_from_browser(self, driver):
+        """
+        Gets all cookies from the browser itself rather than the cookie db, 
+            Chrome only writes the db to disk every so often so it can't be 
+            used for a browser we keep between pages.
+
+        The cookies are converted to match the cookie db, in particular expiry 
+            is microseconds since 1601 and 0 for session cookies.
+        """
+        cookies = []
+        for cookie in driver.execute_cdp_cmd('Network.getAllCookies', {})['cookies']:
+            if cookie.get('session') or cookie['expires'] < 0:
+                expiry = 0
+            else:
+                expiry = int((cookie['expires']+11644473600)*1000000)
+
+            cookies.append({
+                'name':         cookie['name'],
+                'secure':       int(cookie['secure']),
+                'path':         cookie['path'],
+                'domain':       cookie['domain'],
+                'expiry':       expiry,
+                'httponly':     int(cookie['httpOnly']),
+                'value':        cookie['value']
+            })
+        return cookies
+    # get_cookies_from_browser
+
     def get_ua_for_headless(self):
         """
         Using chrome in headless sends a 'Headless' ua string,
@@ -141,18 +299,49 @@ class ChromeDriver:
             return None
     # get_ua_for_headless
 
+    def wait_for_network(self, driver, event_log, event_stream, browser_wait):
+        """
+        Waits after the page has loaded so scripts may finish making requests,
+            returns how many seconds we waited.
+
+        If network_idle_seconds is not set this is simply browser_wait, otherwise
+            we stop as soon as nothing has been in flight for network_idle_seconds, 
+            with browser_wait as the upper limit.  Without the event stream we
+            read the performance log as we go to see what is in flight.
+        """
+        if self.network_idle_seconds is None:
+            time.sleep(browser_wait)
+            return browser_wait
+
+        wait_start = time.time()
+        while True:
+            time_left = browser_wait - (time.time() - wait_start)
+            if time_left <= 0: break
+            time.sleep(min(self.network_idle_poll_seconds, time_left))
+
+            if event_stream is None:
+                event_log.add_performance_log(driver.get_log('performance'))
+
+            if event_log.is_network_idle(self.network_idle_seconds): break
+
+        return round(time.time() - wait_start, 3)
+    # wait_for_network
+
     def get_webxray_scan_data(self, url, browser_wait):
         """
         This function loads the page, monitors network traffic, and returns relevant data/logs.
 
         IMPORTANT: headless will miss all cookies in chrome versions < 64.0.3254.0
 
-        This uses the chrome performance log to get network traffic details, see following for details:
+        By default this uses the chrome performance log to get network traffic details, see following for details:
             - https://gist.githubusercontent.com/klepikov/5457750/raw/ecedc6dd4eed82f318db91adb923627716fb6b58/test.py
             - https://sites.google.com/a/chromium.org/chromedriver/logging/performance-log
+
+        With stream_network_events the same events are read live from the DevTools websocket
+            instead, either way they are stitched together by NetworkEventLog.
         """
 
-        driver = self.create_chromedriver()
+        driver = self.get_driver()
         # we can't start Chrome, return error message as result
         if driver == None:
             return({
@@ -163,6 +352,23 @@ class ChromeDriver:
         # allow one minute before we kill it, seperate from browser_wait
         driver.set_page_load_timeout(60)
 
+        # network events are collected here as they come in
+        event_log = NetworkEventLog()
+
+        # start listening before the page load so we catch the first request
+        event_stream = None
+        if self.stream_network_events:
+            event_stream = CDPEventStream(event_log)
+            try:
+                event_stream.start(driver)
+            except:
+                event_stream.stop()
+                self.release_driver(driver, failed=True)
+                return({
+                    'success': False,
+                    'result': 'Unable to connect to DevTools websocket'
+                })
+
         # start the page load process, return error message if we fail
         try:
             if self.dnt:
@@ -170,7 +376,8 @@ class ChromeDriver:
                 driver._client.set_header_overrides(headers = {'DNT': 1})
             driver.get(url)
         except:
-            driver.quit()
+            if event_stream: event_stream.stop()
+            self.release_driver(driver, failed=True)
             return({
                 'success': False,
                 'result': 'Unable to load page'
@@ -188,7 +395,8 @@ class ChromeDriver:
             page_source = driver.page_source
         except:
             # quit the driver or it will never die!
-            driver.quit()
+            if event_stream: event_stream.stop()
+            self.release_driver(driver, failed=True)
             return({
                 'success': False,
                 'result': 'Unable to load page, possible javascript alert issue'
@@ -199,253 +407,15 @@ class ChromeDriver:
 
         # while the browser may be finished loading the page, scripts may still making
         # 	additional requests, so we wait to let all that finish
-        time.sleep(browser_wait)
-
-        # We use the Chrome performance log get network traffic. Chrome performance log outputs a 
-        #	number of independent 'message' events which are keyed to a 'requestId'.  What we want
-        #	to send upstream is a dictionary keyed on the requested url so we do a lot of processing
-        #	here to stitch together a coherent log in the format expected by wbxr.
-        #
-        # There are two types of network events we are concerned with: normal http 
-        #	requests (initiated by Network.requestWillBeSent) and websocket requests (initiated
-        #	by Network.webSocketCreated).
-        #
-        # For normal events, we add entries to the 'requests' dictionary which we key to the requested
-        #	url.  The reason for this is a single requestId may correspond with many urls in
-        #	cases where a request results in redirects occuring.  However, data from the 
-        #	Network.loadingFinished event does not include the url, so we key that seperately
-        #	in the load_finish_data dict and then attach it later on.  Note that if a request to
-        #	x.com results in redirects to y.com and z.com, all three will end up sharing
-        #	the same loadingFinished data.
-        #
-        # webSocket events are a special case in that they are not strictly HTTP events, but 
-        #	they do two things we are concerned with: potentially linking a user to 
-        #	a third-party domain and setting cookies.  The url contacted is only exposed in the
-        #	first event, Network.webSocketCreated, so we must use the requestId to tie together
-        #	subsequent Network.webSocketWillSendHandshakeRequest and 
-        #	Network.webSocketHandshakeResponseReceived events.  We use the dictionary websocket_requests
-        #	to keep track of such events, and we then reprocess them to be keyed to the url in our
-        #	normal requests log.  Note that to keep track of websocket request we use 'websocket'
-        #	for content type, and there may be a better way to handle this.
-
-        # http requests are keyed to URL
-        requests 		   = {}
-        
-        # these events are keyed to requestID
-        load_finish_data   = {}
-        websocket_requests = {}
-
-        # to get page load time we will figure out when the first request and final load finished occured
-        first_start_time = None
-        last_end_time 	 = None
-
-        # for debuging
-        duplicate_keys = []
-
-        # crunch through all the chrome logs here, the main event!
-        for log_item in driver.get_log('performance'):
-            for key, this_log_item in log_item.items():
-                # we are only interested in message events
-                if key == 'message':
-                    # we have to read in this value to get json data
-                    log_item_data 	= json.loads(this_log_item)
-                    message_type	= log_item_data['message']['method']
-
-                    ################################
-                    # normal http event processing #
-                    ################################
-
-                    # we have a new http event, create new empty entry keyed to url
-                    # and keep track of start time info
-                    if message_type == 'Network.requestWillBeSent':
-                        this_request = log_item_data['message']['params']['request']
-                        this_url 	 = this_request['url']
-                        
-                        # skip if not http(s)
-                        if not re.match('^https?://', this_url): continue
-
-                        # the presence of 'redirectResponse' means a prior request is redirected
-                        #	so we update the status of the original request here and
-                        #	then continue processing the current request
-                        if 'redirectResponse' in log_item_data['message']['params']:
-                            redirect_info = log_item_data['message']['params']['redirectResponse']
-                            original_url = redirect_info['url']
-                            
-                            # the request was received, mark it
-                            requests[original_url].update({'received':		True})
-
-                            # record status code and text
-                            requests[original_url].update({'status':		redirect_info['status']})
-                            requests[original_url].update({'status_text':	redirect_info['statusText']})
-                        
-                            # try to get response headers, fail gracefully as they are already None
-                            try:
-                                requests[this_url].update({'response_headers':this_response['headersText']})
-                            except:
-                                pass
-                        
-                            try:
-                                requests[this_url].update({'content_type':this_response['headers']['Content-Type']})
-                            except:
-                                pass
-
-                        # if a new request we initialize entry
-                        if this_url not in requests:
-                            requests[this_url] = {}
-
-                            # we use this to get the load_finish_data later on
-                            requests[this_url].update({'request_id': log_item_data['message']['params']['requestId']})
-    
-                            # we set received to false to start with
-                            requests[this_url].update({'received':			False})
-
-                            # initialze response values to None in case we don't get response
-                            requests[this_url].update({'end_time':			None})
-                            requests[this_url].update({'status':			None})
-                            requests[this_url].update({'status_text':		None})
-                            requests[this_url].update({'response_headers':	None})
-                            requests[this_url].update({'content_type':		None})
-                            requests[this_url].update({'body_size':			None})
-                            requests[this_url].update({'end_time':			None})
-                            requests[this_url].update({'user_agent':		None})
-                            requests[this_url].update({'referer':			None})
-
-                            # each request has a start_time, we use this to figure out the time it took to download
-                            this_start_time = log_item_data['message']['params']['timestamp']
-                            requests[this_url].update({'start_time':this_start_time})
-                            
-                            # update global start time to measure page load time
-                            if first_start_time == None or this_start_time < first_start_time:
-                                first_start_time = this_start_time
-
-                            # get the request headers
-                            requests[this_url].update({'request_headers':this_request['headers']})
-
-                            # these can fail, if so, we ignore
-                            try:
-                                requests[this_url].update({'user_agent':this_request['headers']['User-Agent']})
-                            except:
-                                pass
-
-                            try:
-                                requests[this_url].update({'referer':this_request['headers']['Referer']})
-                            except:
-                                pass
-                        # this_url already exists, log
-                        else:
-                            duplicate_keys.append(this_url)
-                            continue
-
-                    # we have received a response to our request, update appropriately
-                    if message_type == 'Network.responseReceived':
-                        this_response 	= log_item_data['message']['params']['response']
-                        this_url 	 	= this_response['url']
-
-                        # skip if not http(s)
-                        if not re.match('^https?://', this_url): continue
-
-                        # the request was received, mark it
-                        requests[this_url].update({'received':		True})
-
-                        # record status code and text
-                        requests[this_url].update({'status':		this_response['status']})
-                        requests[this_url].update({'status_text':	this_response['statusText']})
-                        
-                        # try to get response headers, fail gracefully as they are already None
-                        try:
-                            requests[this_url].update({'response_headers':this_response['headersText']})
-                        except:
-                            pass
-                        
-                        try:
-                            requests[this_url].update({'content_type':this_response['headers']['Content-Type']})
-                        except:
-                            pass
-
-                    # load finish events are keyed to requestId and may apply to many requested urls
-                    #	so we keep this in a seperate dictionary to be relinked when we're done
-                    if message_type == 'Network.loadingFinished':
-                        this_request_id = log_item_data['message']['params']['requestId']
-                        this_end_time	= log_item_data['message']['params']['timestamp']
-
-                        # update global end time
-                        if last_end_time == None or this_end_time > last_end_time:
-                            last_end_time = this_end_time
-
-                        if this_request_id not in load_finish_data:
-                            load_finish_data[this_request_id] = {}
-
-                        # size is updated during loading and is shown in logs, but we only want the final size which is here
-                        load_finish_data[this_request_id].update({'body_size':log_item_data['message']['params']['encodedDataLength']})
-
-                        # we use this to calculate the total time for all requests
-                        load_finish_data[this_request_id].update({'end_time':this_end_time})
-
-                    ##############################
-                    # webSocket event processing #
-                    ##############################
-
-                    # we have a new websocket, create new empty entry keyed to requestId
-                    # 	this will be rekeyed to url
-                    # note we ignore timing data for websockets
-                    if message_type == 'Network.webSocketCreated':
-                        this_url 		= log_item_data['message']['params']['url']
-                        this_request_id = log_item_data['message']['params']['requestId']
-
-                        if this_request_id not in websocket_requests:
-                            websocket_requests[this_request_id] = {}
-                            websocket_requests[this_request_id].update({'url': 				this_url})
-                            websocket_requests[this_request_id].update({'content_type':		'websocket'})
-                            websocket_requests[this_request_id].update({'received':			False})
-                            websocket_requests[this_request_id].update({'end_time':			None})
-                            websocket_requests[this_request_id].update({'status':			None})
-                            websocket_requests[this_request_id].update({'status_text':		None})
-                            websocket_requests[this_request_id].update({'response_headers':	None})
-                            websocket_requests[this_request_id].update({'body_size':		None})
-                            websocket_requests[this_request_id].update({'end_time':			None})
-                            websocket_requests[this_request_id].update({'start_time':		None})
-                            websocket_requests[this_request_id].update({'user_agent':		None})
-                            websocket_requests[this_request_id].update({'referer':			None})
-
-                    # websocket request made, update relevant fields
-                    if message_type == 'Network.webSocketWillSendHandshakeRequest':
-                        this_request 	= log_item_data['message']['params']['request']
-                        this_request_id = log_item_data['message']['params']['requestId']
-                        websocket_requests[this_request_id].update({'request_headers':	this_request['headers']})
-                        websocket_requests[this_request_id].update({'user_agent':		this_request['headers']['User-Agent']})
-
-                    # websocket response received, update relevant fields
-                    if message_type == 'Network.webSocketHandshakeResponseReceived':
-                        this_response 	= log_item_data['message']['params']['response']
-                        this_request_id = log_item_data['message']['params']['requestId']
-                        websocket_requests[this_request_id].update({'received':			True})
-                        websocket_requests[this_request_id].update({'status':			this_response['status']})
-                        websocket_requests[this_request_id].update({'status_text':		this_response['statusText']})
-                        websocket_requests[this_request_id].update({'response_headers':	this_response['headersText']})
-        # end log processing loop
-
-        # append load finish info to requests
-        for this_url in requests:
-            this_request_id = requests[this_url]['request_id']
-            if this_request_id in load_finish_data:
-                requests[this_url].update({'body_size': load_finish_data[this_request_id]['body_size']})
-                
-                # load_time is start time minus end time,
-                # 	multiplied by 1k to convert to miliseconds
-                load_time = (load_finish_data[this_request_id]['end_time'] - requests[this_url]['start_time'])*1000
-                
-                # we shouldn't be getting <=0, but make it null if this happens
-                if load_time <= 0:
-                    requests[this_url].update({'load_time': load_time})
-                else:
-                    requests[this_url].update({'load_time': None})
-            else:
-                requests[this_url].update({'body_size': None})
-                requests[this_url].update({'load_time': None})
+        browser_wait_used = self.wait_for_network(driver, event_log, event_stream, browser_wait)
 
-        # append websocket data to requests data
-        for item in websocket_requests:
-            requests[websocket_requests[item]['url']] = websocket_requests[item]
+        # the stream has been filling in the event log all along, otherwise we read
+        #   the whole performance log now, see NetworkEventLog for how requests are built
+        if event_stream:
+            event_stream.stop()
+        else:
+            event_log.add_performance_log(driver.get_log('performance'))
+        requests = event_log.get_processed_requests()
 
         # return all the links for later processing
         all_links = []
@@ -475,25 +445,34 @@ class ChromeDriver:
         #	prior to 64.0.3254.0 and no cookies will be returned
         cookies = []
         try:
-            conn = sqlite3.connect(driver.capabilities['chrome']['userDataDir']+'/Default/Cookies')
-            c = conn.cursor()
-            c.execute("SELECT name,is_secure,path,host_key,expires_utc,is_httponly,value FROM cookies")
-            for cookie in c.fetchall():
-                cookies.append({
-                    'name': 		cookie[0],
-                    'secure':		cookie[1],
-                    'path':			cookie[2],
-                    'domain': 		cookie[3],
-                    'expiry':		cookie[4],
-                    'httponly':		cookie[5],
-                    'value':		cookie[6]
-                })
+            if driver is self.driver:
+                cookies = self.get_cookies_from_browser(driver)
+            else:
+                conn = sqlite3.connect(driver.capabilities['chrome']['userDataDir']+'/Default/Cookies')
+                c = conn.cursor()
+                c.execute("SELECT name,is_secure,path,host_key,expires_utc,is_httponly,value FROM cookies")
+                for cookie in c.fetchall():
+                    cookies.append({
+                        'name': 		cookie[0],
+                        'secure':		cookie[1],
+                        'path':			cookie[2],
+                        'domain': 		cookie[3],
+                        'expiry':		cookie[4],
+                        'httponly':		cookie[5],
+                        'value':		cookie[6]
+                    })
         except:
+            self.release_driver(driver, failed=True)
             return({
                 'success': False,
                 'result': 'Cookie database not loaded, if this message appears often something is fundamentally wrong and requires attention!'
             })
 
+        # note where this page went so the next reset can clear their storage
+        for this_url in requests:
+            split_url = urlsplit(this_url)
+            self.visited_origins.add(split_url.scheme+'://'+split_url.netloc)
+
         if self.headless == True:
             browser_version = driver.capabilities['version'] + ' [headless]'
         else:
@@ -504,12 +483,13 @@ class ChromeDriver:
             'browser_type':			driver.capabilities['browserName'],
             'browser_version':		browser_version,
             'browser_wait':			browser_wait,
+            'browser_wait_used':	browser_wait_used,
             'start_url':			url, 
             'final_url': 			final_url,
             'title': 				title,
             'meta_desc': 			meta_desc,
             'lang':					lang,
-            'load_time': 			int((last_end_time - first_start_time)*1000),
+            'load_time': 			event_log.get_page_load_time(),
             'processed_requests': 	requests,
             'cookies': 				cookies,
             'all_links':			all_links,
@@ -517,7 +497,7 @@ class ChromeDriver:
         }
         
         # quit the driver or it will never die!
-        driver.quit()
+        self.release_driver(driver)
 
         return ({
             'success': True,
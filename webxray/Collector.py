@@ -2,18 +2,30 @@
 import os
 import re
 import sys
+import time
 import random
+import hashlib
+import threading
 import urllib.request
 import multiprocessing
+import multiprocessing.util
 from datetime import datetime
 from datetime import timedelta
 from urllib.parse import urlsplit
 from urllib.parse import urlunsplit
 
 # custom webxray classes
+from webxray.ParseURL		import ParseURL
 from webxray.OutputStore	import OutputStore
-from webxray.ChromeDriver 	import ChromeDriver
-from webxray.PhantomDriver 	import PhantomDriver
+from webxray.IngestWriter	import IngestWriter
+from webxray.IngestWriter	import FLUSH
+from webxray.AsyncScheduler	import AsyncScheduler
+from webxray.CrawlJournal	import CrawlJournal
+from webxray.PoliteScheduler	import PoliteScheduler
+from webxray.WorkQueue		import WorkQueue
+
+# each pool worker keeps its own chrome open between pages, see get_chrome_driver
+worker_chrome_driver = None
 
 class Collector:
 	"""
@@ -25,9 +37,17 @@ class Collector:
 		and makes sure we aren't duplicating pages that have already been analyzed
 		this means it is safe to re-run on the same list as it won't duplicate entries, but it
 		*will* retry pages that may not have loaded
+
+	progress is kept in a CrawlJournal, pages which fail are retried up to max_attempts
+		times, with the wait between attempts doubling from retry_backoff_seconds, both
+		later in the same run and on any later run with the same db
+
+	when use_work_queue is True the page list is not read, instead urls are leased
+		from the shared queue in the db which was filled by enqueue_urls, so any
+		number of nodes may work on one collection, see WorkQueue
 	"""
 
-	def __init__(self, db_engine, db_name, pages_file_name, browser_types, browser_wait, allow_timeseries=False, interval_minutes=1440, dnt=False):
+	def __init__(self, db_engine, db_name, pages_file_name, browser_types, browser_wait, allow_timeseries=False, interval_minutes=1440, dnt=False, ip_resolution='resolve', ingest_writer=False, ingest_queue_depth=100, ingest_batch_size=50, browser_max_pages=1, stream_network_events=False, network_idle_seconds=None, pages_per_worker=1, max_concurrent_pages=None, worker_memory_limit_mb=None, max_attempts=3, retry_backoff_seconds=60, max_pages_per_domain=None, use_work_queue=False, lease_seconds=300):
 		self.db_engine			= db_engine
 		self.startTime		 	= datetime.now()
 		self.db_name		 	= db_name
@@ -37,25 +57,91 @@ class Collector:
 		self.allow_timeseries	= allow_timeseries
 		self.interval_minutes	= interval_minutes # default of 1440 is one day
 		self.dnt = dnt
-
-		# set the correct ua string for chrome, only do once
-		if 'chrome' in browser_types:
-			chrome_driver = ChromeDriver(dnt=dnt)
-			self.chrome_ua = chrome_driver.get_ua_for_headless()
+		self.ip_resolution		= ip_resolution
+
+		# when ingest_writer is True the browser workers don't touch the db, they put
+		#	page records on a queue which is emptied by a single IngestWriter process
+		self.ingest_writer		= ingest_writer
+		self.ingest_queue_depth	= ingest_queue_depth
+		self.ingest_batch_size	= ingest_batch_size
+		self.page_record_queue	= None
+		self.ingest_ack_queue	= None
+
+		# how many pages each chrome may load before we replace it, 1 means 
+		#	every page gets a brand new browser
+		self.browser_max_pages	= browser_max_pages
+
+		# read network events from the DevTools websocket rather than the performance log
+		self.stream_network_events = stream_network_events
+
+		# if set we stop waiting on a page once the network has been quiet this many
+		#	seconds, browser_wait is then the most we wait
+		self.network_idle_seconds = network_idle_seconds
+
+		# when pages_per_worker is over 1 each process loads that many pages at once,
+		#	see AsyncScheduler, max_concurrent_pages caps the total across all of
+		#	them and defaults to every slot being busy
+		self.pages_per_worker		= pages_per_worker
+		self.max_concurrent_pages	= max_concurrent_pages
+		self.worker_memory_limit_mb	= worker_memory_limit_mb
+
+		# if set no more than this many pages on one registrable domain are loaded
+		#	at once, see PoliteScheduler
+		self.max_pages_per_domain = max_pages_per_domain
+
+		# take urls from the shared work queue rather than the page list
+		self.use_work_queue	= use_work_queue
+		self.lease_seconds	= lease_seconds
+
+		# timeseries collections load the same pages over and over, so there is
+		#	nothing to resume, otherwise the journal is opened in run once we
+		#	know which db it goes with
+		self.use_crawl_journal		= not allow_timeseries
+		self.max_attempts			= max_attempts
+		self.retry_backoff_seconds	= retry_backoff_seconds
+		self.crawl_journal			= None
+
+		# how often to print progress while reading the page list and collecting
+		self.progress_interval	= 1000
+
+		# load the pubsuffix trie here so the forked pool workers 
+		#	inherit it rather than each reading it from disk
+		ParseURL()
+
+		# the correct ua string for chrome, this starts a browser so it is
+		#	looked up once run starts rather than here, that way enqueue_urls
+		#	doesn't need chrome (or selenium), see set_chrome_ua
+		self.chrome_ua = None
 	# __init__
 
+	def set_chrome_ua(self):
+		"""
+		sets the ua string chrome is run with, only done once
+		"""
+		if self.chrome_ua is not None or 'chrome' not in self.browser_types: return
+		from webxray.ChromeDriver import ChromeDriver
+		chrome_driver = ChromeDriver(dnt=self.dnt)
+		self.chrome_ua = chrome_driver.get_ua_for_headless()
+	# set_chrome_ua
+
 	def print_runtime(self):
 		print('\t-----------------------------------------')
 		print('\t Collection Finished in %s!' % str(datetime.now()-self.startTime))
 		print('\t-----------------------------------------')
 	# print_runtime
 
-	def process_url(self, url):
+	def process_url(self, url, chrome_driver=None):
 		"""
 		this function takes a specified url, loads it in the browser (currently phantomjs)
 			and returns json-formatted output with relevant request data, etc.
 
 		the output_store class then puts this data in the db for later analysis
+
+		chrome_driver may be passed in when the caller manages its own browsers, 
+			otherwise see get_chrome_driver
+
+		returns True if the page was stored (or handed to the ingest writer), 
+			False if it failed and should be tried again
 		"""
 
 		# set up sql connection used to log errors and do timeseries checks
@@ -70,18 +156,25 @@ class Collector:
 			sql_driver = SQLiteDriver(self.db_name)
 
 		# output store does the heavy lifting of analyzing browser output and storing to db
-		output_store = OutputStore(self.db_engine, self.db_name)
+		output_store = OutputStore(self.db_engine, self.db_name, ip_resolution=self.ip_resolution)
+
+		# every time a page goes in flight is one attempt
+		if self.crawl_journal: self.crawl_journal.record(url, 'in_flight')
 
 		# support for loading same page with multiple browsers - purposefully undocumented 
+		page_stored = True
 		for browser_type in self.browser_types:
 
 			# import and set up specified browser driver
 			# 	note we need to set up a new browser each time to 
 			#	get a fresh profile
 			if browser_type == 'phantomjs':
+				from webxray.PhantomDriver import PhantomDriver
 				browser_driver 	= PhantomDriver()
+			elif browser_type == 'chrome' and chrome_driver is not None:
+				browser_driver 	= chrome_driver
 			elif browser_type == 'chrome':
-				browser_driver 	= ChromeDriver(ua=self.chrome_ua, dnt=self.dnt)
+				browser_driver 	= self.get_chrome_driver()
 
 			# support for timeseries collections - purposefully undocumented 
 			if self.allow_timeseries:
@@ -97,80 +190,121 @@ class Collector:
 				browser_output = browser_driver.get_webxray_scan_data(url, self.browser_wait)
 			except:
 				print('\t\t%-50s Browser %s Did Not Return' % (url[:50], browser_type))
-				sql_driver.log_error(url, 'Unable to load page')
+				self.log_error(sql_driver, output_store, url, 'Unable to load page')
 				sql_driver.close()
-				return
+				return False
 			
 			# if there was a problem we log the error
 			if browser_output['success'] == False:
 				print('\t\t%-50s Browser %s Error: %s' % (url[:50], browser_type, browser_output['result']))
-				sql_driver.log_error(url, 'Unable to load page')
+				self.log_error(sql_driver, output_store, url, 'Unable to load page')
 				sql_driver.close()
-				return
+				return False
 			else:
 				# no error, treat result as browser output
 				browser_output = browser_output['result']
 
+			# hand the output off to the ingest writer
+			if self.page_record_queue is not None:
+				self.page_record_queue.put(output_store.build_page_record(url, browser_output))
+				print('\t\t%-50s Queued with %s' % (url[:50],browser_type))
+				continue
+
 			# attempt to store the output
 			if output_store.store(url, browser_output):
 				print('\t\t%-50s Success with %s' % (url[:50],browser_type))
+				if self.crawl_journal: self.crawl_journal.record(url, 'done')
 			else:
 				print('\t\t%-50s Fail with %s' % (url[:50],browser_type))
-				sql_driver.log_error(url, 'Unable to load page')
+				self.log_error(sql_driver, output_store, url, 'Unable to load page')
+				page_stored = False
 
 		sql_driver.close()
-		return
+		return page_stored
 	# process_url
 
-	def run(self, pool_size):
+	def process_queued_url(self, url):
 		"""
-		this function manages the parallel processing of the url list using the python Pool class
+		runs process_url and returns the url along with whether the page was
+			stored, so the pool tells us which page finished and how
+		"""
+		return (url, self.process_url(url))
+	# process_queued_url
+
+	def get_chrome_driver(self):
+		"""
+		when browser_max_pages is over 1 this returns a ChromeDriver which lives for 
+			as long as this pool worker and keeps its browser open between pages, 
+			otherwise we get a new ChromeDriver which starts a new browser per page
 
-		the function first reads the list of urls out of the page_lists directory, cleans it
-			for known issues (eg common binary files), and issues with idna encoding (tricky!)
+		the browser is shut down when the worker exits, note this only happens
+			if the pool is closed and joined rather than terminated
+		"""
+		global worker_chrome_driver
 
-		then the page list is mapped to the process_url function  and executed in parallell
+		if self.browser_max_pages <= 1:
+			return self.new_chrome_driver()
 
-		pool_size is defined in the run_webxray.py file, see details there
+		if worker_chrome_driver is None:
+			worker_chrome_driver = self.new_chrome_driver()
+			multiprocessing.util.Finalize(worker_chrome_driver, worker_chrome_driver.quit, exitpriority=10)
+		return worker_chrome_driver
+	# get_chrome_driver
+
+	def new_chrome_driver(self):
+		"""
+		returns a ChromeDriver with our settings, the browser itself is not
+			started until the first page
+		"""
+		from webxray.ChromeDriver import ChromeDriver
+		return ChromeDriver(
+			ua=self.chrome_ua, 
+			dnt=self.dnt, 
+			max_pages_per_browser=self.browser_max_pages, 
+			stream_network_events=self.stream_network_events, 
+			network_idle_seconds=self.network_idle_seconds
+		)
+	# new_chrome_driver
+
+	def get_url_digest(self, url):
 		"""
+		returns the first 8 bytes of the md5 of the url as an int, these take up 
+			far less memory than the url itself so we can keep track of millions
+		"""
+		return int.from_bytes(hashlib.md5(url.encode('utf-8')).digest()[:8], 'big')
+	# get_url_digest
 
-		# the list of url MUST be in the page_lists directory!
-		try:
-			url_list = open(os.path.dirname(os.path.abspath(__file__)) + '/../page_lists/' + self.pages_file_name, 'r', encoding='utf-8')
-		except:
-			print('File "%s" does not exist, file must be in ./page_lists directory.  Exiting.' % self.pages_file_name)
-			exit()
+	def get_urls_to_process(self, url_list, existing_url_digests, journal_entries, queued_url_digests):
+		"""
+		reads the page list one line at a time and yields each url we should
+			process, cleaning up known issues (eg common binary files) and issues 
+			with idna encoding (tricky!) along the way
 
-		# set up sql connection used to determine if items are already in the db
-		if self.db_engine == 'mysql':		
-			from webxray.MySQLDriver import MySQLDriver
-			sql_driver = MySQLDriver(self.db_name)
-		elif self.db_engine == 'postgres':	
-			from webxray.PostgreSQLDriver import PostgreSQLDriver
-			sql_driver = PostgreSQLDriver(self.db_name)
-		elif self.db_engine == 'sqlite':	
-			from webxray.SQLiteDriver import SQLiteDriver
-			sql_driver = SQLiteDriver(self.db_name)
+		pages the journal has as done, as out of attempts, or as still waiting 
+			out their backoff are skipped
 
-		# this list gets mapped to the Pool, very important!
-		urls_to_process = set()
+		this is read by the PoliteScheduler as it hands out work, so we only read 
+			as far ahead of the browsers as it needs to
+
+		the digest of each url we hand out is added to queued_url_digests
+		"""
+
+		# simple counters used solely for updates to CLI
+		count			= 0
+		skipped_count	= 0
 
-		# simple counter used solely for updates to CLI
-		count = 0
-		
-		print('\t------------------------')
-		print('\t Building List of Pages ')
-		print('\t------------------------')
-				
 		for url in url_list:
 			# skip lines that are comments
 			if "#" in url[0]: continue
 		
 			count += 1
+			if count % self.progress_interval == 0:
+				print('		Read %s addresses, %s queued, %s skipped' % (count, len(queued_url_digests), skipped_count))
 		
 			# only do lines starting with https?://
 			if not (re.match('^https?://.+', url)):
 				print("\t\t%s | %-50s Not a valid address, Skipping." % (count, url[:50]))
+				skipped_count += 1
 				continue
 
 			# non-ascii domains will crash phantomjs, so we need to convert them to 
@@ -185,26 +319,147 @@ class Collector:
 			# if it is a m$ office or other doc, skip
 			if re.match('.+(pdf|ppt|pptx|doc|docx|txt|rtf|xls|xlsx)$', url):
 				print("\t\t%s | %-50s Not an HTML document, Skipping." % (count, url[:50]))
+				skipped_count += 1
 				continue
 
-			# skip if in db already unless we are doing a timeseries
-			if self.allow_timeseries == False:
-				if sql_driver.page_exists(url):
-					print("\t\t%s | %-50s Exists in DB, Skipping." % (count, url[:50]))
+			url_digest = self.get_url_digest(url)
+
+			# skip if in db already unless we are doing a timeseries, or if we 
+			#	already queued it
+			if url_digest in existing_url_digests or url_digest in queued_url_digests:
+				skipped_count += 1
+				continue
+
+			# see if the journal has anything to say
+			if url_digest in journal_entries:
+				journal_entry = journal_entries[url_digest]
+				if journal_entry[0] == 'done':
+					skipped_count += 1
 					continue
-	
-			# only add if not in list already
-			if url not in urls_to_process:
-				print("\t\t%s | %-50s Adding." % (count, url[:50]))
-				urls_to_process.add(url)
-			else:
-				print("\t\t%s | %-50s Already queued, Skipping." % (count, url[:50]))
+				if journal_entry[0] == 'failed':
+					retry_time = self.crawl_journal.get_retry_time(journal_entry)
+					if retry_time is None or retry_time > time.time():
+						skipped_count += 1
+						continue
+
+			queued_url_digests.add(url_digest)
+			yield url
+
+		print('\t\tRead %s addresses, %s queued, %s skipped' % (count, len(queued_url_digests), skipped_count))
+	# get_urls_to_process
+
+	def open_page_list(self):
+		"""
+		opens the page list, which MUST be in the page_lists directory!
+		"""
+		try:
+			return open(os.path.dirname(os.path.abspath(__file__)) + '/../page_lists/' + self.pages_file_name, 'r', encoding='utf-8')
+		except:
+			print('File "%s" does not exist, file must be in ./page_lists directory.  Exiting.' % self.pages_file_name)
+			exit()
+	# open_page_list
+
+	def enqueue_urls(self):
+		"""
+		puts the urls of the page list which we would process on the shared work 
+			queue, after which any number of nodes may work through it with 
+			use_work_queue, see WorkQueue
+
+		pages already in the db are left out, the same list may be enqueued
+			again to add pages without duplicating those already queued
+		"""
+		url_list = self.open_page_list()
+
+		if self.db_engine == 'mysql':		
+			from webxray.MySQLDriver import MySQLDriver
+			sql_driver = MySQLDriver(self.db_name)
+		elif self.db_engine == 'postgres':	
+			from webxray.PostgreSQLDriver import PostgreSQLDriver
+			sql_driver = PostgreSQLDriver(self.db_name)
+		elif self.db_engine == 'sqlite':	
+			from webxray.SQLiteDriver import SQLiteDriver
+			sql_driver = SQLiteDriver(self.db_name)
+
+		# the work queue is part of the current schema
+		if sql_driver.migrate_db():
+			print('\tMigrated %s to the current schema' % self.db_name)
+
+		existing_url_digests = set()
+		for start_url_md5 in sql_driver.get_page_start_url_md5s():
+			existing_url_digests.add(int(start_url_md5[:16], 16))
+		sql_driver.close()
+
+		# the journal here only knows about pages this node loaded, so it isn't
+		#	used to skip pages
+		work_queue = WorkQueue(self.db_engine, self.db_name, max_attempts=self.max_attempts)
+		url_count = work_queue.enqueue(self.get_urls_to_process(url_list, existing_url_digests, {}, set()))
+		url_list.close()
+
+		work_queue_counts = work_queue.get_counts()
+		print('\t\t%s pages enqueued, the queue has %s queued, %s leased, %s done, and %s failed' % (url_count, work_queue_counts['queued'], work_queue_counts['leased'], work_queue_counts['done'], work_queue_counts['failed']))
+	# enqueue_urls
+
+	def run(self, pool_size):
+		"""
+		this function manages the parallel processing of the url list using the python Pool class
+
+		the list of urls is read out of the page_lists directory by get_urls_to_process and 
+			fed to the process_url function, which is executed in parallel, browsing 
+			starts as soon as we have the first url and only a few urls are read 
+			ahead of the pool at any time, so very long lists are no problem
+
+		pool_size is defined in the run_webxray.py file, see details there
+		"""
+
+		if self.use_work_queue:
+			url_list = None
+		else:
+			url_list = self.open_page_list()
+
+		# the pool workers all use the same ua, so it is set before they start
+		self.set_chrome_ua()
+
+		# set up sql connection used to determine if items are already in the db
+		if self.db_engine == 'mysql':		
+			from webxray.MySQLDriver import MySQLDriver
+			sql_driver = MySQLDriver(self.db_name)
+		elif self.db_engine == 'postgres':	
+			from webxray.PostgreSQLDriver import PostgreSQLDriver
+			sql_driver = PostgreSQLDriver(self.db_name)
+		elif self.db_engine == 'sqlite':	
+			from webxray.SQLiteDriver import SQLiteDriver
+			sql_driver = SQLiteDriver(self.db_name)
+
+		# pages are stored with the current schema so older dbs must be brought up to date
+		if sql_driver.migrate_db():
+			print('\tMigrated %s to the current schema' % self.db_name)
+
+		# rather than ask the db about every url we load the md5s of the pages
+		#	we already have once and check against them in memory, the 
+		#	start_url_md5 is hex so the first 16 characters are 8 bytes
+		existing_url_digests = set()
+		if self.allow_timeseries == False:
+			for start_url_md5 in sql_driver.get_page_start_url_md5s():
+				existing_url_digests.add(int(start_url_md5[:16], 16))
+
+		# the journal goes with this db rather than any db of the same name
+		if self.use_crawl_journal:
+			self.crawl_journal = CrawlJournal(self.db_engine, self.db_name, sql_driver.get_db_id(), self.max_attempts, self.retry_backoff_seconds)
 
 		# close the db connection
 		sql_driver.close()
 
+		# pick up where we left off
+		if self.crawl_journal:
+			journal_entries = self.crawl_journal.load()
+		else:
+			journal_entries = {}
+
 		print('\t----------------------------------')
-		print('\t%s addresses will now be webXray\'d'  % len(urls_to_process))
+		print('\t Starting Collection ')
+		print('\t\t%s pages already in the db will be skipped' % len(existing_url_digests))
+		if len(journal_entries) > 0:
+			print('\t\t%s pages in the journal, %s of which failed' % (len(journal_entries), len([entry for entry in journal_entries.values() if entry[0] == 'failed'])))
 		print('\t\tBrowser(s) are %s' % self.browser_types)
 		print('\t\tBrowser wait time is %s seconds' % self.browser_wait)
 		print('\t\t...you can go take a walk. ;-)')
@@ -218,10 +473,232 @@ class Collector:
 		#	we get an error
 		if sys.platform == 'darwin' and multiprocessing.get_start_method(allow_none=True) != 'forkserver':
 			multiprocessing.set_start_method('forkserver')
-		myPool = multiprocessing.Pool(pool_size)
-		myPool.map(self.process_url, urls_to_process)
+
+		# start up the writer, the queue is bounded so workers wait on it
+		#	rather than piling up records in memory if the db falls behind
+		if self.ingest_writer:
+			manager = multiprocessing.Manager()
+			self.page_record_queue = manager.Queue(self.ingest_queue_depth)
+			self.ingest_ack_queue = manager.Queue()
+			ingest_writer = IngestWriter(self.db_engine, self.db_name, self.ingest_batch_size, crawl_journal=self.crawl_journal)
+			writer_process = multiprocessing.Process(target=ingest_writer.run, args=(self.page_record_queue, self.ingest_ack_queue))
+			writer_process.start()
+
+		if pool_size is None: pool_size = os.cpu_count()
+
+		queued_url_digests = set()
+		if self.use_work_queue:
+			processed_count = self.process_work_queue(pool_size, queued_url_digests)
+		else:
+			processed_count = self.process_urls(pool_size, self.get_urls_to_process(url_list, existing_url_digests, journal_entries, queued_url_digests))
+			url_list.close()
+
+		# go back over pages from this run which failed, each round waits until the 
+		#	first of them is due and ends once they are done or out of attempts,
+		#	pages from the work queue are retried through the queue instead
+		while self.crawl_journal and not self.use_work_queue:
+			# the writer marks pages done or failed, so it has to catch up first
+			if self.ingest_writer: self.flush_ingest_writer()
+
+			# only what was written since we last looked is read
+			self.crawl_journal.update(journal_entries)
+
+			retry_entries = []
+			for url_digest, journal_entry in journal_entries.items():
+				if journal_entry[0] != 'failed': continue
+				if url_digest not in queued_url_digests: continue
+				retry_time = self.crawl_journal.get_retry_time(journal_entry)
+				if retry_time is None: continue
+				retry_entries.append((retry_time, journal_entry[3]))
+			if len(retry_entries) == 0: break
+
+			retry_entries.sort()
+			wait_seconds = max(0, retry_entries[0][0]-time.time())
+			print('\t\tRetrying %s failed pages, the first in %s seconds' % (len(retry_entries), int(wait_seconds)))
+			time.sleep(wait_seconds)
+
+			processed_count += self.process_urls(pool_size, self.get_urls_to_process([url for retry_time, url in retry_entries], set(), journal_entries, set()))
+
+		print('\t\t%s pages processed' % processed_count)
+
+		# tell the writer we are done and wait for it to empty the queue
+		if self.ingest_writer:
+			self.page_record_queue.put(None)
+			writer_process.join()
+			manager.shutdown()
+			self.page_record_queue = None
+			self.ingest_ack_queue = None
 
 		# FYI
 		self.print_runtime()
 	# run
+
+	def flush_ingest_writer(self):
+		"""
+		waits until the ingest writer has stored every record queued so far
+		"""
+		self.page_record_queue.put(FLUSH)
+		self.ingest_ack_queue.get()
+	# flush_ingest_writer
+
+	def get_polite_scheduler(self, max_in_flight, work_queue=None):
+		"""
+		returns a PoliteScheduler for max_in_flight pages, leased urls are only
+			ours for a while so we don't read further ahead of the browsers 
+			than we can use
+		"""
+		if work_queue is None:
+			return PoliteScheduler(max_in_flight, self.max_pages_per_domain)
+		return PoliteScheduler(max_in_flight, self.max_pages_per_domain, lookahead=max_in_flight)
+	# get_polite_scheduler
+
+	def process_work_queue(self, pool_size, queued_url_digests):
+		"""
+		processes urls leased from the work queue until every url in it is done, 
+			returns how many pages were processed
+
+		when there is nothing left to lease but other nodes still hold leases 
+			we wait around in case any of them run out
+		"""
+		work_queue = WorkQueue(self.db_engine, self.db_name, self.lease_seconds, lease_batch_size=pool_size, max_attempts=self.max_attempts)
+
+		processed_count = 0
+		while True:
+			work_queue_counts = work_queue.get_counts()
+			if work_queue_counts['queued'] > 0:
+				processed_count += self.process_urls(pool_size, self.get_leased_urls_to_process(work_queue, queued_url_digests), work_queue)
+			elif work_queue_counts['leased'] > 0:
+				print('\t\tWaiting on %s pages leased by other collectors' % work_queue_counts['leased'])
+				time.sleep(work_queue.poll_seconds)
+			else:
+				break
+
+		if work_queue_counts['failed'] > 0:
+			print('\t\t%s pages in the work queue failed after %s attempts' % (work_queue_counts['failed'], self.max_attempts))
+
+		work_queue.stop()
+		return processed_count
+	# process_work_queue
+
+	def get_leased_urls_to_process(self, work_queue, queued_url_digests):
+		"""
+		yields urls as they are leased from the work queue, these were checked
+			by get_urls_to_process when they were enqueued
+
+		as with get_urls_to_process the digest of each url we hand out is added 
+			to queued_url_digests, so pages which fail here are retried here
+		"""
+		for url in work_queue.get_leased_urls():
+			queued_url_digests.add(self.get_url_digest(url))
+			yield url
+	# get_leased_urls_to_process
+
+	def process_urls(self, pool_size, urls_to_process, work_queue=None):
+		"""
+		runs every url from urls_to_process through process_url, either in a 
+			Pool or with run_async_workers, returns how many pages were processed
+
+		if the urls were leased from work_queue each is marked as finished there
+			once done
+		"""
+		if self.pages_per_worker > 1:
+			return self.run_async_workers(pool_size, urls_to_process, work_queue)
+
+		# the pool reads urls as fast as it can, so we limit how many may be 
+		#	waiting on or in the browsers at once, each finished page frees up 
+		#	a slot for the next
+		polite_scheduler = self.get_polite_scheduler(pool_size*2, work_queue)
+
+		processed_count = 0
+		myPool = multiprocessing.Pool(pool_size)
+		for url, page_stored in myPool.imap_unordered(self.process_queued_url, polite_scheduler.schedule(urls_to_process)):
+			polite_scheduler.finished(url)
+			if work_queue: work_queue.finish(url, page_stored)
+			processed_count += 1
+			if processed_count % self.progress_interval == 0:
+				print('\t\t%s pages processed in %s' % (processed_count, str(datetime.now()-self.startTime)))
+		myPool.close()
+		myPool.join()
+
+		return processed_count
+	# process_urls
+
+	def run_async_workers(self, pool_size, urls_to_process, work_queue=None):
+		"""
+		starts pool_size processes which each run an AsyncScheduler with 
+			pages_per_worker slots, and feeds them urls
+
+		a url is only handed out once there are fewer than max_concurrent_pages 
+			in flight, finished pages come back on done_queue which frees up 
+			their place for the next
+
+		returns how many pages were processed
+		"""
+		slot_count = pool_size*self.pages_per_worker
+		if self.max_concurrent_pages:
+			polite_scheduler = self.get_polite_scheduler(self.max_concurrent_pages, work_queue)
+		else:
+			polite_scheduler = self.get_polite_scheduler(slot_count, work_queue)
+
+		manager		= multiprocessing.Manager()
+		url_queue	= manager.Queue()
+		done_queue	= manager.Queue()
+
+		async_scheduler = AsyncScheduler(self.process_url, self.new_chrome_driver, self.pages_per_worker, self.worker_memory_limit_mb)
+		workers = []
+		for worker_num in range(pool_size):
+			worker = multiprocessing.Process(target=async_scheduler.run, args=(url_queue, done_queue))
+			worker.start()
+			workers.append(worker)
+
+		# finished pages are counted on their own thread as we block below
+		#	whenever the workers are full
+		processed = {'count': 0}
+		done_thread = threading.Thread(target=self.count_finished_pages, args=(done_queue, polite_scheduler, processed, work_queue))
+		done_thread.start()
+
+		for url in polite_scheduler.schedule(urls_to_process):
+			url_queue.put(url)
+
+		# one None for each slot to shut it down
+		for slot in range(slot_count):
+			url_queue.put(None)
+
+		for worker in workers:
+			worker.join()
+
+		done_queue.put(None)
+		done_thread.join()
+		manager.shutdown()
+
+		return processed['count']
+	# run_async_workers
+
+	def count_finished_pages(self, done_queue, polite_scheduler, processed, work_queue=None):
+		"""
+		reads finished (url, page_stored) off done_queue until we get None, each 
+			one frees up a place for another page
+		"""
+		while True:
+			finished_page = done_queue.get()
+			if finished_page is None: break
+			url, page_stored = finished_page
+			polite_scheduler.finished(url)
+			if work_queue: work_queue.finish(url, page_stored)
+			processed['count'] += 1
+			if processed['count'] % self.progress_interval == 0:
+				print('\t\t%s pages processed in %s' % (processed['count'], str(datetime.now()-self.startTime)))
+	# count_finished_pages
+
+	def log_error(self, sql_driver, output_store, url, msg):
+		"""
+		logs an error directly or via the ingest writer, and notes the failure 
+			in the journal so the page is retried
+		"""
+		if self.crawl_journal: self.crawl_journal.record(url, 'failed', msg)
+		if self.page_record_queue is not None:
+			self.page_record_queue.put(output_store.build_error_record(url, msg))
+		else:
+			sql_driver.log_error(url, msg)
+	# log_error
 # class Collector
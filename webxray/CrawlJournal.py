@@ -0,0 +1,166 @@
+# standard python libs
+import os
+import json
+import time
+import hashlib
+
+class CrawlJournal:
+	"""
+		Keeps track of where a collection is up to so it can pick up where it left off
+			after a crash, and so pages which fail are retried a bounded number of
+			times with a growing wait between attempts rather than on every run.
+
+		The journal is an append-only file with one json line per change of state:
+
+			[time, state, url_digest, attempts, url, msg]
+
+		where state is one of 'in_flight', 'done', or 'failed' and attempts is how many
+			attempts the line adds, each 'in_flight' line is one attempt.  Lines are
+			small and written with a single append so every pool worker (and the
+			ingest writer) can share the file without locking, a line cut short by
+			a crash is ignored when the journal is read back.
+
+		Only the url digest and latest state of each page are kept in memory, the url
+			is only kept for failed pages as those are the ones we go back to.  When
+			the journal is loaded at the start of a run it is compacted down to one
+			line per page so it doesn't grow with every run, after that new lines
+			are read with update rather than reading the whole file again.
+
+		A page which was in flight when we crashed counts as a failed attempt.
+
+		The journal goes with one db, the db_id is kept in the db's meta table (see
+			get_db_id in the sql drivers) so a db which is dropped and created again
+			with the same name starts a new journal.
+	"""
+
+	def __init__(self, db_engine, db_name, db_id, max_attempts=3, retry_backoff_seconds=60):
+		self.max_attempts			= max_attempts
+		self.retry_backoff_seconds	= retry_backoff_seconds
+
+		journal_dir = os.path.dirname(os.path.abspath(__file__))+'/resources/journal/'
+		if not os.path.exists(journal_dir):
+			os.makedirs(journal_dir, exist_ok=True)
+		self.journal_path = journal_dir+'%s_%s_%s.journal' % (db_engine, db_name, db_id)
+
+		# file descriptors can't be shared across a fork, so we
+		#	keep track of which process opened it
+		self.journal_fd		= None
+		self.journal_pid	= None
+
+		# how far into the journal load and update have read
+		self.read_offset	= 0
+	# __init__
+
+	def get_journal_fd(self):
+		"""
+		returns a file descriptor opened for appending in this process
+
+		another collector on the same db may have compacted the journal since we
+			opened it, in which case ours is the old file and we open it again
+		"""
+		if self.journal_fd is not None and self.journal_pid == os.getpid():
+			try:
+				if os.fstat(self.journal_fd).st_ino == os.stat(self.journal_path).st_ino:
+					return self.journal_fd
+			except FileNotFoundError:
+				pass
+			os.close(self.journal_fd)
+		self.journal_fd		= os.open(self.journal_path, os.O_WRONLY|os.O_APPEND|os.O_CREAT, 0o644)
+		self.journal_pid	= os.getpid()
+		return self.journal_fd
+	# get_journal_fd
+
+	def record(self, url, state, msg=None):
+		"""
+		appends a change of state for the url to the journal
+		"""
+		if state == 'in_flight':
+			attempts = 1
+		else:
+			attempts = 0
+		line = json.dumps([time.time(), state, self.get_url_digest(url), attempts, url, msg])+'\n'
+		os.write(self.get_journal_fd(), line.encode('utf-8'))
+	# record
+
+	def get_url_digest(self, url):
+		"""
+		same as Collector.get_url_digest, the first 8 bytes of the md5 of the url
+		"""
+		return int.from_bytes(hashlib.md5(url.encode('utf-8')).digest()[:8], 'big')
+	# get_url_digest
+
+	def load(self):
+		"""
+		reads the journal back, returns a dict keyed on url digest of the latest
+			state of each url along with how many attempts it has had
+
+			{url_digest: (state, attempts, time, url, msg)}
+
+		url and msg are None once a page is done
+
+		the journal is rewritten with one line per url, see compact, so this is 
+			only done once at the start of a run before our workers start writing
+		"""
+		entries = {}
+		self.read_offset = 0
+		if not os.path.exists(self.journal_path): return entries
+		self.update(entries)
+
+		# a page we were working on when we went down is a failed attempt
+		for url_digest, (state, attempts, entry_time, url, msg) in entries.items():
+			if state == 'in_flight':
+				entries[url_digest] = ('failed', attempts, entry_time, url, 'Interrupted')
+
+		self.compact(entries)
+		return entries
+	# load
+
+	def update(self, entries):
+		"""
+		adds the lines written since the last load or update to entries
+
+		a line still being written when we read is left for next time
+		"""
+		with open(self.journal_path, 'rb') as journal_file:
+			journal_file.seek(self.read_offset)
+			for line in journal_file:
+				if not line.endswith(b'\n'): break
+				self.read_offset += len(line)
+
+				try:
+					entry_time, state, url_digest, attempts, url, msg = json.loads(line)
+				except:
+					continue
+
+				if url_digest in entries:
+					attempts += entries[url_digest][1]
+				if state == 'done':
+					url, msg = None, None
+				entries[url_digest] = (state, attempts, entry_time, url, msg)
+	# update
+
+	def compact(self, entries):
+		"""
+		rewrites the journal with one line per url, the new file is swapped in
+			whole so a crash part way leaves the old one in place
+		"""
+		compact_path = self.journal_path+'.compact'
+		with open(compact_path, 'w', encoding='utf-8') as compact_file:
+			for url_digest, (state, attempts, entry_time, url, msg) in entries.items():
+				compact_file.write(json.dumps([entry_time, state, url_digest, attempts, url, msg])+'\n')
+		os.replace(compact_path, self.journal_path)
+
+		# get_journal_fd sees the file has changed and opens the new one
+		self.read_offset = os.path.getsize(self.journal_path)
+	# compact
+
+	def get_retry_time(self, entry):
+		"""
+		when a failed page may next be tried, the wait doubles with each attempt,
+			returns None if it has run out of attempts
+		"""
+		state, attempts, entry_time, url, msg = entry
+		if attempts >= self.max_attempts: return None
+		return entry_time + self.retry_backoff_seconds*(2**(attempts-1))
+	# get_retry_time
+# CrawlJournal
@@ -0,0 +1,289 @@
+# standard python libs
+import os
+import time
+import queue
+import socket
+import sqlite3
+import threading
+import concurrent.futures
+from collections import OrderedDict
+
+class DNSResolver:
+	"""
+		Resolves fqdns to ip addresses with a cache in front of socket.gethostbyname.
+
+		Lookups are cached in memory for the life of the process and in a small sqlite
+			table which is shared by all of the pool workers on this machine.  Successful
+			lookups are kept for positive_ttl seconds and failed lookups for negative_ttl
+			seconds so hosts which don't resolve aren't retried over and over.
+
+		The shared table is purely a cache, if it can't be opened or is locked we carry
+			on with the in-memory cache and do the lookup ourselves.
+
+		resolve_many hands lookups to daemon threads which live as long as the process,
+			so a resolver which hangs can't hold up the process exiting.
+	"""
+
+	def __init__(self, positive_ttl=3600, negative_ttl=300, cache_path=None, lookup_function=socket.gethostbyname, memory_cache_size=10000):
+		self.positive_ttl		= positive_ttl
+		self.negative_ttl		= negative_ttl
+		self.lookup_function	= lookup_function
+		self.memory_cache_size	= memory_cache_size
+
+		# by default the shared cache lives in the resources directory
+		if cache_path:
+			self.cache_path = cache_path
+		else:
+			self.cache_path = os.path.dirname(os.path.abspath(__file__))+'/resources/dns/dns_cache.db'
+
+		# fqdn -> (ip_addr, expires), ip_addr is None for failed lookups, kept 
+		#	to a bounded lru like the netloc cache in ParseURL as a long crawl 
+		#	sees far more hosts than we need to hold on to, it is written by 
+		#	the lookup threads as well so it has a lock
+		self.memory_cache		= OrderedDict()
+		self.memory_cache_lock	= threading.Lock()
+
+		# sqlite connections can't be shared across a fork or between threads, 
+		#	so each thread keeps its own along with the process that opened it
+		self.cache_local = threading.local()
+
+		# hits are split by where we found them, negative_hits are the
+		#	subset of hits which were cached failures
+		self.stats = {
+			'memory_hits'	: 0,
+			'shared_hits'	: 0,
+			'negative_hits'	: 0,
+			'misses'		: 0
+		}
+		self.stats_lock = threading.Lock()
+
+		# (fqdn, future) pairs waiting on the lookup threads, threads don't
+		#	survive a fork so we keep track of which process started them
+		self.lookup_queue	= None
+		self.lookup_threads	= []
+		self.lookup_pid		= None
+		self.lookup_lock	= threading.Lock()
+	# __init__
+
+	def add_stat(self, name, count=1):
+		"""
+		the counters are updated from several threads, so under a lock
+		"""
+		with self.stats_lock:
+			self.stats[name] += count
+	# add_stat
+
+	def get_cache_conn(self):
+		"""
+		returns a connection to the shared cache for this process, or None
+			if the cache is unavailable
+		"""
+		cache_conn = getattr(self.cache_local, 'conn', None)
+		if cache_conn is not None and self.cache_local.pid == os.getpid():
+			return cache_conn
+
+		try:
+			if not os.path.exists(os.path.dirname(self.cache_path)):
+				os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+			cache_conn = sqlite3.connect(self.cache_path, timeout=1)
+			cache_conn.execute('PRAGMA journal_mode=WAL')
+			cache_conn.execute('PRAGMA synchronous=NORMAL')
+			cache_conn.execute('CREATE TABLE IF NOT EXISTS dns_cache(fqdn TEXT PRIMARY KEY,ip_addr TEXT,expires REAL)')
+			cache_conn.commit()
+		except:
+			cache_conn = None
+
+		self.cache_local.conn	= cache_conn
+		self.cache_local.pid	= os.getpid()
+		return cache_conn
+	# get_cache_conn
+
+	def get_cached(self, fqdn):
+		"""
+		checks the memory cache then the shared cache, returns a tuple of
+			(found, ip_addr) as ip_addr may legitimately be None
+		"""
+		now = time.time()
+
+		with self.memory_cache_lock:
+			cached = self.memory_cache.get(fqdn)
+			if cached is not None:
+				if cached[1] > now:
+					self.memory_cache.move_to_end(fqdn)
+				else:
+					self.memory_cache.pop(fqdn)
+					cached = None
+
+		if cached is not None:
+			self.add_stat('memory_hits')
+			if cached[0] is None: self.add_stat('negative_hits')
+			return (True, cached[0])
+
+		cache_conn = self.get_cache_conn()
+		if cache_conn:
+			try:
+				result = cache_conn.execute('SELECT ip_addr, expires FROM dns_cache WHERE fqdn = ?', (fqdn,)).fetchone()
+			except:
+				result = None
+
+			if result and result[1] > now:
+				self.set_memory_cached(fqdn, result[0], result[1])
+				self.add_stat('shared_hits')
+				if result[0] is None: self.add_stat('negative_hits')
+				return (True, result[0])
+
+		return (False, None)
+	# get_cached
+
+	def set_cached(self, fqdn, ip_addr, shared=True):
+		"""
+		stores the result of a lookup using the positive or negative ttl
+		"""
+		if ip_addr is None:
+			expires = time.time()+self.negative_ttl
+		else:
+			expires = time.time()+self.positive_ttl
+
+		self.set_memory_cached(fqdn, ip_addr, expires)
+
+		if shared:
+			cache_conn = self.get_cache_conn()
+			if cache_conn:
+				try:
+					cache_conn.execute('INSERT OR REPLACE INTO dns_cache (fqdn, ip_addr, expires) VALUES (?,?,?)', (fqdn, ip_addr, expires))
+					cache_conn.commit()
+				except:
+					pass
+	# set_cached
+
+	def set_memory_cached(self, fqdn, ip_addr, expires):
+		"""
+		adds to the memory cache, dropping the least recently used entries
+			once it is full
+		"""
+		with self.memory_cache_lock:
+			self.memory_cache[fqdn] = (ip_addr, expires)
+			self.memory_cache.move_to_end(fqdn)
+			while len(self.memory_cache) > self.memory_cache_size:
+				self.memory_cache.popitem(last=False)
+	# set_memory_cached
+
+	def lookup(self, fqdn):
+		"""
+		does the actual network lookup, returns None on failure
+		"""
+		try:
+			return self.lookup_function(fqdn)
+		except:
+			return None
+	# lookup
+
+	def get_ip_addr(self, fqdn):
+		"""
+		primary function of this class, returns the ip address of the fqdn
+			or None if it does not resolve
+		"""
+		found, ip_addr = self.get_cached(fqdn)
+		if found: return ip_addr
+
+		self.add_stat('misses')
+		ip_addr = self.lookup(fqdn)
+		self.set_cached(fqdn, ip_addr)
+		return ip_addr
+	# get_ip_addr
+
+	def get_lookup_queue(self, max_workers):
+		"""
+		returns the queue read by this process's lookup threads, starting 
+			threads until there are max_workers of them
+		"""
+		with self.lookup_lock:
+			if self.lookup_pid != os.getpid():
+				self.lookup_queue	= queue.Queue()
+				self.lookup_threads	= []
+				self.lookup_pid		= os.getpid()
+
+			while len(self.lookup_threads) < max_workers:
+				lookup_thread = threading.Thread(target=self.run_lookups, args=(self.lookup_queue,), daemon=True)
+				lookup_thread.start()
+				self.lookup_threads.append(lookup_thread)
+
+			return self.lookup_queue
+	# get_lookup_queue
+
+	def run_lookups(self, lookup_queue):
+		"""
+		body of each lookup thread, results are cached as they come in, so a 
+			lookup which finishes after resolve_many gave up on it is still
+			there for the next page
+		"""
+		while True:
+			fqdn, future = lookup_queue.get()
+			if not future.set_running_or_notify_cancel(): continue
+			ip_addr = self.lookup(fqdn)
+			self.set_cached(fqdn, ip_addr)
+			future.set_result(ip_addr)
+	# run_lookups
+
+	def resolve_many(self, fqdns, max_workers=32, deadline=10):
+		"""
+		resolves a batch of fqdns concurrently on the lookup threads, this way
+			a page with hundreds of hosts takes roughly as long as its slowest
+			lookup rather than the sum of all of them
+
+		anything that has not resolved by the deadline (in seconds) comes back as 
+			None but is not cached as a failure, if the lookup does finish later 
+			its result is cached then
+
+		returns a dict of fqdn -> ip_addr, the results are also cached so later
+			calls to get_ip_addr are free
+		"""
+		results		= {}
+		to_lookup	= []
+
+		for fqdn in set(fqdns):
+			found, ip_addr = self.get_cached(fqdn)
+			if found:
+				results[fqdn] = ip_addr
+			else:
+				to_lookup.append(fqdn)
+
+		if len(to_lookup) == 0: return results
+
+		self.add_stat('misses', len(to_lookup))
+
+		lookup_queue = self.get_lookup_queue(max_workers)
+		future_to_fqdn = {}
+		for fqdn in to_lookup:
+			future = concurrent.futures.Future()
+			future_to_fqdn[future] = fqdn
+			lookup_queue.put((fqdn, future))
+
+		done, not_done = concurrent.futures.wait(future_to_fqdn, timeout=deadline)
+
+		for future in done:
+			results[future_to_fqdn[future]] = future.result()
+
+		# lookups which haven't started are dropped, those already running
+		#	finish in the background
+		for future in not_done:
+			future.cancel()
+			results[future_to_fqdn[future]] = None
+
+		return results
+	# resolve_many
+
+	def get_stats(self):
+		"""
+		returns the hit/miss counters along with the overall hit rate
+		"""
+		with self.stats_lock:
+			stats = dict(self.stats)
+		total_hits = stats['memory_hits']+stats['shared_hits']
+		if total_hits+stats['misses'] > 0:
+			stats['hit_rate'] = total_hits/(total_hits+stats['misses'])
+		else:
+			stats['hit_rate'] = None
+		return stats
+	# get_stats
+# DNSResolver
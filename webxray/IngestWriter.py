@@ -0,0 +1,115 @@
+# standard python libs
+import time
+import queue
+
+# custom webxray classes
+from webxray.OutputStore import OutputStore
+
+# put on the queue to have the writer store everything ahead of it right away 
+#	and then put True on the ack queue, see Collector.flush_ingest_writer
+FLUSH = 'flush'
+
+class IngestWriter:
+	"""
+		Takes page records built by OutputStore.build_page_record off of a queue and
+			writes them to the db from a single process.
+
+		With many browser workers writing at once sqlite spends a lot of time waiting
+			on its lock (and sometimes gives up with "database is locked"), having one
+			writer means there is never any contention.  Records are written in batches
+			of up to batch_size pages per transaction so we don't pay for a commit per
+			page, a partial batch is written once batch_seconds have passed.
+
+		The queue should be bounded, once it is full the browser workers block on
+			putting new records until the writer catches up.  Putting None on the
+			queue tells the writer to finish up and exit, putting FLUSH makes it
+			write what it has and acknowledge on ack_queue.
+	"""
+
+	def __init__(self, db_engine, db_name, batch_size=50, batch_seconds=5, crawl_journal=None):
+		self.db_engine		= db_engine
+		self.db_name		= db_name
+		self.batch_size		= batch_size
+		self.batch_seconds	= batch_seconds
+
+		# pages are only done once they are in the db, so the writer marks them
+		self.crawl_journal	= crawl_journal
+	# __init__
+
+	def run(self, page_record_queue, ack_queue=None):
+		"""
+		main loop, reads from the queue until we get None
+
+		records are only taken off the queue in order, so by the time we ack 
+			a FLUSH everything put before it is in the db and the journal
+		"""
+		output_store	= OutputStore(self.db_engine, self.db_name, ip_resolution='skip')
+		sql_driver		= output_store.get_sql_driver()
+
+		finished = False
+		while not finished:
+			# wait as long as it takes for the first record of a batch
+			page_record = page_record_queue.get()
+			if page_record is None: break
+			if page_record == FLUSH:
+				ack_queue.put(True)
+				continue
+			batch = [page_record]
+			flush = False
+
+			# then fill up the batch until it is full or we run out of time
+			batch_deadline = time.time()+self.batch_seconds
+			while len(batch) < self.batch_size:
+				try:
+					page_record = page_record_queue.get(timeout=max(0, batch_deadline-time.time()))
+				except queue.Empty:
+					break
+				if page_record is None:
+					finished = True
+					break
+				if page_record == FLUSH:
+					flush = True
+					break
+				batch.append(page_record)
+
+			self.write_batch(output_store, sql_driver, batch)
+			if flush: ack_queue.put(True)
+
+		sql_driver.close()
+	# run
+
+	def write_batch(self, output_store, sql_driver, batch):
+		"""
+		writes the whole batch in one transaction, if that fails we don't know which
+			page caused it so fall back to writing them one at a time, that way one
+			bad page doesn't cost us the rest of the batch
+		"""
+		sql_driver.start_transaction()
+		try:
+			results = [output_store.store_page_record(sql_driver, page_record) for page_record in batch]
+			sql_driver.commit()
+		except:
+			sql_driver.rollback()
+			results = []
+			for page_record in batch:
+				sql_driver.start_transaction()
+				try:
+					results.append(output_store.store_page_record(sql_driver, page_record))
+					sql_driver.commit()
+				except Exception as e:
+					sql_driver.rollback()
+					sql_driver.log_error(page_record['url'], 'Error storing page: %s' % e)
+					results.append(False)
+
+		for page_record, page_stored in zip(batch, results):
+			# error records are only logged, nothing to report
+			if page_record['page'] is None: continue
+
+			if page_stored:
+				print('\t\t%-50s Stored' % page_record['url'][:50])
+				if self.crawl_journal: self.crawl_journal.record(page_record['url'], 'done')
+			else:
+				print('\t\t%-50s Failed to store' % page_record['url'][:50])
+				if self.crawl_journal: self.crawl_journal.record(page_record['url'], 'failed', 'Error storing page')
+	# write_batch
+# IngestWriter
@@ -1,6 +1,9 @@
 # stand python libs
 import os
+import uuid
 import datetime
+import threading
+from collections import OrderedDict
 
 # check if non-standard packages are installed
 try:
@@ -13,6 +16,17 @@ except:
 	print('***********************************************************************')
 	exit()
 
+# the version of the indexes and other additions in the migrate file, see migrate_db
+schema_version = 5
+
+# (db, fqdn) -> domain id, shared by every driver in the process so repeat
+#	domains cost no round trip, the db is the db name, ids never change once 
+#	a domain is committed so nothing needs to expire but it is kept to a 
+#	bounded lru like the netloc cache in ParseURL
+domain_id_cache = OrderedDict()
+domain_id_cache_size = 100000
+domain_id_cache_lock = threading.Lock()
+
 class MySQLDriver:
 	"""
 	this class handles all of the database work, no sql is to be found 
@@ -25,6 +39,10 @@ class MySQLDriver:
 			special care is gtakentfor the charset
 		"""
 
+		# see start_transaction
+		self.in_transaction		= False
+		self.pending_domain_ids	= {}
+
 		# the db_prefix can be overridden if you like
 		self.db_prefix = db_prefix
 
@@ -76,6 +94,7 @@ class MySQLDriver:
 		connect to a different database, does not require a new db connection in mysql
 		"""
 		self.db.execute('USE %s' % self.db_prefix+db_name)
+		self.db_name = self.db_prefix+db_name
 	# db_switch
 
 	def fetch_query(self, query):
@@ -95,6 +114,28 @@ class MySQLDriver:
 		return
 	# commit_query
 
+	def stream_query(self, query, params=(), chunk_size=10000):
+		"""
+		yields the rows of query chunk_size at a time from an unbuffered cursor,
+			our usual cursor is buffered so it would pull the whole result into 
+			memory before fetchmany got to it
+
+		nothing else can run on the connection until the rows are all read, so 
+			if we are stopped early the rest are read and dropped
+		"""
+		cursor = self.db_conn.cursor(buffered=False)
+		try:
+			cursor.execute(query, params)
+			while True:
+				rows = cursor.fetchmany(chunk_size)
+				if not rows: break
+				for row in rows:
+					yield row
+		finally:
+			if self.db_conn.unread_result: cursor.fetchall()
+			cursor.close()
+	# stream_query
+
 	def check_db_exist(self, db_name):
 		"""
 		before creating a new db make sure it doesn't already exist, uses specified prefix
@@ -144,6 +185,69 @@ class MySQLDriver:
 		self.db_conn.close()
 	# close
 
+	def start_transaction(self):
+		"""
+		until commit or rollback is called the add_* functions stop committing
+			after every row, this lets us write a whole page in one go
+		"""
+		self.in_transaction = True
+	# start_transaction
+
+	def commit(self):
+		"""
+		commits everything since start_transaction
+		"""
+		self.db_conn.commit()
+		self.in_transaction = False
+
+		# domains added during the transaction can now be cached
+		self.cache_domain_ids(self.pending_domain_ids)
+		self.pending_domain_ids = {}
+	# commit
+
+	def rollback(self):
+		"""
+		throws away everything since start_transaction
+		"""
+		self.db_conn.rollback()
+		self.in_transaction = False
+		self.pending_domain_ids = {}
+	# rollback
+
+	def commit_unless_in_transaction(self):
+		"""
+		the add_* functions commit each row unless we are in a transaction
+		"""
+		if not self.in_transaction:
+			self.db_conn.commit()
+	# commit_unless_in_transaction
+
+	def get_cached_domain_id(self, fqdn):
+		"""
+		returns the cached domain id for fqdn in the current db, or None
+		"""
+		cache_key = (self.db_name, fqdn)
+		with domain_id_cache_lock:
+			domain_id = domain_id_cache.get(cache_key)
+			if domain_id is not None:
+				domain_id_cache.move_to_end(cache_key)
+		return domain_id
+	# get_cached_domain_id
+
+	def cache_domain_ids(self, fqdn_to_domain_id):
+		"""
+		adds fqdn -> domain id pairs for the current db to the cache, dropping
+			the least recently used once it is full
+		"""
+		with domain_id_cache_lock:
+			for fqdn, domain_id in fqdn_to_domain_id.items():
+				cache_key = (self.db_name, fqdn)
+				domain_id_cache[cache_key] = domain_id
+				domain_id_cache.move_to_end(cache_key)
+			while len(domain_id_cache) > domain_id_cache_size:
+				domain_id_cache.popitem(last=False)
+	# cache_domain_ids
+
 	#-------------#
 	# DB Creation #
 	#-------------#
@@ -154,6 +258,10 @@ class MySQLDriver:
 		and update the current db
 		"""
 
+		# any cached domain ids belonged to an old db of the same name
+		with domain_id_cache_lock:
+			domain_id_cache.clear()
+
 		# update global db_name
 		self.db_name = self.db_prefix+db_name
 
@@ -181,8 +289,81 @@ class MySQLDriver:
 			# push to db
 			self.db.execute(query)
 			self.db_conn.commit()
+
+		# add indexes, etc.
+		self.migrate_db()
 	# create_wbxr_db
 
+	def get_meta(self, name):
+		"""
+		returns a value from the meta table, or None if it isn't set
+		"""
+		try:
+			self.db.execute('SELECT value FROM meta WHERE name = %s', (name,))
+			result = self.db.fetchone()
+		except mysql.connector.Error:
+			# no meta table yet
+			return None
+		if result:
+			return result[0]
+		else:
+			return None
+	# get_meta
+
+	def set_meta(self, name, value):
+		"""
+		sets a value in the meta table
+		"""
+		self.db.execute('REPLACE INTO meta (name, value) VALUES (%s,%s)', (name, str(value)))
+		self.commit_unless_in_transaction()
+	# set_meta
+
+	def get_db_id(self):
+		"""
+		returns a random id for this db, so files kept outside of the db (eg the 
+			CrawlJournal) can tell it apart from an older db of the same name, 
+			the id is made the first time we ask
+		"""
+		db_id = self.get_meta('db_id')
+		if db_id is None:
+			db_id = uuid.uuid4().hex
+			self.set_meta('db_id', db_id)
+		return db_id
+	# get_db_id
+
+	def migrate_db(self):
+		"""
+		adds the indexes and other additions in the migrate file to the current db, 
+			this is done when a db is created and may be run on older dbs with
+			'run_webxray.py -m [DB_NAME]'
+
+		the statements are safe to re-run, but we skip them if the db is already 
+			at schema_version
+
+		returns True if the db was migrated
+		"""
+		current_version = self.get_meta('schema_version')
+		if current_version is not None and int(current_version) >= schema_version:
+			return False
+
+		db_migrate_file = open(os.path.dirname(os.path.abspath(__file__))+'/resources/db/mysql/mysql_db_migrate.sql', 'r', encoding='utf-8')
+		for query in db_migrate_file:
+			# skip lines that are comments
+			if "-" in query[0]: continue
+			# lose whitespace
+			query = query.strip()
+			# push to db, skipping indexes and columns we already have
+			try:
+				self.db.execute(query)
+			except mysql.connector.Error as err:
+				if err.errno not in (errorcode.ER_DUP_KEYNAME, errorcode.ER_DUP_FIELDNAME): raise
+			self.db_conn.commit()
+		db_migrate_file.close()
+
+		self.set_meta('schema_version', schema_version)
+		return True
+	# migrate_db
+
 	#-----------------------#
 	# INGESTION AND STORING #
 	#-----------------------#	
@@ -215,11 +396,32 @@ class MySQLDriver:
 			return False
 	# page_exists
 
+	def get_page_start_url_md5s(self, chunk_size=10000):
+		"""
+		yields the distinct start_url_md5 of every page, this lets us check a 
+			long page list against the db in bulk rather than calling 
+			page_exists for every url
+		"""
+		for row in self.stream_query('SELECT DISTINCT start_url_md5 FROM page', chunk_size=chunk_size):
+			yield row[0]
+	# get_page_start_url_md5s
+
 	def add_domain(self, ip_addr, fqdn, domain, pubsuffix, tld):
 		"""
 		add a new domain record to db, ignores duplicates
 		returns id of specified domain
+
+		ids are cached so after the first time we see a domain this does not
+			touch the db, new ids come from lastrowid and if someone else
+			beat us to the insert we look it up
 		"""
+		if fqdn in self.pending_domain_ids:
+			return self.pending_domain_ids[fqdn]
+
+		domain_id = self.get_cached_domain_id(fqdn)
+		if domain_id is not None:
+			return domain_id
+
 		self.db.execute("""
 			INSERT IGNORE INTO domain (
 				ip_addr, 
@@ -240,13 +442,40 @@ class MySQLDriver:
 				pubsuffix, pubsuffix, 
 				tld, tld)
 			)
-		self.db_conn.commit()
-		self.db.execute("SELECT id FROM domain WHERE fqdn_md5 = MD5(%s)", (fqdn,))
-		return self.db.fetchone()[0]
+		if self.db.rowcount == 1:
+			domain_id = self.db.lastrowid
+		else:
+			self.db.execute("SELECT id FROM domain WHERE fqdn_md5 = MD5(%s)", (fqdn,))
+			domain_id = self.db.fetchone()[0]
+		self.commit_unless_in_transaction()
+
+		# ids from inside a transaction only count once it is committed
+		if self.in_transaction:
+			self.pending_domain_ids[fqdn] = domain_id
+		else:
+			self.cache_domain_ids({fqdn: domain_id})
+		return domain_id
 	# add_domain
 
+	def get_domain_fqdns_without_ip_addr(self):
+		"""
+		returns the distinct fqdns of domains which have no ip_addr, this is the 
+			case for all domains when ip resolution was deferred during collection
+		"""
+		self.db.execute('SELECT DISTINCT fqdn FROM domain WHERE ip_addr IS NULL')
+		return self.db.fetchall()
+	# get_domain_fqdns_without_ip_addr
+
+	def update_domain_ip_addrs(self, ip_addr_fqdns):
+		"""
+		bulk update of domain ip addresses, takes a list of (ip_addr, fqdn) tuples
+		"""
+		self.db.executemany('UPDATE domain SET ip_addr = %s WHERE fqdn_md5 = MD5(%s)', ip_addr_fqdns)
+		self.db_conn.commit()
+	# update_domain_ip_addrs
+
 	def add_page(self, 
-		browser_type, browser_version, browser_wait,
+		browser_type, browser_version, browser_wait, browser_wait_used,
 		title, meta_desc, 
 		start_url, final_url,
 		priv_policy_url,
@@ -263,7 +492,7 @@ class MySQLDriver:
 		accessed = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
 		self.db.execute("""INSERT INTO page (
-				browser_type, browser_version, browser_wait,
+				browser_type, browser_version, browser_wait, browser_wait_used,
 				title, meta_desc, 
 				start_url_md5, start_url,
 				final_url_md5, final_url,
@@ -273,7 +502,7 @@ class MySQLDriver:
 				load_time, domain_id,
 				accessed
 	 	) VALUES (
-	 			%s, %s, %s,
+	 			%s, %s, %s, %s,
 		 		%s, %s, 
 		 		MD5(%s), %s,
 		 		MD5(%s), %s, 
@@ -283,7 +512,7 @@ class MySQLDriver:
 		 		%s, %s,
 		 		%s
 		)""", 
-		(		browser_type, browser_version, browser_wait,
+		(		browser_type, browser_version, browser_wait, browser_wait_used,
 				title, meta_desc, 
 				start_url, start_url, 
 				final_url, final_url,
@@ -293,7 +522,7 @@ class MySQLDriver:
 				load_time, domain_id,
 				accessed)
 		)
-		self.db_conn.commit()
+		self.commit_unless_in_transaction()
 		
 		# return id of record with this start_url and accessed time
 		self.db.execute("SELECT id FROM page WHERE start_url_md5 = MD5(%s) AND accessed = %s", (start_url,accessed))
@@ -362,9 +591,54 @@ class MySQLDriver:
 				type, args, 
 				domain_id)
 		)
-		self.db_conn.commit()
+		self.commit_unless_in_transaction()
 	# add_element
 
+	def add_elements(self, elements):
+		"""
+		bulk version of add_element, takes a list of tuples with the same
+			fields in the same order as the arguments to add_element
+
+		returns nothing
+		"""
+		# the url fields are used twice, once for the md5 and once as-is
+		element_rows = []
+		for element in elements:
+			full_url		= element[1]
+			element_url	= element[2]
+			element_rows.append((element[0], full_url, full_url, element_url, element_url)+tuple(element[3:]))
+
+		self.db.executemany("""INSERT INTO element (
+				page_id,
+				full_url_md5, full_url,
+				element_url_md5, element_url,
+				is_3p, is_ssl,
+				received, 
+				referer, page_domain_in_referer, 
+				start_time_offset, load_time, 
+				status, status_text, 
+				content_type, body_size, 
+				request_headers, response_headers, 
+				file_md5, extension,
+				type, args, 
+				domain_id) 
+		VALUES (
+				%s,
+				MD5(%s), %s,
+				MD5(%s), %s,
+				%s, %s,
+				%s,
+				%s, %s,
+				%s, %s,
+				%s, %s,
+				%s, %s,
+				%s, %s,
+				%s, %s,
+				%s, %s, 
+				%s)""", element_rows)
+		self.commit_unless_in_transaction()
+	# add_elements
+
 	def add_cookie(self, 
 		page_id,
 		name, secure, path, 
@@ -391,9 +665,27 @@ class MySQLDriver:
 				domain_id
 			)
 		)
-		self.db_conn.commit()
+		self.commit_unless_in_transaction()
 	# add_cookie
 
+	def add_cookies(self, cookies):
+		"""
+		bulk version of add_cookie, takes a list of tuples with the same
+			fields in the same order as the arguments to add_cookie
+
+		returns nothing
+		"""
+		self.db.executemany("""
+			INSERT INTO cookie (
+				page_id,
+				name, secure, path, 
+				domain, httponly, 
+				expiry, value, is_3p, 
+				domain_id)
+			VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)""", cookies)
+		self.commit_unless_in_transaction()
+	# add_cookies
+
 	def log_error(self, url, msg):
 		"""
 		general purpose error logging, unique on url/msg
@@ -404,9 +696,106 @@ class MySQLDriver:
 		self.db.execute('SELECT COUNT(*) FROM error WHERE url = %s AND msg = %s', (url, msg))
 		if not self.db.fetchone()[0]:
 			self.db.execute("INSERT IGNORE INTO error (url, msg) VALUES (%s,%s)", (url, msg))
-			self.db_conn.commit()
+			self.commit_unless_in_transaction()
 	# log_error
 
+	#------------#
+	# WORK QUEUE #
+	#------------#
+
+	# urls waiting to be collected by any number of nodes, see WorkQueue
+	# leasing needs SKIP LOCKED, which requires mysql 8.0.1 or later, times come
+	#	from the server so nodes with different clocks agree on when a lease runs out
+
+	def add_work_queue_urls(self, urls):
+		"""
+		adds urls to the queue, urls which are already there are ignored
+		"""
+		self.db.executemany('INSERT IGNORE INTO work_queue (url_md5, url, state, attempts) VALUES (MD5(%s),%s,%s,0)', [(url, url, 'queued') for url in urls])
+		self.db_conn.commit()
+	# add_work_queue_urls
+
+	def lease_work_queue_urls(self, lease_owner, count, lease_seconds, max_attempts):
+		"""
+		claims up to count urls which are queued or whose lease has run out, 
+			returns the urls
+
+		a url whose lease has run out max_attempts times is marked 'failed'
+			rather than handed out again
+
+		rows another node is in the middle of claiming are skipped rather than
+			waited on
+		"""
+		self.db_conn.commit()
+		try:
+			self.db.execute(
+				"UPDATE work_queue SET state = 'failed', lease_expires = NULL WHERE state = 'leased' AND lease_expires < UNIX_TIMESTAMP(NOW(6)) AND attempts >= %s",
+				(max_attempts,)
+			)
+			self.db.execute("""
+				SELECT id, url FROM work_queue 
+				WHERE (state = 'queued' OR (state = 'leased' AND lease_expires < UNIX_TIMESTAMP(NOW(6)))) AND attempts < %s
+				ORDER BY id LIMIT %s
+				FOR UPDATE SKIP LOCKED
+			""", (max_attempts, count))
+			leased = self.db.fetchall()
+			self.db.executemany(
+				"UPDATE work_queue SET state = 'leased', lease_owner = %s, lease_expires = UNIX_TIMESTAMP(NOW(6))+%s, attempts = attempts+1 WHERE id = %s",
+				[(lease_owner, lease_seconds, row[0]) for row in leased]
+			)
+			self.db_conn.commit()
+		except:
+			self.db_conn.rollback()
+			raise
+		return [row[1] for row in leased]
+	# lease_work_queue_urls
+
+	def renew_work_queue_leases(self, lease_owner, urls, lease_seconds):
+		"""
+		pushes back the expiry of leases we still hold
+		"""
+		self.db.executemany(
+			"UPDATE work_queue SET lease_expires = UNIX_TIMESTAMP(NOW(6))+%s WHERE url_md5 = MD5(%s) AND lease_owner = %s AND state = 'leased'",
+			[(lease_seconds, url, lease_owner) for url in urls]
+		)
+		self.db_conn.commit()
+	# renew_work_queue_leases
+
+	def finish_work_queue_url(self, lease_owner, url, page_stored, max_attempts):
+		"""
+		marks a url we hold the lease on as done, or if the page wasn't stored
+			puts it back on the queue until it has had max_attempts
+		"""
+		if page_stored:
+			self.db.execute("UPDATE work_queue SET state = 'done', lease_expires = NULL WHERE url_md5 = MD5(%s) AND lease_owner = %s", (url, lease_owner))
+		else:
+			self.db.execute(
+				"UPDATE work_queue SET state = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END, lease_expires = NULL WHERE url_md5 = MD5(%s) AND lease_owner = %s", 
+				(max_attempts, url, lease_owner)
+			)
+		self.db_conn.commit()
+	# finish_work_queue_url
+
+	def get_work_queue_counts(self, max_attempts):
+		"""
+		returns a dict of how many urls are in each state, leases which have 
+			run out count as queued, or as failed once out of attempts
+		"""
+		self.db.execute("""
+			SELECT CASE 
+				WHEN state = 'leased' AND lease_expires < UNIX_TIMESTAMP(NOW(6)) AND attempts >= %s THEN 'failed'
+				WHEN state = 'leased' AND lease_expires < UNIX_TIMESTAMP(NOW(6)) THEN 'queued' 
+				ELSE state 
+			END AS lease_state, COUNT(*) 
+			FROM work_queue GROUP BY lease_state
+		""", (max_attempts,))
+		counts = {'queued': 0, 'leased': 0, 'done': 0, 'failed': 0}
+		for state, count in self.db.fetchall():
+			counts[state] = counts.get(state, 0)+count
+		self.db_conn.commit()
+		return counts
+	# get_work_queue_counts
+
 	#------------------------#
 	# ANALYSIS AND REPORTING #
 	#------------------------#	
@@ -458,6 +847,45 @@ class MySQLDriver:
 		return True
 	# update_domain_owner
 
+	def add_domain_owners(self, domain_owners):
+		"""
+		bulk version of add_domain_owner, domain_owners is a list of
+			(id, parent_id, name, aliases, homepage_url, privacy_policy_url, notes, country)
+		"""
+		self.db.executemany("""
+			INSERT INTO domain_owner (
+				id, parent_id, 
+				name, aliases, 
+				homepage_url, privacy_policy_url,
+				notes, country
+			) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)""", 
+			domain_owners
+		)
+		self.commit_unless_in_transaction()
+	# add_domain_owners
+
+	def update_domain_owners(self, owner_domains, unowned_only=False):
+		"""
+		bulk version of update_domain_owner, owner_domains is a list of (id, domain),
+			if a domain is listed more than once the last owner wins
+
+		the pairs go in a temporary table and are applied with a single update,
+			with unowned_only domains which already have an owner are left alone
+		"""
+		self.db.execute('CREATE TEMPORARY TABLE IF NOT EXISTS domain_owner_patch(domain_md5 VARCHAR(32) PRIMARY KEY, domain_owner_id INTEGER)')
+		self.db.execute('DELETE FROM domain_owner_patch')
+		self.db.executemany('REPLACE INTO domain_owner_patch (domain_md5, domain_owner_id) VALUES (MD5(%s),%s)', [(domain, id) for id, domain in owner_domains])
+
+		query = """
+			UPDATE IGNORE domain JOIN domain_owner_patch ON domain.domain_md5 = domain_owner_patch.domain_md5
+			SET domain.domain_owner_id = domain_owner_patch.domain_owner_id
+		"""
+		if unowned_only: query += ' WHERE domain.domain_owner_id IS NULL'
+		self.db.execute(query)
+		self.db.execute('DROP TEMPORARY TABLE domain_owner_patch')
+		self.commit_unless_in_transaction()
+	# update_domain_owners
+
 	def get_all_domain_owner_data(self):
 		"""
 		returns everything from the domain_owner table
@@ -480,6 +908,26 @@ class MySQLDriver:
 		return self.db.fetchall()
 	# get_all_domain_owner_data
 
+	def set_domain_owner_closure(self, closure_rows):
+		"""
+		replaces the contents of the domain_owner_closure table with the given
+			(ancestor_id, descendant_id, depth) rows, every owner has a row for
+			itself at depth 0 and one for each of its parents, so queries may roll
+			up to parent owners with a join rather than walking parent_id
+		"""
+		self.db.execute('DELETE FROM domain_owner_closure')
+		self.db.executemany('INSERT INTO domain_owner_closure (ancestor_id, descendant_id, depth) VALUES (%s,%s,%s)', closure_rows)
+		self.db_conn.commit()
+	# set_domain_owner_closure
+
+	def get_domain_owner_closure_count(self):
+		"""
+		number of rows in the domain_owner_closure table
+		"""
+		self.db.execute('SELECT COUNT(*) FROM domain_owner_closure')
+		return self.db.fetchone()[0]
+	# get_domain_owner_closure_count
+
 	def get_all_tlds(self, type='tld'):
 		"""
 		get all tlds from page domains, type can be 'tld' or 'pubsuffix', will crash on invalid type
@@ -910,4 +1358,161 @@ class MySQLDriver:
 
 		return self.db.fetchall()
 	# get_3p_element_domain_owner_id_ssl_use
+
+	def get_report_domains(self, chunk_size=10000):
+		"""
+		yields (id, domain, tld, domain_owner_id) for every domain, see ReportModel
+		"""
+		yield from self.stream_query('SELECT id, domain, tld, domain_owner_id FROM domain', chunk_size=chunk_size)
+	# get_report_domains
+
+	def get_report_pages(self, max_page_id=None, chunk_size=10000):
+		"""
+		yields (id, domain_id, is_ssl, load_time) for every page in order of id, see ReportModel
+			if max_page_id is set only pages up to it which have been summarized 
+			are included, so pages which turn up after the summaries were 
+			updated don't count as having no elements
+		"""
+		if max_page_id is None:
+			yield from self.stream_query('SELECT id, domain_id, is_ssl, load_time FROM page ORDER BY id', chunk_size=chunk_size)
+		else:
+			yield from self.stream_query("""
+				SELECT id, domain_id, is_ssl, load_time FROM page 
+				WHERE id <= %s
+				AND EXISTS (SELECT 1 FROM page_summary WHERE page_summary.page_id = page.id)
+				ORDER BY id
+			""", (max_page_id,), chunk_size=chunk_size)
+	# get_report_pages
+
+	def get_report_elements(self, chunk_size=10000):
+		"""
+		yields (page_id, domain_id, is_3p, received, is_ssl, body_size, type, extension, element_url)
+			for every element, see ReportModel
+
+		the element_url is only needed for third-party elements so the rest come back
+			as NULL, which saves us holding on to millions of first-party urls
+		"""
+		yield from self.stream_query("""
+			SELECT 
+				page_id, domain_id, is_3p, received, is_ssl, body_size, type, extension,
+				CASE WHEN is_3p = 1 THEN element_url END
+			FROM element
+		""", chunk_size=chunk_size)
+	# get_report_elements
+
+	def get_report_3p_cookies(self, chunk_size=10000):
+		"""
+		yields (page_id, domain_id) for every third-party cookie, see ReportModel
+		"""
+		yield from self.stream_query('SELECT page_id, domain_id FROM cookie WHERE is_3p = 1', chunk_size=chunk_size)
+	# get_report_3p_cookies
+
+	def get_max_page_id(self):
+		"""
+		the highest page id in the db, 0 if there are no pages
+		"""
+		self.db.execute('SELECT MAX(id) FROM page')
+		max_page_id = self.db.fetchone()[0]
+		if max_page_id is None: return 0
+		return max_page_id
+	# get_max_page_id
+
+	def reset_page_summaries(self):
+		"""
+		clears out the page summary tables so they may be rebuilt
+		"""
+		self.db.execute('DELETE FROM page_summary')
+		self.db.execute('DELETE FROM page_element_summary')
+		self.db.execute('DELETE FROM page_owner_summary')
+		self.commit_unless_in_transaction()
+	# reset_page_summaries
+
+	def update_page_summaries(self, max_page_id):
+		"""
+		adds rows to the page summary tables for pages up to max_page_id which
+			don't have a page_summary row yet, see Analyzer.update_page_summaries,
+			returns how many pages were summarized
+
+		we go by which pages are missing rather than by id as pages stored at 
+			the same time don't become visible in id order, the pages to do are
+			picked once up front so all three tables cover the same pages
+
+		owners are those the domains have now, so the summaries need to be 
+			rebuilt if the domain owners change
+		"""
+		self.db.execute('CREATE TEMPORARY TABLE IF NOT EXISTS page_summary_todo(page_id INTEGER PRIMARY KEY)')
+		self.db.execute('DELETE FROM page_summary_todo')
+		self.db.execute("""
+			INSERT INTO page_summary_todo (page_id)
+			SELECT id FROM page
+			WHERE id <= %s
+			AND NOT EXISTS (SELECT 1 FROM page_summary WHERE page_summary.page_id = page.id)
+		""", (max_page_id,))
+		page_count = self.db.rowcount
+
+		self.db.execute("""
+			INSERT INTO page_summary (page_id, domain_3p_count, javascript_3p_count, cookie_3p_count)
+			SELECT 
+				page.id,
+				(
+					SELECT COUNT(DISTINCT domain.domain) FROM element 
+					JOIN domain ON element.domain_id = domain.id 
+					WHERE element.page_id = page.id AND element.is_3p = 1
+				),
+				(
+					SELECT COUNT(*) FROM element 
+					WHERE element.page_id = page.id AND element.is_3p = 1 AND element.type = 'javascript'
+				),
+				(
+					SELECT COUNT(*) FROM cookie 
+					WHERE cookie.page_id = page.id AND cookie.is_3p = 1
+				)
+			FROM page
+			JOIN page_summary_todo ON page_summary_todo.page_id = page.id
+		""")
+
+		self.db.execute("""
+			INSERT INTO page_element_summary (page_id, is_3p, received, is_ssl, element_count, body_size)
+			SELECT element.page_id, is_3p, received, is_ssl, COUNT(*), SUM(body_size)
+			FROM element
+			JOIN page_summary_todo ON page_summary_todo.page_id = element.page_id
+			GROUP BY element.page_id, is_3p, received, is_ssl
+		""")
+
+		self.db.execute("""
+			INSERT INTO page_owner_summary (page_id, domain_owner_id)
+			SELECT DISTINCT element.page_id, domain.domain_owner_id 
+			FROM element
+			JOIN page_summary_todo ON page_summary_todo.page_id = element.page_id
+			JOIN domain ON element.domain_id = domain.id
+			WHERE element.is_3p = 1
+			AND domain.domain_owner_id IS NOT NULL
+		""")
+		self.db.execute('DROP TEMPORARY TABLE page_summary_todo')
+		self.commit_unless_in_transaction()
+		return page_count
+	# update_page_summaries
+
+	def get_page_summaries(self, chunk_size=10000):
+		"""
+		yields (page_id, domain_3p_count, javascript_3p_count, cookie_3p_count) 
+			for every summarized page, see ReportModel
+		"""
+		yield from self.stream_query('SELECT page_id, domain_3p_count, javascript_3p_count, cookie_3p_count FROM page_summary', chunk_size=chunk_size)
+	# get_page_summaries
+
+	def get_page_element_summaries(self, chunk_size=10000):
+		"""
+		yields (page_id, is_3p, received, is_ssl, element_count, body_size)
+			for every summarized page, see ReportModel
+		"""
+		yield from self.stream_query('SELECT page_id, is_3p, received, is_ssl, element_count, body_size FROM page_element_summary', chunk_size=chunk_size)
+	# get_page_element_summaries
+
+	def get_page_owner_summaries(self, chunk_size=10000):
+		"""
+		yields (page_id, domain_owner_id) for every summarized page, see ReportModel
+		"""
+		yield from self.stream_query('SELECT page_id, domain_owner_id FROM page_owner_summary', chunk_size=chunk_size)
+	# get_page_owner_summaries
 # class MySQLDriver
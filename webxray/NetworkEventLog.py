@@ -0,0 +1,316 @@
+# standard python packages
+import re
+import json
+import time
+
+class NetworkEventLog:
+    """
+    Builds the 'processed_requests' dictionary which ChromeDriver hands upstream out of
+        Chrome DevTools Protocol Network.* events, one event at a time.
+
+    Events may come from the chrome performance log once the page is done, or be
+        streamed in from the DevTools websocket while the page loads (see CDPEventStream),
+        either way they go through add_event so the results are the same.
+
+    Chrome outputs a number of independent events which are keyed to a 'requestId'.
+        What we want to send upstream is a dictionary keyed on the requested url so we do
+        a lot of processing here to stitch together a coherent log in the format expected
+        by wbxr.
+
+    There are two types of network events we are concerned with: normal http
+        requests (initiated by Network.requestWillBeSent) and websocket requests (initiated
+        by Network.webSocketCreated).
+
+    For normal events, we add entries to the 'requests' dictionary which we key to the requested
+        url.  The reason for this is a single requestId may correspond with many urls in
+        cases where a request results in redirects occuring.  However, data from the
+        Network.loadingFinished event does not include the url, so we key that seperately
+        in the load_finish_data dict and then attach it later on.  Note that if a request to
+        x.com results in redirects to y.com and z.com, all three will end up sharing
+        the same loadingFinished data.
+
+    webSocket events are a special case in that they are not strictly HTTP events, but
+        they do two things we are concerned with: potentially linking a user to
+        a third-party domain and setting cookies.  The url contacted is only exposed in the
+        first event, Network.webSocketCreated, so we must use the requestId to tie together
+        subsequent Network.webSocketWillSendHandshakeRequest and
+        Network.webSocketHandshakeResponseReceived events.  We use the dictionary websocket_requests
+        to keep track of such events, and we then reprocess them to be keyed to the url in our
+        normal requests log.  Note that to keep track of websocket request we use 'websocket'
+        for content type, and there may be a better way to handle this.
+    """
+
+    def __init__(self):
+        # http requests are keyed to URL
+        self.requests           = {}
+
+        # these events are keyed to requestID
+        self.load_finish_data   = {}
+        self.websocket_requests = {}
+
+        # to get page load time we will figure out when the first request and final load finished occured
+        self.first_start_time   = None
+        self.last_end_time      = None
+
+        # for debuging
+        self.duplicate_keys     = []
+
+        # requests which have started but not finished or failed, along with the
+        #   wall clock time of the last network event, see is_network_idle
+        self.in_flight_request_ids  = set()
+        self.last_event_time        = time.time()
+    # __init__
+
+    def add_performance_log(self, performance_log):
+        """
+        Feeds every Network.* event from a chrome performance log, as returned
+            by driver.get_log('performance'), through add_event.
+        """
+        for log_item in performance_log:
+            if 'message' not in log_item: continue
+            message = json.loads(log_item['message'])['message']
+            self.add_event(message['method'], message['params'])
+    # add_performance_log
+
+    def add_event(self, method, params):
+        """
+        Updates the log with a single DevTools event, events we don't care about
+            are ignored.
+        """
+        if method.startswith('Network.'):
+            self.last_event_time = time.time()
+
+        ################################
+        # normal http event processing #
+        ################################
+
+        # we have a new http event, create new empty entry keyed to url
+        # and keep track of start time info
+        if method == 'Network.requestWillBeSent':
+            this_request = params['request']
+            this_url     = this_request['url']
+
+            # skip if not http(s)
+            if not re.match('^https?://', this_url): return
+
+            # redirects keep the requestId so this is a no-op for them
+            self.in_flight_request_ids.add(params['requestId'])
+
+            # the presence of 'redirectResponse' means a prior request is redirected
+            #   so we update the status of the original request here and
+            #   then continue processing the current request
+            if 'redirectResponse' in params:
+                redirect_info = params['redirectResponse']
+                original_url  = redirect_info['url']
+
+                if original_url in self.requests:
+                    # the request was received, mark it
+                    self.requests[original_url].update({'received':       True})
+
+                    # record status code and text
+                    self.requests[original_url].update({'status':         redirect_info['status']})
+                    self.requests[original_url].update({'status_text':    redirect_info['statusText']})
+
+                    # try to get response headers, fail gracefully as they are already None
+                    try:
+                        self.requests[original_url].update({'response_headers':redirect_info['headersText']})
+                    except:
+                        pass
+
+                    try:
+                        self.requests[original_url].update({'content_type':redirect_info['headers']['Content-Type']})
+                    except:
+                        pass
+
+            # this_url already exists, log
+            if this_url in self.requests:
+                self.duplicate_keys.append(this_url)
+                return
+
+            # it is a new request so we initialize entry
+            self.requests[this_url] = {}
+
+            # we use this to get the load_finish_data later on
+            self.requests[this_url].update({'request_id':        params['requestId']})
+
+            # we set received to false to start with
+            self.requests[this_url].update({'received':          False})
+
+            # initialze response values to None in case we don't get response
+            self.requests[this_url].update({'end_time':          None})
+            self.requests[this_url].update({'status':            None})
+            self.requests[this_url].update({'status_text':       None})
+            self.requests[this_url].update({'response_headers':  None})
+            self.requests[this_url].update({'content_type':      None})
+            self.requests[this_url].update({'body_size':         None})
+            self.requests[this_url].update({'user_agent':        None})
+            self.requests[this_url].update({'referer':           None})
+
+            # each request has a start_time, we use this to figure out the time it took to download
+            this_start_time = params['timestamp']
+            self.requests[this_url].update({'start_time':this_start_time})
+
+            # update global start time to measure page load time
+            if self.first_start_time == None or this_start_time < self.first_start_time:
+                self.first_start_time = this_start_time
+
+            # get the request headers
+            self.requests[this_url].update({'request_headers':this_request['headers']})
+
+            # these can fail, if so, we ignore
+            try:
+                self.requests[this_url].update({'user_agent':this_request['headers']['User-Agent']})
+            except:
+                pass
+
+            try:
+                self.requests[this_url].update({'referer':this_request['headers']['Referer']})
+            except:
+                pass
+
+        # we have received a response to our request, update appropriately
+        elif method == 'Network.responseReceived':
+            this_response   = params['response']
+            this_url        = this_response['url']
+
+            # skip if not http(s), or if we never saw the request
+            if not re.match('^https?://', this_url): return
+            if this_url not in self.requests: return
+
+            # the request was received, mark it
+            self.requests[this_url].update({'received':      True})
+
+            # record status code and text
+            self.requests[this_url].update({'status':        this_response['status']})
+            self.requests[this_url].update({'status_text':   this_response['statusText']})
+
+            # try to get response headers, fail gracefully as they are already None
+            try:
+                self.requests[this_url].update({'response_headers':this_response['headersText']})
+            except:
+                pass
+
+            try:
+                self.requests[this_url].update({'content_type':this_response['headers']['Content-Type']})
+            except:
+                pass
+
+        # load finish events are keyed to requestId and may apply to many requested urls
+        #   so we keep this in a seperate dictionary to be relinked when we're done
+        elif method == 'Network.loadingFinished':
+            this_request_id = params['requestId']
+            this_end_time   = params['timestamp']
+
+            self.in_flight_request_ids.discard(this_request_id)
+
+            # update global end time
+            if self.last_end_time == None or this_end_time > self.last_end_time:
+                self.last_end_time = this_end_time
+
+            if this_request_id not in self.load_finish_data:
+                self.load_finish_data[this_request_id] = {}
+
+            # size is updated during loading and is shown in logs, but we only want the final size which is here
+            self.load_finish_data[this_request_id].update({'body_size':params['encodedDataLength']})
+
+            # we use this to calculate the total time for all requests
+            self.load_finish_data[this_request_id].update({'end_time':this_end_time})
+
+        # failed requests don't get a loadingFinished, we only need them for idle tracking
+        elif method == 'Network.loadingFailed':
+            self.in_flight_request_ids.discard(params['requestId'])
+
+        ##############################
+        # webSocket event processing #
+        ##############################
+
+        # we have a new websocket, create new empty entry keyed to requestId
+        #   this will be rekeyed to url
+        # note we ignore timing data for websockets
+        elif method == 'Network.webSocketCreated':
+            this_url        = params['url']
+            this_request_id = params['requestId']
+
+            if this_request_id not in self.websocket_requests:
+                self.websocket_requests[this_request_id] = {}
+                self.websocket_requests[this_request_id].update({'url':               this_url})
+                self.websocket_requests[this_request_id].update({'content_type':      'websocket'})
+                self.websocket_requests[this_request_id].update({'received':          False})
+                self.websocket_requests[this_request_id].update({'end_time':          None})
+                self.websocket_requests[this_request_id].update({'status':            None})
+                self.websocket_requests[this_request_id].update({'status_text':       None})
+                self.websocket_requests[this_request_id].update({'response_headers':  None})
+                self.websocket_requests[this_request_id].update({'body_size':         None})
+                self.websocket_requests[this_request_id].update({'start_time':        None})
+                self.websocket_requests[this_request_id].update({'user_agent':        None})
+                self.websocket_requests[this_request_id].update({'referer':           None})
+
+        # websocket request made, update relevant fields
+        elif method == 'Network.webSocketWillSendHandshakeRequest':
+            this_request    = params['request']
+            this_request_id = params['requestId']
+            if this_request_id not in self.websocket_requests: return
+            self.websocket_requests[this_request_id].update({'request_headers':   this_request['headers']})
+            self.websocket_requests[this_request_id].update({'user_agent':        this_request['headers'].get('User-Agent')})
+
+        # websocket response received, update relevant fields
+        elif method == 'Network.webSocketHandshakeResponseReceived':
+            this_response   = params['response']
+            this_request_id = params['requestId']
+            if this_request_id not in self.websocket_requests: return
+            self.websocket_requests[this_request_id].update({'received':          True})
+            self.websocket_requests[this_request_id].update({'status':            this_response['status']})
+            self.websocket_requests[this_request_id].update({'status_text':       this_response['statusText']})
+            self.websocket_requests[this_request_id].update({'response_headers':  this_response.get('headersText')})
+    # add_event
+
+    def is_network_idle(self, quiet_seconds):
+        """
+        True once no requests are in flight and there has been no network activity
+            for quiet_seconds.  Websockets stay open for as long as the page does
+            so they are not counted as in flight.
+        """
+        if len(self.in_flight_request_ids) > 0:
+            return False
+        return time.time() - self.last_event_time >= quiet_seconds
+    # is_network_idle
+
+    def get_processed_requests(self):
+        """
+        Attaches the load finish data and websockets to the requests once all
+            events are in, returns the dictionary keyed to url.
+        """
+
+        # append load finish info to requests
+        for this_url in self.requests:
+            this_request_id = self.requests[this_url]['request_id']
+            if this_request_id in self.load_finish_data:
+                self.requests[this_url].update({'body_size': self.load_finish_data[this_request_id]['body_size']})
+
+                # load_time is start time minus end time,
+                #   multiplied by 1k to convert to miliseconds
+                load_time = (self.load_finish_data[this_request_id]['end_time'] - self.requests[this_url]['start_time'])*1000
+
+                # we shouldn't be getting <=0, but make it null if this happens
+                if load_time <= 0:
+                    self.requests[this_url].update({'load_time': load_time})
+                else:
+                    self.requests[this_url].update({'load_time': None})
+            else:
+                self.requests[this_url].update({'body_size': None})
+                self.requests[this_url].update({'load_time': None})
+
+        # append websocket data to requests data
+        for item in self.websocket_requests:
+            self.requests[self.websocket_requests[item]['url']] = self.websocket_requests[item]
+
+        return self.requests
+    # get_processed_requests
+
+    def get_page_load_time(self):
+        """
+        Milliseconds from the first request starting to the last one finishing.
+        """
+        return int((self.last_end_time - self.first_start_time)*1000)
+    # get_page_load_time
+# NetworkEventLog
@@ -15,13 +15,98 @@ class OutputStore:
 		This class receives data from the browser, processes it, and stores it in the db
 	"""
 
-	def __init__(self, db_engine, db_name):
-		self.db_engine	= db_engine
-		self.db_name	= db_name
-		self.utilities	= Utilities()
-		self.url_parser = ParseURL()
+	def __init__(self, db_engine, db_name, dns_workers=32, dns_deadline=10, ip_resolution='resolve'):
+		self.db_engine		= db_engine
+		self.db_name		= db_name
+		self.utilities		= Utilities()
+
+		# see ParseURL for the ip_resolution options
+		self.url_parser 	= ParseURL(ip_resolution=ip_resolution)
+
+		# settings for resolving all of a page's hosts at once, dns_deadline
+		#	is the most time in seconds we spend on lookups for one page
+		self.dns_workers	= dns_workers
+		self.dns_deadline	= dns_deadline
 	# init
 
+	def get_sql_driver(self):
+		"""
+		opens up a sql connection for the configured db engine
+		"""
+		if self.db_engine == 'mysql':
+			from webxray.MySQLDriver import MySQLDriver
+			return MySQLDriver(self.db_name)
+		elif self.db_engine == 'sqlite':
+			from webxray.SQLiteDriver import SQLiteDriver
+			return SQLiteDriver(self.db_name)
+		elif self.db_engine == 'postgres':
+			from webxray.PostgreSQLDriver import PostgreSQLDriver
+			return PostgreSQLDriver(self.db_name)
+		else:
+			print('INVALED DB ENGINE FOR %s, QUITTING!' % self.db_engine)
+			exit()
+	# get_sql_driver
+
+	def resolve_deferred_ip_addrs(self, batch_size=1000):
+		"""
+		when ip resolution is deferred during collection the domain table is
+			left with empty ip_addr fields, this fills them in by resolving the
+			distinct fqdns in concurrent batches and updating the rows in bulk
+
+		this is safe to run while a collection is going on, or again later on
+			to pick up any domains which did not resolve the first time
+		"""
+		sql_driver = self.get_sql_driver()
+
+		fqdns = [row[0] for row in sql_driver.get_domain_fqdns_without_ip_addr()]
+		print('\t\tResolving ip addresses for %s domains' % len(fqdns))
+
+		resolved_count = 0
+		for batch_start in range(0, len(fqdns), batch_size):
+			batch = fqdns[batch_start:batch_start+batch_size]
+			fqdn_to_ip_addr = self.url_parser.dns_resolver.resolve_many(batch, self.dns_workers, self.dns_deadline)
+
+			# only update rows we got an answer for
+			ip_addr_fqdns = []
+			for fqdn in fqdn_to_ip_addr:
+				if fqdn_to_ip_addr[fqdn]:
+					ip_addr_fqdns.append((fqdn_to_ip_addr[fqdn], fqdn))
+			sql_driver.update_domain_ip_addrs(ip_addr_fqdns)
+			resolved_count += len(ip_addr_fqdns)
+
+		print('\t\tResolved %s of %s domains' % (resolved_count, len(fqdns)))
+		sql_driver.close()
+		return resolved_count
+	# resolve_deferred_ip_addrs
+
+	def prefetch_ip_addrs(self, url, browser_output):
+		"""
+		gathers every distinct host from the page, cookies, requests, and referers
+			and resolves them concurrently before we process the page
+
+		returns a dict of fqdn -> ip for the page, hosts which missed the deadline
+			are None, the page is parsed against this so we never go back out to
+			the network for a host one request at a time
+		"""
+		urls = [url]
+
+		for cookie in browser_output['cookies']:
+			try:
+				urls.append('http://'+cookie['domain'])
+			except:
+				pass
+
+		for request in browser_output['processed_requests']:
+			urls.append(request)
+			try:
+				referer = browser_output['processed_requests'][request]['referer']
+			except:
+				referer = None
+			if referer: urls.append(referer)
+
+		return self.url_parser.prefetch_ip_addrs(urls, self.dns_workers, self.dns_deadline)
+	# prefetch_ip_addrs
+
 	def store(self, url, browser_output, store_source=False, store_1p=True, get_file_hashes=False, hash_3p_only=False):
 		"""
 		this is the primary function of this class,
@@ -37,30 +122,68 @@ class OutputStore:
 
 		there is also an option to get file hashes, this introduces serious overhead
 			and is turned off by default
+
+		everything is parsed up front and then the whole page is written in a
+			single transaction, if any part of the write fails nothing from
+			the page is kept and the failure is logged
 		"""
+		page_record = self.build_page_record(url, browser_output, store_source, store_1p, get_file_hashes, hash_3p_only)
 
 		# open up a sql connection
-		if self.db_engine == 'mysql':
-			from webxray.MySQLDriver import MySQLDriver
-			sql_driver = MySQLDriver(self.db_name)
-		elif self.db_engine == 'sqlite':
-			from webxray.SQLiteDriver import SQLiteDriver
-			sql_driver = SQLiteDriver(self.db_name)
-		elif self.db_engine == 'postgres':
-			from webxray.PostgreSQLDriver import PostgreSQLDriver
-			sql_driver = PostgreSQLDriver(self.db_name)
-		else:
-			print('INVALED DB ENGINE FOR %s, QUITTING!' % db_engine)
-			exit()
+		sql_driver = self.get_sql_driver()
+
+		# now write the page in one transaction
+		sql_driver.start_transaction()
+		try:
+			page_stored = self.store_page_record(sql_driver, page_record)
+			sql_driver.commit()
+		except Exception as e:
+			# nothing from this page is stored, log what happened and move on
+			sql_driver.rollback()
+			sql_driver.log_error(url, 'Error storing page: %s' % e)
+			page_stored = False
+
+		# close db connection
+		sql_driver.close()
+
+		return page_stored
+	# store
+
+	def build_error_record(self, url, msg):
+		"""
+		a page record which only logs an error, used when we never got
+			as far as having a page to store
+		"""
+		return {
+			'url'		: url,
+			'error_msgs': [msg],
+			'domains'	: [],
+			'page'		: None,
+			'cookies'	: [],
+			'elements'	: []
+		}
+	# build_error_record
+
+	def build_page_record(self, url, browser_output, store_source=False, store_1p=True, get_file_hashes=False, hash_3p_only=False):
+		"""
+		does all of the processing for store without touching the db and returns
+			a page record, this is a dict of plain python types so it can be 
+			handed to another process to write, see IngestWriter
+
+		domains are kept as (ip, fqdn, domain, pubsuffix, tld) tuples and the 
+			page, cookies, and elements refer to them in place of domain ids
+		"""
+
+		# resolve all of the hosts on this page in one concurrent batch
+		fqdn_to_ip_addr = self.prefetch_ip_addrs(url, browser_output)
 
 		# get the ip, fqdn, domain, pubsuffix, and tld
 		# we need the domain to figure out if cookies/elements are third-party
-		origin_ip_fqdn_domain_pubsuffix_tld	= self.url_parser.get_ip_fqdn_domain_pubsuffix_tld(url)
+		origin_ip_fqdn_domain_pubsuffix_tld	= self.url_parser.get_ip_fqdn_domain_pubsuffix_tld(url, fqdn_to_ip_addr)
 
 		# if we can't get page domain info we fail gracefully
 		if origin_ip_fqdn_domain_pubsuffix_tld is None:
-			sql_driver.log_error(url, 'Could not parse TLD for %s' % url)
-			return False
+			return self.build_error_record(url, 'Could not parse TLD for %s' % url)
 
 		origin_ip 			= origin_ip_fqdn_domain_pubsuffix_tld[0]
 		origin_fqdn 		= origin_ip_fqdn_domain_pubsuffix_tld[1]
@@ -68,9 +191,15 @@ class OutputStore:
 		origin_pubsuffix 	= origin_ip_fqdn_domain_pubsuffix_tld[3]
 		origin_tld 			= origin_ip_fqdn_domain_pubsuffix_tld[4]
 		
-		# sql_driver.add_domain both stores the new domain and returns its db row id
-		# if it is already in db just return the existing id
-		page_domain_id = sql_driver.add_domain(origin_ip, origin_fqdn, origin_domain, origin_pubsuffix, origin_tld)
+		# domains are stored once we have parsed everything, until then we keep
+		#	track of the (ip, fqdn, domain, pubsuffix, tld) tuples we have seen
+		page_domain = (origin_ip, origin_fqdn, origin_domain, origin_pubsuffix, origin_tld)
+		domains		= [page_domain]
+
+		# likewise errors, cookies, and elements are written at the end
+		error_msgs	= []
+		cookies		= []
+		elements	= []
 
 		# figure out the privacy policy url and text, starts null
 		priv_policy_url = None
@@ -112,34 +241,17 @@ class OutputStore:
 		else:
 			source = None
 
-		# add page
-		page_id = sql_driver.add_page(
-			browser_output['browser_type'],
-			browser_output['browser_version'],
-			browser_output['browser_wait'],
-			browser_output['title'],
-			browser_output['meta_desc'],
-			url, 
-			browser_output['final_url'],
-			priv_policy_url,
-			priv_policy_url_text,
-			page_is_ssl,
-			source,
-			browser_output['load_time'],
-			page_domain_id
-		)
-
 		# store cookies
 		for cookie in browser_output['cookies']:
 			# get the ip, fqdn, domain, pubsuffix, and tld
 			# we need the domain to figure out if cookies/elements are third-party
 			# note:
 			#	url_parser fails on non-http, we should fix this, right now a lame hack is to prepend http://
-			cookie_ip_fqdn_domain_pubsuffix_tld	= self.url_parser.get_ip_fqdn_domain_pubsuffix_tld('http://'+cookie['domain'])
+			cookie_ip_fqdn_domain_pubsuffix_tld	= self.url_parser.get_ip_fqdn_domain_pubsuffix_tld('http://'+cookie['domain'], fqdn_to_ip_addr)
 			
 			# something went wrong, log and fail gracefully
 			if cookie_ip_fqdn_domain_pubsuffix_tld is None:
-				sql_driver.log_error(url, 'Error parsing cookie with domain: '+cookie['domain'])
+				error_msgs.append('Error parsing cookie with domain: '+cookie['domain'])
 				continue
 
 			# otherwise, everything went fine
@@ -159,8 +271,8 @@ class OutputStore:
 			if is_3p_cookie is False and store_1p is False:
 				continue
 
-			# sql_driver.add_domain both stores the new domain and returns its id
-			cookie_domain_id = sql_driver.add_domain(cookie_ip, cookie_fqdn, cookie_domain, cookie_pubsuffix, cookie_tld)
+			cookie_domain_tuple = (cookie_ip, cookie_fqdn, cookie_domain, cookie_pubsuffix, cookie_tld)
+			domains.append(cookie_domain_tuple)
 		
 			# name and domain are required, so if they fail we just continue
 			try: name = cookie['name']
@@ -185,13 +297,12 @@ class OutputStore:
 			try: value = cookie['value']
 			except: value = None
 		
-			# all done with this cookie
-			sql_driver.add_cookie(
-				page_id,
+			# all done with this cookie, the page and domain ids are filled in later
+			cookies.append((
 				name, secure, path, domain, 
 				httponly, expiry, value, 
-				is_3p_cookie, cookie_domain_id
-			)
+				is_3p_cookie, cookie_domain_tuple
+			))
 
 		# process requests now
 		for request in browser_output['processed_requests']:
@@ -201,11 +312,11 @@ class OutputStore:
 
 			# get the ip, fqdn, domain, pubsuffix, and tld
 			# we need the domain to figure out if cookies/elements are third-party
-			element_ip_fqdn_domain_pubsuffix_tld	= self.url_parser.get_ip_fqdn_domain_pubsuffix_tld(request)
+			element_ip_fqdn_domain_pubsuffix_tld	= self.url_parser.get_ip_fqdn_domain_pubsuffix_tld(request, fqdn_to_ip_addr)
 
 			# problem with this request, log and fail gracefully
 			if element_ip_fqdn_domain_pubsuffix_tld is None:
-				sql_driver.log_error(url, 'Error parsing element request: '+request)
+				error_msgs.append('Error parsing element request: '+request)
 				continue
 
 			element_ip 			= element_ip_fqdn_domain_pubsuffix_tld[0]
@@ -214,8 +325,8 @@ class OutputStore:
 			element_pubsuffix 	= element_ip_fqdn_domain_pubsuffix_tld[3]
 			element_tld 		= element_ip_fqdn_domain_pubsuffix_tld[4]
 
-			# sql_driver.add_domain both stores the new domain and returns its db row id
-			element_domain_id = sql_driver.add_domain(element_ip, element_fqdn, element_domain, element_pubsuffix, element_tld)
+			element_domain_tuple = (element_ip, element_fqdn, element_domain, element_pubsuffix, element_tld)
+			domains.append(element_domain_tuple)
 
 			# mark third-party elements based on domain
 			if origin_domain != element_domain:
@@ -244,7 +355,7 @@ class OutputStore:
 				referer = None
 
 			if referer and len(referer) != 0:
-				referer_ip_fqdn_domain_pubsuffix_tld = self.url_parser.get_ip_fqdn_domain_pubsuffix_tld(referer)
+				referer_ip_fqdn_domain_pubsuffix_tld = self.url_parser.get_ip_fqdn_domain_pubsuffix_tld(referer, fqdn_to_ip_addr)
 
 				if referer_ip_fqdn_domain_pubsuffix_tld:
 					if referer_ip_fqdn_domain_pubsuffix_tld[2] == origin_domain:
@@ -253,7 +364,7 @@ class OutputStore:
 						page_domain_in_referer = False
 				else:
 					page_domain_in_referer = None
-					sql_driver.log_error(url, 'Error parsing referer header: '+referer)
+					error_msgs.append('Error parsing referer header: '+referer)
 			else:
 				page_domain_in_referer = None
 
@@ -377,9 +488,8 @@ class OutputStore:
 			if len(request) >= 2000: request = request[:2000]
 			if len(element_url) >= 2000: element_url = element_url[:2000]
 
-			# store request
-			sql_driver.add_element(
-				page_id,
+			# all done with this request, the page and domain ids are filled in later
+			elements.append((
 				request, element_url,
 				is_3p_element, element_is_ssl,
 				received,
@@ -397,12 +507,64 @@ class OutputStore:
 				element_extension,
 				element_type,
 				element_args,
-				element_domain_id
-			)
+				element_domain_tuple
+			))
+
+		return {
+			'url'		: url,
+			'error_msgs': error_msgs,
+			'domains'	: domains,
+			'page'		: (
+				browser_output['browser_type'],
+				browser_output['browser_version'],
+				browser_output['browser_wait'],
+				browser_output['browser_wait_used'],
+				browser_output['title'],
+				browser_output['meta_desc'],
+				url, 
+				browser_output['final_url'],
+				priv_policy_url,
+				priv_policy_url_text,
+				page_is_ssl,
+				source,
+				browser_output['load_time'],
+				page_domain
+			),
+			'cookies'	: cookies,
+			'elements'	: elements
+		}
+	# build_page_record
+
+	def store_page_record(self, sql_driver, page_record):
+		"""
+		writes a page record from build_page_record to the db, this should be 
+			done inside a transaction so a failure part way through can be 
+			rolled back
 
-		# close db connection
-		sql_driver.close()
+		returns True if a page was stored
+		"""
+		for msg in page_record['error_msgs']:
+			sql_driver.log_error(page_record['url'], msg)
+
+		# error records stop here
+		if page_record['page'] is None:
+			return False
+
+		# sql_driver.add_domain both stores the new domain and returns its db row id,
+		#	if it is already in db it just returns the existing id, we go in sorted
+		#	order so concurrent writers lock rows in the same order
+		domain_ids = {}
+		for domain_tuple in sorted(set(page_record['domains']), key=lambda domain_tuple: domain_tuple[1]):
+			domain_ids[domain_tuple] = sql_driver.add_domain(*domain_tuple)
+
+		# add page
+		page = page_record['page']
+		page_id = sql_driver.add_page(*(page[:-1]+(domain_ids[page[-1]],)))
+
+		# swap in the page and domain ids and store cookies and elements in bulk
+		sql_driver.add_cookies([(page_id,)+cookie[:-1]+(domain_ids[cookie[-1]],) for cookie in page_record['cookies']])
+		sql_driver.add_elements([(page_id,)+element[:-1]+(domain_ids[element[-1]],) for element in page_record['elements']])
 
 		return True
-	# store
+	# store_page_record
 # OutputStore
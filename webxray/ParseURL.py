@@ -1,9 +1,41 @@
 # standard python libs
 import os
 import re
+import pickle
 import socket
+import tempfile
+import threading
+from collections import OrderedDict
 from urllib.parse import urlsplit
 
+# custom webxray classes
+from webxray.DNSResolver import DNSResolver
+
+# the compiled pubsuffix trie is cached next to the .dat file, bump this
+#	whenever the layout of the trie changes so stale caches get rebuilt
+PUBSUFFIX_CACHE_VERSION = 1
+
+# the trie is shared by every ParseURL in the process, this way it is only
+#	loaded once and forked pool workers inherit it from the parent
+shared_pubsuffix_trie = None
+
+# likewise the dns cache is shared so repeat lookups of the same
+#	hosts across pages processed by one worker are free
+shared_dns_resolver = None
+
+# the same hosts turn up on page after page, so the result of parsing a netloc
+#	is kept in a bounded lru which is also shared by every ParseURL in the process
+#	shared_netloc_cache_size is the max number of parsed netlocs to keep around,
+#	0 turns the cache off
+shared_netloc_cache = OrderedDict()
+shared_netloc_cache_size = 10000
+shared_netloc_cache_stats = {'hits': 0, 'misses': 0}
+shared_netloc_cache_lock = threading.Lock()
+
+# cheap way to pull the netloc out of a url without a full urlsplit, only
+#	used as the cache key
+netloc_regex = re.compile('^(?:https?|wss?)://([^/?#]*)')
+
 class ParseURL:
 	"""
 		Given a url string, this class will return the ip address, fully-qualified domain name,
@@ -19,47 +51,170 @@ class ParseURL:
 
 	"""
 
-	def __init__(self):
-		# load up the tld list now as only hit it once this way
-		self.pubsuffix_list = self.get_pubsuffix_list()
+	def __init__(self, ip_resolution='resolve'):
+		"""
+			ip_resolution may be one of the following:
+				'resolve':	look up the ip address of every fqdn (default)
+				'skip':		never look up ip addresses, ip is always None
+				'defer':	same as skip during parsing, the ip addresses are filled
+							in afterwards by OutputStore.resolve_deferred_ip_addrs
+		"""
+		if ip_resolution not in ('resolve', 'skip', 'defer'):
+			raise ValueError('ip_resolution must be resolve, skip, or defer, not %s' % ip_resolution)
+		self.ip_resolution = ip_resolution
+
+		# load up the pubsuffix trie now as only hit it once this way
+		self.pubsuffix_trie = self.get_shared_pubsuffix_trie()
+
+		# ip lookups go through a caching resolver
+		self.dns_resolver = self.get_shared_dns_resolver()
 	# end __init__
 
+	def get_shared_dns_resolver(self):
+		"""
+			returns the process-wide caching dns resolver
+		"""
+		global shared_dns_resolver
+		if shared_dns_resolver is None:
+			shared_dns_resolver = DNSResolver()
+		return shared_dns_resolver
+	# get_shared_dns_resolver
+
+	def get_shared_pubsuffix_trie(self):
+		"""
+			returns the process-wide pubsuffix trie, loading it from the compiled
+				cache if it is current and otherwise building it from the .dat
+				file and refreshing the cache
+		"""
+		global shared_pubsuffix_trie
+
+		if shared_pubsuffix_trie is None:
+			pubsuffix_path = os.path.dirname(os.path.abspath(__file__))+'/resources/pubsuffix/public_suffix_list.dat'
+			cache_path = os.path.dirname(os.path.abspath(__file__))+'/resources/pubsuffix/public_suffix_list.pickle'
+
+			# the cache is only valid for this exact copy of the .dat file
+			pubsuffix_stat = os.stat(pubsuffix_path)
+			cache_key = (PUBSUFFIX_CACHE_VERSION, pubsuffix_stat.st_mtime_ns, pubsuffix_stat.st_size)
+
+			try:
+				with open(cache_path, 'rb') as cache_file:
+					cache = pickle.load(cache_file)
+				if cache['key'] == cache_key:
+					shared_pubsuffix_trie = cache['pubsuffix_trie']
+			except:
+				pass
+
+			if shared_pubsuffix_trie is None:
+				shared_pubsuffix_trie = self.get_pubsuffix_list()
+
+				# write to a temp file and rename so parallel processes never
+				#	read a partial cache, if the directory isn't writable we 
+				#	just go without
+				try:
+					cache_fd, cache_temp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path))
+					with os.fdopen(cache_fd, 'wb') as cache_file:
+						pickle.dump({'key': cache_key, 'pubsuffix_trie': shared_pubsuffix_trie}, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+					os.replace(cache_temp_path, cache_path)
+				except:
+					pass
+
+		return shared_pubsuffix_trie
+	# get_shared_pubsuffix_trie
+
 	def get_pubsuffix_list(self):
 		"""
-			this builds a shared list of tuples based on the pubsuffix list; tuples allow for
-			quick comparisons of smaller strings
+			this builds a trie of the pubsuffix list keyed on reversed labels, eg the rule
+				"ac.uk" is stored as {'uk': {'ac': {}}}, so looking up a domain
+				costs about as much as the number of labels it has
+
+			wildcard rules (eg "*.ck") are stored with a '*' label and exception
+				rules (eg "!www.ck") are flagged so we can follow the publicsuffix.org
+				matching algorithm, see get_pubsuffix_length
 		"""
 
 		# path is relative from root webxray directory
 		pubsuffix_raw_list = open(os.path.dirname(os.path.abspath(__file__))+'/resources/pubsuffix/public_suffix_list.dat', mode='r', encoding='utf8')
-		pubsuffix_list = []
+		pubsuffix_trie = {}
 
 		for line in pubsuffix_raw_list:
 				# the last part of the list is random stuff we don't care about, so stop reading
 				if re.match("^// ===BEGIN PRIVATE DOMAINS===", line):break
 
-				# skip lines that are comments or blank, add others to list
+				# skip lines that are comments or blank, add others to trie
 				if not re.match("^//.+$|^$", line):
-					# remove leading ., !, and * as it screws up regex later
-					pubsuffix_string = re.sub('^[\!\*]\.?', '', line.strip())
-					
+					pubsuffix_string = line.strip()
+
+					# exception rules start with '!', note and drop it
+					if pubsuffix_string[0] == '!':
+						is_exception = True
+						pubsuffix_string = pubsuffix_string[1:]
+					else:
+						is_exception = False
+
 					# convert to idna/ascii/utf-8 for enhanced compatability
 					pubsuffix_string = pubsuffix_string.encode('idna').decode('utf-8')
 
-					# convert to a tuple so we can do faster comparisons
-					pubsuffix_list.append(tuple(pubsuffix_string.split('.')))
-		
+					self.add_pubsuffix_rule(pubsuffix_trie, pubsuffix_string.split('.'), is_exception)
+
+		pubsuffix_raw_list.close()
+
 		# add the pubsuffix for tor addresses
-		pubsuffix_list.append(('onion',))
+		self.add_pubsuffix_rule(pubsuffix_trie, ['onion'])
 
 		# done
-		return pubsuffix_list
+		return pubsuffix_trie
 	# get_pubsuffix_list
 
-	def get_ip_fqdn_domain_pubsuffix_tld(self,url):
+	def add_pubsuffix_rule(self, pubsuffix_trie, labels, is_exception=False):
 		"""
-			Given a url string, this class will return the ip address, fully-qualified domain name,
-				domain, public suffix, and top-level domain as a tuple.
+			walks down the trie from the right-most label and marks the final node
+				as either a rule or an exception to a wildcard rule, the marker
+				keys are None/False so they can never clash with a label
+		"""
+		node = pubsuffix_trie
+		for label in reversed(labels):
+			node = node.setdefault(label, {})
+		if is_exception:
+			node[False] = True
+		else:
+			node[None] = True
+	# add_pubsuffix_rule
+
+	def get_pubsuffix_length(self, domain_tuple):
+		"""
+			given a tuple of domain labels returns the number of right-most labels
+				which make up the pubsuffix, or 0 if no rule matches
+
+			the longest matching rule wins, a wildcard matches any single label, 
+				and an exception rule means the pubsuffix is one label shorter than
+				the rule (eg "!www.ck" makes "ck" the pubsuffix of "www.ck")
+		"""
+		node = self.pubsuffix_trie
+		pubsuffix_length = 0
+
+		for depth, label in enumerate(reversed(domain_tuple)):
+			# wildcards match this label regardless of what it is
+			if '*' in node:
+				pubsuffix_length = depth+1
+
+			node = node.get(label)
+			if node is None: break
+
+			# exceptions override wildcards and end the search
+			if False in node:
+				pubsuffix_length = depth
+				break
+
+			if None in node:
+				pubsuffix_length = depth+1
+
+		return pubsuffix_length
+	# get_pubsuffix_length
+
+	def get_fqdn(self,url):
+		"""
+			Given a url string, returns the idna-encoded fully-qualified domain name
+				without doing any lookups, or None if the url can't be parsed.
 		"""
 
 		# first make sure it is actually an https? or wss? request we can parse
@@ -73,44 +228,144 @@ class ParseURL:
 			fqdn = re.search('^(\.+)?(.+?)(:.+)?(\.+)?$', urlsplit(url).netloc).group(2)
 
 			# convert to idna/ascii/utf-8 for enhanced compatability
-			fqdn = fqdn.encode('idna').decode('utf-8')
+			return fqdn.encode('idna').decode('utf-8')
 		except:
 			return None
+	# get_fqdn
+
+	def prefetch_ip_addrs(self, urls, max_workers=32, deadline=10):
+		"""
+			Given a list of url strings, resolves all of the distinct fqdns concurrently
+				and returns a dict of fqdn -> ip, fqdns which missed the deadline are
+				in it as None.  Pass it to get_ip_fqdn_domain_pubsuffix_tld so it
+				doesn't have to wait on the network.  Addresses which are already 
+				ips are skipped.
+		"""
+		if self.ip_resolution != 'resolve':
+			return {}
+
+		fqdns = set()
+		for url in urls:
+			fqdn = self.get_fqdn(url)
+			if fqdn is None: continue
+			try:
+				socket.inet_aton(fqdn)
+			except socket.error:
+				fqdns.add(fqdn)
+		return self.dns_resolver.resolve_many(fqdns, max_workers, deadline)
+	# prefetch_ip_addrs
+
+	def get_netloc_cache_stats(self):
+		"""
+			returns the hit/miss counters for the shared netloc cache along with
+				the hit rate and current size
+		"""
+		stats = dict(shared_netloc_cache_stats)
+		stats['size'] = len(shared_netloc_cache)
+		if stats['hits']+stats['misses'] > 0:
+			stats['hit_rate'] = stats['hits']/(stats['hits']+stats['misses'])
+		else:
+			stats['hit_rate'] = None
+		return stats
+	# get_netloc_cache_stats
+
+	def get_ip_fqdn_domain_pubsuffix_tld(self,url,fqdn_to_ip_addr=None):
+		"""
+			Given a url string, this class will return the ip address, fully-qualified domain name,
+				domain, public suffix, and top-level domain as a tuple.
+
+			Everything but the ip address only depends on the netloc, so the parsed
+				result is cached on the netloc and only the ip is filled in per call.
+
+			fqdn_to_ip_addr is the result of prefetch_ip_addrs, when it is given the
+				ip comes from there and we never do a lookup, that way a host which 
+				missed the deadline isn't waited on again for every request to it
+		"""
+
+		netloc_match = netloc_regex.match(url)
+		if netloc_match is None:
+			return None
+		netloc = netloc_match.group(1)
+
+		# a process may run several pages at once on threads, see AsyncScheduler
+		with shared_netloc_cache_lock:
+			cached = netloc in shared_netloc_cache
+			if cached:
+				shared_netloc_cache_stats['hits'] += 1
+				shared_netloc_cache.move_to_end(netloc)
+				parsed = shared_netloc_cache[netloc]
+
+		if not cached:
+			parsed = self.get_fqdn_domain_pubsuffix_tld(url)
+			with shared_netloc_cache_lock:
+				shared_netloc_cache_stats['misses'] += 1
+				if shared_netloc_cache_size > 0:
+					shared_netloc_cache[netloc] = parsed
+					while len(shared_netloc_cache) > shared_netloc_cache_size:
+						shared_netloc_cache.popitem(last=False)
+
+		if parsed is None:
+			return None
+
+		fqdn, domain, pubsuffix, tld = parsed
+
+		# ip addresses are returned as-is for every field
+		if pubsuffix is None:
+			return (fqdn, fqdn, fqdn, None, None)
+
+		# if the fqdn is not an ip_addr we look it up, repeat lookups
+		#	are served from the resolver cache
+		if self.ip_resolution != 'resolve':
+			ip_addr = None
+		elif fqdn_to_ip_addr is not None:
+			ip_addr = fqdn_to_ip_addr.get(fqdn)
+		else:
+			ip_addr = self.dns_resolver.get_ip_addr(fqdn)
+
+		return (ip_addr, fqdn, domain, pubsuffix, tld)
+	# get_ip_fqdn_domain_pubsuffix_tld
+
+	def get_fqdn_domain_pubsuffix_tld(self,url):
+		"""
+			Does the actual parsing for get_ip_fqdn_domain_pubsuffix_tld without
+				any lookups, returns (fqdn, domain, pubsuffix, tld) or None.
+		"""
+
+		fqdn = self.get_fqdn(url)
+		if fqdn is None:
+			return None
 		
 		# to see if the fqdn is simply an ip_addr try to load it as such
 		# return the IP for all fields even though not strictly 
 		# accurate as to field values
 		try:
 			ip_addr = socket.inet_aton(fqdn)
-			return(fqdn, fqdn, fqdn, None, None)
+			return(fqdn, fqdn, None, None)
 		except socket.error:
 			pass
 
-		# if the fqdn is not an ip_addr we use socket to get the ip_addr
-		try:
-			ip_addr = socket.gethostbyname(fqdn)
-		except:
-			ip_addr = None
-
-		# convert what we have to a tuple and match against our list
+		# convert what we have to a tuple and match against our trie
 		domain_tuple = tuple(fqdn.split('.'))
 		num_tokens = len(domain_tuple)
-		slice_point = 0
+		pubsuffix_length = self.get_pubsuffix_length(domain_tuple)
+
+		# we need at least one token to the left of the pubsuffix for the domain, 
+		#	so if the whole fqdn is a pubsuffix (eg "co.uk") we fall back to the 
+		#	shorter match, same as dropping off the left-most token
+		if pubsuffix_length >= num_tokens:
+			pubsuffix_length = num_tokens-1
 
-		# we keep dropping off the left-most token until we find a match
-		# this way we match on "ac.uk" *before* "uk"
-		while slice_point < num_tokens-1:
-			slice_point += 1
+		if pubsuffix_length > 0:
+			slice_point = num_tokens-pubsuffix_length
 			pubsuffix = domain_tuple[slice_point:]
-			if pubsuffix in self.pubsuffix_list:
-				# we found the pubsuffix, 1 back is the domain
-				domain = domain_tuple[slice_point-1:]
-				# tld is always the final token
-				tld = domain_tuple[num_tokens-1]
-				# found match, return as single strings joined on '.'
-				return (ip_addr, fqdn, '.'.join(domain), '.'.join(pubsuffix), tld)
+			# we found the pubsuffix, 1 back is the domain
+			domain = domain_tuple[slice_point-1:]
+			# tld is always the final token
+			tld = domain_tuple[num_tokens-1]
+			# found match, return as single strings joined on '.'
+			return (fqdn, '.'.join(domain), '.'.join(pubsuffix), tld)
 
 		# if we get to this point nothing else has worked
 		return None
-	# get_domain_pubsuffix_tld
+	# get_fqdn_domain_pubsuffix_tld
 #end ParseURL
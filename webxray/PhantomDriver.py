@@ -105,6 +105,7 @@ class PhantomDriver:
 			'browser_type':			'phantomjs',
 			'browser_version':		self.phantomjs_version,
 			'browser_wait':			browser_wait,
+			'browser_wait_used':	browser_wait,
 			'start_url':			url,
 			'final_url': 			data['final_url'],
 			'title': 				data['title'],
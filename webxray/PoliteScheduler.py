@@ -0,0 +1,136 @@
+# standard python libs
+import threading
+from collections import deque
+from collections import OrderedDict
+
+# custom webxray classes
+from webxray.ParseURL import ParseURL
+
+class PoliteScheduler:
+	"""
+		Decides the order urls are handed to the browsers in, so a page list with many
+			pages on one site doesn't have every browser hitting it at once.
+
+		Urls are grouped by registrable domain (eg 'www.example.com' and 'news.example.com'
+			are both 'example.com') and handed out round-robin across domains, with no
+			more than max_pages_per_domain pages on any one domain and max_in_flight
+			pages in total being loaded at once.  Up to lookahead urls are read ahead
+			from the page list to find other domains to work on, if all of them are on
+			domains which are busy we wait for a page to finish.
+
+		schedule() is a generator which is read by the pool while finished() is called
+			as pages complete, usually on different threads, so all of the state is
+			guarded by a condition.
+	"""
+
+	def __init__(self, max_in_flight, max_pages_per_domain=None, lookahead=1000):
+		self.max_in_flight			= max_in_flight
+		self.max_pages_per_domain	= max_pages_per_domain
+
+		# with no per-domain limit there is no reason to read ahead
+		if max_pages_per_domain is None:
+			self.lookahead = 1
+		else:
+			self.lookahead = lookahead
+
+		# only the domain is needed, so no dns lookups
+		self.url_parser = ParseURL(ip_resolution='skip')
+
+		# domain -> deque of urls waiting, in the order we next visit the domains
+		self.domain_queues		= OrderedDict()
+		self.queued_count		= 0
+
+		# pages being loaded, in total and per domain
+		self.in_flight_count	= 0
+		self.domain_in_flight	= {}
+
+		self.condition = threading.Condition()
+	# __init__
+
+	def get_domain(self, url):
+		"""
+		the registrable domain of the url, urls we can't parse are treated as
+			their own domain
+		"""
+		ip_fqdn_domain_pubsuffix_tld = self.url_parser.get_ip_fqdn_domain_pubsuffix_tld(url)
+		if ip_fqdn_domain_pubsuffix_tld is None: return url
+		return ip_fqdn_domain_pubsuffix_tld[2]
+	# get_domain
+
+	def schedule(self, urls):
+		"""
+		yields the urls in the order they should be loaded, waiting when needed
+		"""
+		urls = iter(urls)
+		urls_finished = False
+
+		while True:
+			# read ahead, this is done outside the lock as reading the list
+			#	may take a moment
+			while not urls_finished and self.queued_count < self.lookahead:
+				try:
+					url = next(urls)
+				except StopIteration:
+					urls_finished = True
+					break
+				domain = self.get_domain(url)
+				with self.condition:
+					if domain not in self.domain_queues:
+						self.domain_queues[domain] = deque()
+					self.domain_queues[domain].append(url)
+					self.queued_count += 1
+
+			with self.condition:
+				url = self.get_next_url()
+
+				# nothing we can start right now, if there is room to read further
+				#	ahead go do that, otherwise wait on a page to finish
+				while url is None:
+					if urls_finished and self.queued_count == 0: return
+					if not urls_finished and self.queued_count < self.lookahead: break
+					self.condition.wait()
+					url = self.get_next_url()
+
+			if url is not None: yield url
+	# schedule
+
+	def get_next_url(self):
+		"""
+		takes the next url from the first domain with room for another page and
+			moves that domain to the back of the line, returns None if there is
+			nothing we may start, must be called holding the condition
+		"""
+		if self.in_flight_count >= self.max_in_flight: return None
+
+		for domain in self.domain_queues:
+			if self.max_pages_per_domain is not None and self.domain_in_flight.get(domain, 0) >= self.max_pages_per_domain:
+				continue
+
+			domain_queue = self.domain_queues[domain]
+			url = domain_queue.popleft()
+			if len(domain_queue) == 0:
+				del self.domain_queues[domain]
+			else:
+				self.domain_queues.move_to_end(domain)
+
+			self.queued_count -= 1
+			self.in_flight_count += 1
+			self.domain_in_flight[domain] = self.domain_in_flight.get(domain, 0)+1
+			return url
+
+		return None
+	# get_next_url
+
+	def finished(self, url):
+		"""
+		call when a page handed out by schedule() is done, frees up its place
+		"""
+		domain = self.get_domain(url)
+		with self.condition:
+			self.in_flight_count -= 1
+			self.domain_in_flight[domain] -= 1
+			if self.domain_in_flight[domain] == 0:
+				del self.domain_in_flight[domain]
+			self.condition.notify_all()
+	# finished
+# PoliteScheduler
@@ -0,0 +1,210 @@
+# standard python libs
+from array import array
+
+class ReportModel:
+	"""
+		Holds the columns of the domain, page, element, and cookie tables which the
+			reports need in memory, so Analyzer reads each table once rather than
+			running a join through the db for every report (and again for every tld).
+
+		Each column is an array with one entry per row.  Strings (domains, tlds, element
+			urls, etc.) are stored once in self.strings and the columns hold their
+			position in it, likewise pages and domains are referred to by their position
+			in the page and domain columns rather than by their id in the db.
+
+		NULL is stored as -1, including for flags such as is_3p, so a NULL flag
+			matches neither 0 nor 1 just as it wouldn't in sql.
+
+		Only third-party cookies are kept, and element urls only for third-party
+			elements, as the reports don't use the rest.
+
+		The per-page summaries (see Analyzer.update_page_summaries) are small so they
+			are always loaded, the element and cookie columns are only read in by
+			load_elements once a report needs them.  Pages after max_page_id, the
+			last one summarized, are left out so everything we hold agrees.
+	"""
+
+	def __init__(self, sql_driver, max_page_id=None):
+		# interned strings, position -> string and string -> position
+		self.strings	= []
+		self.string_ids	= {}
+
+		# domain table
+		self.domain_domain		= array('i')
+		self.domain_tld			= array('i')
+		self.domain_owner_id	= array('q')
+
+		# page table, page_domain is the position of the domain
+		self.page_domain		= array('i')
+		self.page_is_ssl		= array('b')
+		self.page_load_time		= array('q')
+
+		# element table, element_page and element_domain are positions
+		self.element_page		= array('i')
+		self.element_domain		= array('i')
+		self.element_is_3p		= array('b')
+		self.element_received	= array('b')
+		self.element_is_ssl		= array('b')
+		self.element_body_size	= array('q')
+		self.element_type		= array('i')
+		self.element_extension	= array('i')
+		self.element_url		= array('i')
+
+		# third-party cookies
+		self.cookie_page		= array('i')
+		self.cookie_domain		= array('i')
+
+		# page_summary table, one entry per page
+		self.page_3p_domain_count		= array('i')
+		self.page_3p_javascript_count	= array('i')
+		self.page_3p_cookie_count		= array('i')
+
+		# page_element_summary table, element_summary_page is a position
+		self.element_summary_page		= array('i')
+		self.element_summary_is_3p		= array('b')
+		self.element_summary_received	= array('b')
+		self.element_summary_is_ssl		= array('b')
+		self.element_summary_count		= array('q')
+		self.element_summary_body_size	= array('q')
+
+		# page_owner_summary table, owner_summary_page is a position
+		self.owner_summary_page				= array('i')
+		self.owner_summary_domain_owner_id	= array('q')
+
+		# db id -> position, kept for when the elements are loaded
+		self.domain_positions	= {}
+		self.page_positions		= {}
+
+		self.elements_loaded = False
+
+		self.load(sql_driver, max_page_id)
+	# __init__
+
+	def load(self, sql_driver, max_page_id=None):
+		"""
+		reads the domain and page tables and the page summaries out of the db
+		"""
+		for domain_id, domain, tld, domain_owner_id in sql_driver.get_report_domains():
+			self.domain_positions[domain_id] = len(self.domain_domain)
+			self.domain_domain.append(self.get_string_id(domain))
+			self.domain_tld.append(self.get_string_id(tld))
+			self.domain_owner_id.append(self.get_value(domain_owner_id))
+
+		for page_id, domain_id, is_ssl, load_time in sql_driver.get_report_pages(max_page_id):
+			self.page_positions[page_id] = len(self.page_domain)
+			self.page_domain.append(self.domain_positions[domain_id])
+			self.page_is_ssl.append(self.get_value(is_ssl))
+			self.page_load_time.append(self.get_value(load_time))
+
+		# pages come back in order of id, but the summaries may not, so we
+		#	start each page at zero and fill them in
+		zeros = [0]*len(self.page_domain)
+		self.page_3p_domain_count.extend(zeros)
+		self.page_3p_javascript_count.extend(zeros)
+		self.page_3p_cookie_count.extend(zeros)
+		for page_id, domain_3p_count, javascript_3p_count, cookie_3p_count in sql_driver.get_page_summaries():
+			page = self.page_positions.get(page_id)
+			if page is None: continue
+			self.page_3p_domain_count[page]		= domain_3p_count
+			self.page_3p_javascript_count[page]	= javascript_3p_count
+			self.page_3p_cookie_count[page]		= cookie_3p_count
+
+		for page_id, is_3p, received, is_ssl, element_count, body_size in sql_driver.get_page_element_summaries():
+			page = self.page_positions.get(page_id)
+			if page is None: continue
+			self.element_summary_page.append(page)
+			self.element_summary_is_3p.append(self.get_value(is_3p))
+			self.element_summary_received.append(self.get_value(received))
+			self.element_summary_is_ssl.append(self.get_value(is_ssl))
+			self.element_summary_count.append(self.get_value(element_count))
+			self.element_summary_body_size.append(self.get_value(body_size))
+
+		for page_id, domain_owner_id in sql_driver.get_page_owner_summaries():
+			page = self.page_positions.get(page_id)
+			if page is None: continue
+			self.owner_summary_page.append(page)
+			self.owner_summary_domain_owner_id.append(domain_owner_id)
+	# load
+
+	def load_elements(self, sql_driver):
+		"""
+		reads the element and cookie tables, only the first call does anything,
+			elements and cookies of pages we don't have are skipped
+		"""
+		if self.elements_loaded: return
+
+		for page_id, domain_id, is_3p, received, is_ssl, body_size, element_type, extension, element_url in sql_driver.get_report_elements():
+			page = self.page_positions.get(page_id)
+			if page is None: continue
+			self.element_page.append(page)
+			self.element_domain.append(self.domain_positions[domain_id])
+			self.element_is_3p.append(self.get_value(is_3p))
+			self.element_received.append(self.get_value(received))
+			self.element_is_ssl.append(self.get_value(is_ssl))
+			self.element_body_size.append(self.get_value(body_size))
+			self.element_type.append(self.get_string_id(element_type))
+			self.element_extension.append(self.get_string_id(extension))
+			self.element_url.append(self.get_string_id(element_url))
+
+		for page_id, domain_id in sql_driver.get_report_3p_cookies():
+			page = self.page_positions.get(page_id)
+			if page is None: continue
+			self.cookie_page.append(page)
+			self.cookie_domain.append(self.domain_positions[domain_id])
+
+		self.elements_loaded = True
+	# load_elements
+
+	def get_value(self, value):
+		"""
+		numbers and booleans go in the columns as ints, with -1 for NULL
+		"""
+		if value is None: return -1
+		return int(value)
+	# get_value
+
+	def get_string_id(self, string):
+		"""
+		returns the position of the string in self.strings, adding it if it is
+			new, NULL is -1
+		"""
+		if string is None: return -1
+		string_id = self.string_ids.get(string)
+		if string_id is None:
+			string_id = len(self.strings)
+			self.strings.append(string)
+			self.string_ids[string] = string_id
+		return string_id
+	# get_string_id
+
+	def get_string(self, string_id):
+		"""
+		the string stored at string_id, -1 is None
+		"""
+		if string_id == -1: return None
+		return self.strings[string_id]
+	# get_string
+
+	def get_domain_owner_id(self, domain):
+		"""
+		the domain_owner_id of the domain at this position, None if it has no owner
+		"""
+		domain_owner_id = self.domain_owner_id[domain]
+		if domain_owner_id == -1: return None
+		return domain_owner_id
+	# get_domain_owner_id
+
+	def get_page_count(self):
+		"""
+		number of pages in the db
+		"""
+		return len(self.page_domain)
+	# get_page_count
+
+	def get_page_tlds(self):
+		"""
+		returns the tld string id of each page
+		"""
+		return array('i', [self.domain_tld[domain] for domain in self.page_domain])
+	# get_page_tlds
+# ReportModel
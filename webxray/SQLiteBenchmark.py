@@ -0,0 +1,144 @@
+# standard python libs
+import os
+import time
+import shutil
+import tempfile
+
+# custom webxray classes
+from webxray.SQLiteDriver import SQLiteDriver
+
+class SQLiteBenchmark:
+	"""
+		Compares the SQLiteDriver connection profiles on the wbxr_test*.db files
+			which ship with webxray.
+
+		Each db is copied to a temp directory for each profile so the bundled files
+			are never modified, then we time storing a batch of made-up pages (the
+			collector's workload) and running the analyzer's heaviest read queries.
+
+		Run with 'python3 -m webxray.SQLiteBenchmark' from the root webxray directory.
+	"""
+
+	def __init__(self, num_pages=200, num_elements=20, num_read_rounds=50):
+		self.num_pages			= num_pages
+		self.num_elements		= num_elements
+		self.num_read_rounds	= num_read_rounds
+
+		# None is the sqlite defaults, which is what we used before profiles
+		self.profiles = [None, 'ingest', 'analysis']
+
+		self.test_db_path = os.path.dirname(os.path.abspath(__file__))+'/resources/db/sqlite/'
+	# __init__
+
+	def get_test_db_names(self):
+		"""
+		returns the names of the bundled test dbs, without prefix
+		"""
+		test_db_names = []
+		for db_name in SQLiteDriver(profile=None).get_wbxr_dbs_list():
+			if db_name[:4] == 'test': test_db_names.append(db_name)
+		test_db_names.sort()
+		return test_db_names
+	# get_test_db_names
+
+	def get_driver(self, temp_dir, db_name, profile):
+		"""
+		returns a driver connected to a fresh copy of the test db, migrated to
+			the current schema, the migrate file is read from db_root_path so 
+			it gets copied as well
+
+		dbs made by create_wbxr_db are in WAL mode, so when testing a profile 
+			the copy is switched to WAL to match
+		"""
+		shutil.copy(self.test_db_path+'wbxr_'+db_name+'.db', temp_dir+'/wbxr_'+db_name+'.db')
+		shutil.copy(self.test_db_path+'sqlite_db_migrate.schema', temp_dir+'/sqlite_db_migrate.schema')
+		sql_driver = SQLiteDriver(profile=profile)
+		sql_driver.db_root_path = temp_dir+'/'
+		sql_driver.db_switch(db_name)
+		if profile is not None:
+			sql_driver.fetch_query('PRAGMA journal_mode = WAL')
+			sql_driver.apply_profile()
+		sql_driver.migrate_db()
+		return sql_driver
+	# get_driver
+
+	def time_ingest(self, sql_driver):
+		"""
+		stores pages the same way OutputStore does, one transaction per page
+		"""
+		start_time = time.time()
+		for page_num in range(self.num_pages):
+			sql_driver.start_transaction()
+			page_domain_id = sql_driver.add_domain(None, 'bench%s.example.com' % page_num, 'example.com', 'com', 'com')
+			page_id = sql_driver.add_page(
+				'chrome', 'benchmark', 0, 0,
+				'title', 'meta_desc',
+				'https://bench%s.example.com/' % page_num, 'https://bench%s.example.com/' % page_num,
+				None, None,
+				True, None,
+				0, page_domain_id
+			)
+			elements = []
+			for element_num in range(self.num_elements):
+				element_domain_id = sql_driver.add_domain(None, 'tracker%s.example.net' % element_num, 'example.net', 'net', 'net')
+				elements.append((
+					page_id,
+					'https://tracker%s.example.net/%s.js' % (element_num, page_num), 'https://tracker%s.example.net/%s.js' % (element_num, page_num),
+					True, True,
+					True,
+					None, None,
+					None, None,
+					200, 'OK',
+					'application/javascript', 1000,
+					None, None,
+					None, 'js',
+					'javascript', None,
+					element_domain_id
+				))
+			sql_driver.add_elements(elements)
+			sql_driver.commit()
+		return time.time()-start_time
+	# time_ingest
+
+	def time_analysis(self, sql_driver):
+		"""
+		runs the queries which the analyzer leans on most
+		"""
+		start_time = time.time()
+		for read_round in range(self.num_read_rounds):
+			sql_driver.get_pages_ok_count()
+			sql_driver.get_all_tlds()
+			sql_driver.get_page_domain_element_domain_pairs()
+			sql_driver.get_page_id_3p_element_domain_pairs()
+			sql_driver.get_page_id_3p_cookie_id_3p_cookie_domain()
+			sql_driver.get_element_sizes()
+			sql_driver.get_3p_network_ties()
+		return time.time()-start_time
+	# time_analysis
+
+	def run(self):
+		"""
+		prints a table of timings for each db and profile
+		"""
+		print('\t%-10s %-10s %10s %10s' % ('db', 'profile', 'ingest', 'analysis'))
+
+		temp_dir = tempfile.mkdtemp()
+		try:
+			for db_name in self.get_test_db_names():
+				for profile in self.profiles:
+					sql_driver = self.get_driver(temp_dir, db_name, profile)
+					ingest_time = self.time_ingest(sql_driver)
+					analysis_time = self.time_analysis(sql_driver)
+					sql_driver.close()
+					print('\t%-10s %-10s %9.3fs %9.3fs' % (db_name, profile, ingest_time, analysis_time))
+
+					# start from a clean copy for the next profile
+					for file_name in os.listdir(temp_dir):
+						os.remove(temp_dir+'/'+file_name)
+		finally:
+			shutil.rmtree(temp_dir)
+	# run
+# SQLiteBenchmark
+
+if __name__ == '__main__':
+	SQLiteBenchmark().run()
@@ -0,0 +1,176 @@
+# standard python libs
+import os
+import time
+import uuid
+import socket
+import threading
+
+class WorkQueue:
+	"""
+		Shares one page list out between collectors on any number of nodes.
+
+		The urls are put in the work_queue table of the db the pages are stored in by
+			whoever coordinates the collection ('run_webxray.py -e'), then each node
+			('run_webxray.py -w') leases a few at a time as its browsers free up.  A
+			lease is good for lease_seconds and is renewed on a background thread while
+			we still have the page, so:
+
+			-a fast node comes back for more sooner, a slow one holds fewer pages
+			-if a node dies its leases stop being renewed and run out, after which
+				any other node may lease those pages again
+			-if a node is stuck on a page we stop renewing it after max_hold_seconds
+				so it goes to another node
+
+		Pages may therefore be loaded more than once if a node is very slow, but are
+			never lost.  A page which wasn't stored goes back on the queue for any
+			node to try again, each lease is one attempt and once a page has had
+			max_attempts it is marked 'failed' and left out of the collection.
+
+		Each call uses its own db connection, the same as Collector.process_url does,
+			so the queue may be used from the pool's threads without locking.  With
+			sqlite the nodes are processes sharing the db file, mysql and postgres
+			leases use the time on the server so the nodes' clocks don't matter.
+	"""
+
+	def __init__(self, db_engine, db_name, lease_seconds=300, lease_batch_size=4, poll_seconds=10, max_hold_seconds=3600, max_attempts=3):
+		self.db_engine			= db_engine
+		self.db_name			= db_name
+		self.max_attempts		= max_attempts
+		self.lease_seconds		= lease_seconds
+		self.lease_batch_size	= lease_batch_size
+		self.poll_seconds		= poll_seconds
+		self.max_hold_seconds	= max_hold_seconds
+
+		# unique to this process so two collectors on one host never share leases
+		self.lease_owner = '%s-%s-%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+		# urls we have leased and not yet finished along with when we leased
+		#	them, kept alive by renew_leases
+		self.leased_urls		= {}
+		self.leased_urls_lock	= threading.Lock()
+
+		self.renew_thread	= None
+		self.stop_event		= threading.Event()
+	# __init__
+
+	def get_sql_driver(self):
+		"""
+		returns a new connection to the db for the engine in use
+		"""
+		if self.db_engine == 'mysql':
+			from webxray.MySQLDriver import MySQLDriver
+			return MySQLDriver(self.db_name)
+		elif self.db_engine == 'postgres':
+			from webxray.PostgreSQLDriver import PostgreSQLDriver
+			return PostgreSQLDriver(self.db_name)
+		elif self.db_engine == 'sqlite':
+			from webxray.SQLiteDriver import SQLiteDriver
+			return SQLiteDriver(self.db_name)
+	# get_sql_driver
+
+	def enqueue(self, urls, batch_size=1000):
+		"""
+		adds urls to the queue, a url which has been queued before is ignored
+			so the same list may be added more than once, returns how many urls
+			we were given
+		"""
+		sql_driver	= self.get_sql_driver()
+		url_count	= 0
+		batch		= []
+		for url in urls:
+			batch.append(url)
+			if len(batch) == batch_size:
+				sql_driver.add_work_queue_urls(batch)
+				url_count += len(batch)
+				batch = []
+		if len(batch) > 0:
+			sql_driver.add_work_queue_urls(batch)
+			url_count += len(batch)
+		sql_driver.close()
+		return url_count
+	# enqueue
+
+	def get_leased_urls(self):
+		"""
+		yields urls as we lease them, lease_batch_size at a time and only as
+			they are read, ends once there is nothing we can lease right now
+
+		pages other nodes are still working on may come back if their leases
+			run out, see get_counts
+		"""
+		self.start_renewing()
+		while True:
+			sql_driver = self.get_sql_driver()
+			urls = sql_driver.lease_work_queue_urls(self.lease_owner, self.lease_batch_size, self.lease_seconds, self.max_attempts)
+			sql_driver.close()
+			if len(urls) == 0: return
+
+			with self.leased_urls_lock:
+				for url in urls:
+					self.leased_urls[url] = time.time()
+			for url in urls:
+				yield url
+	# get_leased_urls
+
+	def finish(self, url, page_stored=True):
+		"""
+		call once a leased url has been through process_url, if the page was 
+			stored it will not be handed out again, otherwise it goes back on 
+			the queue unless it is out of attempts
+		"""
+		with self.leased_urls_lock:
+			self.leased_urls.pop(url, None)
+		sql_driver = self.get_sql_driver()
+		sql_driver.finish_work_queue_url(self.lease_owner, url, page_stored, self.max_attempts)
+		sql_driver.close()
+	# finish
+
+	def get_counts(self):
+		"""
+		how many urls are 'queued', 'leased', 'done', and 'failed', leases which 
+			have run out count as queued, or failed if out of attempts
+		"""
+		sql_driver = self.get_sql_driver()
+		counts = sql_driver.get_work_queue_counts(self.max_attempts)
+		sql_driver.close()
+		return counts
+	# get_counts
+
+	def start_renewing(self):
+		"""
+		starts the thread which keeps our leases alive, if it isn't running
+		"""
+		if self.renew_thread is not None: return
+		self.stop_event.clear()
+		self.renew_thread = threading.Thread(target=self.renew_leases, daemon=True)
+		self.renew_thread.start()
+	# start_renewing
+
+	def renew_leases(self):
+		"""
+		background thread, renews every lease we hold a few times per lease_seconds,
+			if this fails for a while the leases run out and other nodes take over
+		"""
+		while not self.stop_event.wait(self.lease_seconds/3):
+			hold_cutoff = time.time()-self.max_hold_seconds
+			with self.leased_urls_lock:
+				urls = [url for url, leased_time in self.leased_urls.items() if leased_time > hold_cutoff]
+			if len(urls) == 0: continue
+			try:
+				sql_driver = self.get_sql_driver()
+				sql_driver.renew_work_queue_leases(self.lease_owner, urls, self.lease_seconds)
+				sql_driver.close()
+			except Exception as e:
+				print('\tWARNING: unable to renew work queue leases: %s' % e)
+	# renew_leases
+
+	def stop(self):
+		"""
+		stops renewing leases, anything we haven't finished will run out
+		"""
+		self.stop_event.set()
+		if self.renew_thread is not None:
+			self.renew_thread.join()
+			self.renew_thread = None
+	# stop
+# WorkQueue
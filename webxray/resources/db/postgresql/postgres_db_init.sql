@@ -9,6 +9,12 @@ DROP TABLE IF EXISTS element;
 DROP TABLE IF EXISTS page;
 DROP TABLE IF EXISTS domain;
 DROP TABLE IF EXISTS domain_owner;
+DROP TABLE IF EXISTS meta;
+DROP TABLE IF EXISTS work_queue;
+DROP TABLE IF EXISTS domain_owner_closure;
+DROP TABLE IF EXISTS page_summary;
+DROP TABLE IF EXISTS page_element_summary;
+DROP TABLE IF EXISTS page_owner_summary;
 ---------------------
 --- DOMAIN OWNER  ---
 ---------------------
@@ -48,6 +54,7 @@ CREATE TABLE IF NOT EXISTS domain(id BIGSERIAL PRIMARY KEY,ip_addr TEXT,fqdn_md5
 --	browser_type VARCHAR(255),
 --	browser_version VARCHAR(255),
 --  browser_wait INTEGER,
+--  browser_wait_used REAL,
 -- 	title TEXT,
 -- 	meta_desc TEXT,
 -- 	start_url_md5 VARCHAR(32),
@@ -64,7 +71,7 @@ CREATE TABLE IF NOT EXISTS domain(id BIGSERIAL PRIMARY KEY,ip_addr TEXT,fqdn_md5
 -- 	accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
 -- 	UNIQUE (accessed, start_url_md5)
 -- );
-CREATE TABLE IF NOT EXISTS page(id BIGSERIAL PRIMARY KEY,browser_type VARCHAR(255),browser_version VARCHAR(255),browser_wait INTEGER,title TEXT,meta_desc TEXT,start_url_md5 VARCHAR(32),start_url TEXT,final_url_md5 VARCHAR(32),final_url TEXT,priv_policy_url_md5 VARCHAR(32),priv_policy_url TEXT,priv_policy_url_text TEXT,is_ssl BOOLEAN,source TEXT,load_time INTEGER,domain_id INTEGER REFERENCES domain(id),accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,UNIQUE (accessed, start_url_md5));
+CREATE TABLE IF NOT EXISTS page(id BIGSERIAL PRIMARY KEY,browser_type VARCHAR(255),browser_version VARCHAR(255),browser_wait INTEGER,browser_wait_used REAL,title TEXT,meta_desc TEXT,start_url_md5 VARCHAR(32),start_url TEXT,final_url_md5 VARCHAR(32),final_url TEXT,priv_policy_url_md5 VARCHAR(32),priv_policy_url TEXT,priv_policy_url_text TEXT,is_ssl BOOLEAN,source TEXT,load_time INTEGER,domain_id INTEGER REFERENCES domain(id),accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,UNIQUE (accessed, start_url_md5));
 ---------------
 --- ELEMENT ---
 ---------------
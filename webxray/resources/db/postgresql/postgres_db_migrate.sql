@@ -0,0 +1,98 @@
+-- this file is read line-by-line by python to bring a database up to the
+-- current schema, it is run when a db is created and by 'run_webxray.py -m'
+-- on existing dbs, so every statement must be safe to run more than once
+--
+-- when adding to this file bump schema_version in PostgreSQLDriver.py
+--
+------------
+--- META ---
+------------
+-- CREATE TABLE IF NOT EXISTS meta(
+-- 	name TEXT PRIMARY KEY,
+-- 	value TEXT
+-- );
+CREATE TABLE IF NOT EXISTS meta(name TEXT PRIMARY KEY,value TEXT);
+---------------
+--- INDEXES ---
+---------------
+-- schema_version 1: indexes for page_exists, the domain owner updates, and
+-- the joins used by the analyzer
+CREATE INDEX IF NOT EXISTS page_start_url_md5_idx ON page(start_url_md5);
+CREATE INDEX IF NOT EXISTS page_domain_id_idx ON page(domain_id);
+CREATE INDEX IF NOT EXISTS element_page_id_idx ON element(page_id);
+CREATE INDEX IF NOT EXISTS element_domain_id_idx ON element(domain_id);
+CREATE INDEX IF NOT EXISTS cookie_page_id_idx ON cookie(page_id);
+CREATE INDEX IF NOT EXISTS cookie_domain_id_idx ON cookie(domain_id);
+CREATE INDEX IF NOT EXISTS domain_domain_md5_idx ON domain(domain_md5);
+CREATE INDEX IF NOT EXISTS domain_tld_idx ON domain(tld);
+CREATE INDEX IF NOT EXISTS domain_domain_owner_id_idx ON domain(domain_owner_id);
+---------------
+--- COLUMNS ---
+---------------
+-- schema_version 2: how many seconds we actually waited on the page, this is
+-- less than browser_wait when the network went quiet early
+ALTER TABLE page ADD COLUMN IF NOT EXISTS browser_wait_used REAL;
+------------------
+--- WORK QUEUE ---
+------------------
+-- schema_version 3: urls shared out to collectors on any number of nodes,
+-- see WorkQueue.py, lease_expires is seconds since the epoch
+-- CREATE TABLE IF NOT EXISTS work_queue(
+-- 	id BIGSERIAL PRIMARY KEY,
+-- 	url_md5 TEXT UNIQUE,
+-- 	url TEXT,
+-- 	state TEXT,
+-- 	lease_owner TEXT,
+-- 	lease_expires DOUBLE PRECISION,
+-- 	attempts INTEGER DEFAULT 0
+-- );
+CREATE TABLE IF NOT EXISTS work_queue(id BIGSERIAL PRIMARY KEY,url_md5 TEXT UNIQUE,url TEXT,state TEXT,lease_owner TEXT,lease_expires DOUBLE PRECISION,attempts INTEGER DEFAULT 0);
+CREATE INDEX IF NOT EXISTS work_queue_state_lease_expires_idx ON work_queue(state, lease_expires);
+----------------------------
+--- DOMAIN OWNER CLOSURE ---
+----------------------------
+-- schema_version 4: each domain owner paired with itself (depth 0) and each of
+-- its parents, written by Analyzer when the domain owners are patched, so sql may
+-- roll up to parent owners with a join, eg bytes received by each owner and
+-- its subsidiaries:
+-- 	SELECT domain_owner_closure.ancestor_id, SUM(element.body_size) FROM element
+-- 	JOIN domain ON element.domain_id = domain.id
+-- 	JOIN domain_owner_closure ON domain.domain_owner_id = domain_owner_closure.descendant_id
+-- 	GROUP BY domain_owner_closure.ancestor_id
+-- CREATE TABLE IF NOT EXISTS domain_owner_closure(
+-- 	ancestor_id INTEGER NOT NULL,
+-- 	descendant_id INTEGER NOT NULL,
+-- 	depth INTEGER NOT NULL,
+-- 	PRIMARY KEY (ancestor_id, descendant_id)
+-- );
+CREATE TABLE IF NOT EXISTS domain_owner_closure(ancestor_id INTEGER NOT NULL,descendant_id INTEGER NOT NULL,depth INTEGER NOT NULL,PRIMARY KEY (ancestor_id, descendant_id));
+CREATE INDEX IF NOT EXISTS domain_owner_closure_descendant_id_idx ON domain_owner_closure(descendant_id);
+----------------------
+--- PAGE SUMMARIES ---
+----------------------
+-- schema_version 5: per-page totals kept by Analyzer so reports don't have to
+-- go back over every element, pages are summarized once, any page without a
+-- page_summary row is picked up on the next run
+-- CREATE TABLE IF NOT EXISTS page_summary(
+-- 	page_id INTEGER NOT NULL PRIMARY KEY,
+-- 	domain_3p_count INTEGER,
+-- 	javascript_3p_count INTEGER,
+-- 	cookie_3p_count INTEGER
+-- );
+-- CREATE TABLE IF NOT EXISTS page_element_summary(
+-- 	page_id INTEGER NOT NULL,
+-- 	is_3p BOOLEAN,
+-- 	received BOOLEAN,
+-- 	is_ssl BOOLEAN,
+-- 	element_count INTEGER,
+-- 	body_size BIGINT
+-- );
+-- CREATE TABLE IF NOT EXISTS page_owner_summary(
+-- 	page_id INTEGER NOT NULL,
+-- 	domain_owner_id INTEGER NOT NULL,
+-- 	PRIMARY KEY (page_id, domain_owner_id)
+-- );
+CREATE TABLE IF NOT EXISTS page_summary(page_id INTEGER NOT NULL PRIMARY KEY,domain_3p_count INTEGER,javascript_3p_count INTEGER,cookie_3p_count INTEGER);
+CREATE TABLE IF NOT EXISTS page_element_summary(page_id INTEGER NOT NULL,is_3p BOOLEAN,received BOOLEAN,is_ssl BOOLEAN,element_count INTEGER,body_size BIGINT);
+CREATE INDEX IF NOT EXISTS page_element_summary_page_id_idx ON page_element_summary(page_id);
+CREATE TABLE IF NOT EXISTS page_owner_summary(page_id INTEGER NOT NULL,domain_owner_id INTEGER NOT NULL,PRIMARY KEY (page_id, domain_owner_id));